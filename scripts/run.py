@@ -8,15 +8,25 @@ Winter 2020
 """
 import os
 import csv
+import json
+import pickle
+import hashlib
 import configparser
 import pandas as pd
 import geopandas
-from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 from options import OPTIONS, COUNTRY_PARAMETERS
-from podis.demand import estimate_demand
-from podis.supply import estimate_supply
-from podis.assess import assess
+from podis.demand import (estimate_demand, estimate_demand_by_timestep,
+    get_demand_tables)
+from podis.supply import (size_network, price_network, solve_site_densities,
+    estimate_supply_rollout, CapacityCurves)
+from podis.assess import assess, assess_regions, allocate_subsidies
+from podis.costs import CostComponentCache, COST_CATEGORIES, GEOTYPES
+from podis.capacity import (compile_capacity_lookup, load_capacity_lookup,
+    capacity_lookup_is_stale)
+from podis.strategy import parse_scenario, parse_strategy
+from podis.results import allocate_deciles, ResultsSink
 
 CONFIG = configparser.ConfigParser()
 CONFIG.read(os.path.join(os.path.dirname(__file__), 'script_config.ini'))
@@ -185,17 +195,18 @@ def load_cluster(path, iso3):
     return output
 
 
-def load_penetration(scenario, path):
+def load_penetration_forecast(path):
     """
-    Load penetration forecast.
+    Load the penetration forecast for all scenarios, keyed by scenario
+    label and then year.
 
     """
     output = {}
     with open(path, 'r') as source:
         reader = csv.DictReader(source)
         for row in reader:
-            if row['scenario'] == scenario.split('_')[0]:
-                output[int(row['year'])] = float(row['penetration'])
+            output.setdefault(row['scenario'], {})[int(row['year'])] = float(
+                row['penetration'])
 
     return output
 
@@ -292,140 +303,558 @@ def load_core_lut(path):
     return output
 
 
-def define_deciles(regions):
+SIZING_COLUMNS = [
+    'site_density',
+    'existing_network_sites',
+    'new_sites',
+    'upgraded_sites',
+    'backhaul_new',
+]
 
-    regions = regions.sort_values(by='population_km2', ascending=True)
+COST_COLUMNS = list(COST_CATEGORIES.keys()) + ['network_cost']
 
-    regions['decile'] = regions.groupby([
-        'GID_0', 'scenario', 'strategy', 'confidence'], as_index=True).population_km2.apply( #cost_per_sp_user
-            pd.qcut, q=11, precision=0,
-            labels=[100,90,80,70,60,50,40,30,20,10,0], duplicates='drop') #   [0,10,20,30,40,50,60,70,80,90,100]
+
+def get_fingerprint(*inputs):
+    """
+    Hash a set of json-serialisable model inputs, so a change to any of
+    them can be detected between runs.
+
+    """
+    content = json.dumps(inputs, sort_keys=True, default=str)
+
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+
+def get_file_fingerprint(path):
+    """
+    Identify an input file by its path, size and modification time.
+
+    """
+    stat = os.stat(path)
+
+    return [path, stat.st_size, stat.st_mtime]
+
+
+def get_supply_keys(iso3, option, ci, timesteps, global_parameters,
+    country_parameters, costs, penetration_lut, smartphone_lut,
+    regions_fingerprint, lookup_fingerprint, core_lut_fingerprint):
+    """
+    Return the fingerprints of the inputs to size_network (via
+    estimate_demand), and of those plus the additional inputs to
+    price_network, which decide whether persisted supply state is reused.
+
+    """
+    sizing_key = get_fingerprint(
+        iso3,
+        option['scenario'],
+        option['strategy'],
+        ci,
+        timesteps,
+        global_parameters['overbooking_factor'],
+        country_parameters['networks'],
+        country_parameters['frequencies'],
+        penetration_lut,
+        smartphone_lut,
+        regions_fingerprint,
+        lookup_fingerprint,
+    )
+
+    cost_key = get_fingerprint(
+        sizing_key,
+        costs,
+        global_parameters['return_period'],
+        global_parameters['discount_rate'],
+        global_parameters['opex_percentage_of_capex'],
+        global_parameters['sectorization'],
+        global_parameters['regional_integration_factor'],
+        country_parameters['financials']['wacc'],
+        core_lut_fingerprint,
+    )
+
+    return sizing_key, cost_key
+
+
+def load_supply_state(path):
+    """
+    Load the persisted supply outputs for a scenario, strategy and
+    confidence interval, or an empty state if there are none.
+
+    """
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, 'rb') as source:
+        return pickle.load(source)
+
+
+def write_supply_state(state, path):
+    """
+    Persist the supply outputs for a scenario, strategy and confidence
+    interval.
+
+    """
+    folder = os.path.dirname(path)
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with open(path, 'wb') as sink:
+        pickle.dump(state, sink, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def extract_columns(regions, columns):
+    """
+    Take the given columns from each region, keyed by GID_id.
+
+    """
+    return {
+        region['GID_id']: {k: region[k] for k in columns if k in region}
+        for region in regions
+    }
+
+
+def select_columns(regions, stored):
+    """
+    Take the stored columns of each region, keyed by GID_id. Returns None
+    if any region has no stored outputs.
+
+    """
+    for region in regions:
+        if region['GID_id'] not in stored:
+            return None
+
+    return {region['GID_id']: stored[region['GID_id']] for region in regions}
+
+
+def find_supply_state(regions, state, sizing_key, cost_key):
+    """
+    Return the persisted sizing and costs of the regions, each None if the
+    inputs to its stage have changed since it was persisted or it covers
+    other regions, and report which stages will be run.
+
+    """
+    sizing = None
+    priced = None
+
+    if (state.get('sizing_key') == sizing_key and
+        len(state['sizing']) == len(regions)):
+        sizing = select_columns(regions, state['sizing'])
+
+    if sizing is not None and state.get('cost_key') == cost_key:
+        priced = select_columns(regions, state['costs'])
+
+    print('Sizing network' if sizing is None else 'Reusing sized network')
+    print('Pricing network' if priced is None else 'Reusing network costs')
+
+    return sizing, priced
+
+
+def write_supply_outputs(regions, sizing_key, cost_key, path):
+    """
+    Persist the sizing and costs of the regions with the keys of the inputs
+    they were found from. The state is keyed by GID_id, so it does not
+    depend on how the regions were split between processes.
+
+    """
+    write_supply_state({
+        'sizing_key': sizing_key,
+        'sizing': extract_columns(regions, SIZING_COLUMNS),
+        'cost_key': cost_key,
+        'costs': extract_columns(regions, COST_COLUMNS),
+    }, path)
+
+
+def estimate_supply_stages(regions, lookup, option, global_parameters,
+    country_parameters, costs, core_lut, ci, cache, curves, sizing, priced,
+    site_densities=None):
+    """
+    Size and price the network, restoring the given persisted sizing and
+    costs of the regions in place of running size_network and
+    price_network.
+
+    """
+    if sizing is None:
+        regions = size_network(regions, lookup, option,
+            country_parameters, ci, curves, site_densities)
+    else:
+        for region in regions:
+            region.update(sizing[region['GID_id']])
+            region['scenario'] = option['scenario']
+            region['strategy'] = option['strategy']
+            region['confidence'] = ci
+
+    if priced is None:
+        regions = price_network(regions, option, global_parameters,
+            country_parameters, costs, core_lut, cache)
+    else:
+        for region in regions:
+            region.update(priced[region['GID_id']])
 
     return regions
 
 
-def write_results(regional_results, folder, metric):
-    """
-    Write all results.
-    """
-    print('Writing national results')
-    national_results = pd.DataFrame(regional_results)
-    national_results = national_results[[
-        'GID_0', 'scenario', 'strategy', 'integration', 'confidence', 'population',
-        'area_km2', 'population_km2', 'phones_on_network', 'smartphones_on_network',
-        'sites_estimated_total', 'existing_network_sites', 'upgraded_sites', 'new_sites',
-        'total_revenue', 'total_cost', 'cost_per_sp_user',
-    ]]
-
-    national_results = national_results.groupby([
-        'GID_0', 'scenario', 'strategy', 'integration','confidence'], as_index=True).sum()
-    national_results['cost_per_network_user'] = (
-        national_results['total_cost'] / national_results['phones_on_network'])
-
-    path = os.path.join(folder,'national_results_{}.csv'.format(metric))
-    national_results.to_csv(path, index=True)
-
-    print('Writing national cost composition results')
-    national_cost_results = pd.DataFrame(regional_results)
-    national_cost_results = national_cost_results[[
-        'GID_0', 'scenario', 'strategy', 'integration','confidence', 'population',
-        'population_km2', 'phones_on_network', 'cost_per_sp_user',
-        'total_revenue', 'ran', 'backhaul_fronthaul', 'civils', 'core_network',
-        'admin_and_ops', 'acquisition_per_subscriber',
-        'spectrum_cost', 'tax', 'profit_margin', 'total_cost',
-        'available_cross_subsidy', 'deficit', 'used_cross_subsidy',
-        'required_state_subsidy',
-    ]]
-
-    national_cost_results = national_cost_results.groupby([
-        'GID_0', 'scenario', 'strategy', 'integration','confidence'], as_index=True).sum()
-    national_cost_results['cost_per_network_user'] = (
-        national_cost_results['total_cost'] / national_cost_results['phones_on_network'])
-
-    path = os.path.join(folder,'national_cost_results_{}.csv'.format(metric))
-    national_cost_results.to_csv(path, index=True)
-
-    print('Writing general decile results')
-    decile_results = pd.DataFrame(regional_results)
-    decile_results = define_deciles(decile_results)
-    decile_results = decile_results[[
-        'GID_0', 'scenario', 'strategy', 'integration','decile', 'confidence',
-        'population', 'area_km2', #'population_km2',
-        'phones_on_network', #'phone_density_on_network_km2',
-        'smartphones_on_network', #'sp_density_on_network_km2',
-        'sites_estimated_total', 'existing_network_sites', 'upgraded_sites', 'new_sites',
-        'total_revenue', 'total_cost', #'cost_per_sp_user',
-    ]]
-    decile_results = decile_results.groupby([
-        'GID_0', 'scenario', 'strategy', 'integration', 'confidence', 'decile'], as_index=True).sum()
-
-    decile_results['population_km2'] = (
-        decile_results['population'] / decile_results['area_km2'])
-    decile_results['phone_density_on_network_km2'] = (
-        decile_results['phones_on_network'] / decile_results['area_km2'])
-    decile_results['sp_density_on_network_km2'] = (
-        decile_results['smartphones_on_network'] / decile_results['area_km2'])
-    decile_results['sites_estimated_total_km2'] = (
-        decile_results['sites_estimated_total'] / decile_results['area_km2'])
-    decile_results['existing_network_sites_km2'] = (
-        decile_results['existing_network_sites'] / decile_results['area_km2'])
-    decile_results['cost_per_network_user'] = (
-        decile_results['total_cost'] / decile_results['phones_on_network'])
-    decile_results['cost_per_sp_user'] = (
-        decile_results['total_cost'] / decile_results['smartphones_on_network'])
-
-    path = os.path.join(folder,'decile_results_{}.csv'.format(metric))
-    decile_results.to_csv(path, index=True)
-
-    print('Writing cost decile results')
-    decile_cost_results = pd.DataFrame(regional_results)
-    decile_cost_results = define_deciles(decile_cost_results)
-    decile_cost_results = decile_cost_results[[
-        'GID_0', 'scenario', 'strategy', 'integration', 'decile', 'confidence',
-        'population', 'area_km2', #'population_km2',
-        'phones_on_network', #'cost_per_sp_user',
-        'total_revenue', 'ran', 'backhaul_fronthaul', 'civils', 'core_network',
-        'admin_and_ops', 'acquisition_per_subscriber', 'spectrum_cost', 'tax', 'profit_margin', 'total_cost',
-        'available_cross_subsidy', 'deficit', 'used_cross_subsidy',
-        'required_state_subsidy',
-    ]]
-
-    decile_cost_results = decile_cost_results.groupby([
-        'GID_0', 'scenario', 'strategy', 'integration', 'confidence', 'decile'], as_index=True).sum()
-    decile_cost_results['cost_per_network_user'] = (
-        decile_cost_results['total_cost'] / decile_cost_results['phones_on_network'])
-
-    path = os.path.join(folder,'decile_cost_results_{}.csv'.format(metric))
-    decile_cost_results.to_csv(path, index=True)
-
-    print('Writing regional results')
-    regional_results = pd.DataFrame(regional_results)
-    # regional_results = define_deciles(regional_results)
-    regional_results = regional_results[[
-        'GID_0', 'GID_id', 'scenario', 'strategy', 'integration', 'geotype', #'decile',
-        'confidence', 'population', 'area_km2', #'population_km2',
-        'phones_on_network', 'cost_per_sp_user',
-        'upgraded_sites','new_sites', 'total_revenue', 'total_cost',
-    ]]
-    regional_results['cost_per_network_user'] = (
-        regional_results['total_cost'] / regional_results['phones_on_network'])
-
-    path = os.path.join(folder,'regional_results_{}.csv'.format(metric))
-    regional_results.to_csv(path, index=True)
-
-
-def allocate_deciles(data):
-    """
-    Convert to pandas df, define deciles, and then return as a list of dicts.
-
-    """
-    data = pd.DataFrame(data)
-
-    data = define_deciles(data)
-
-    data = data.to_dict('records')
-
-    return data
+def estimate_supply_incremental(regions, lookup, option, global_parameters,
+    country_parameters, costs, core_lut, ci, cache, curves, sizing_key,
+    cost_key, path, site_densities=None):
+    """
+    Size and price the network, reusing persisted outputs where the
+    inputs to a stage have not changed since the last run.
+
+    The network sizing (site density, upgrades, new sites and backhaul)
+    only depends on the sizing inputs, so if only the costs, discount rate,
+    WACC or other financial parameters change, the sized network is
+    re-priced without running size_network. If the cost inputs are also
+    unchanged the network costs are reused, and only assess is re-run.
+    Site densities already found with solve_site_densities can be given.
+
+    """
+    sizing, priced = find_supply_state(regions, load_supply_state(path),
+        sizing_key, cost_key)
+
+    data_supply = estimate_supply_stages(regions, lookup, option,
+        global_parameters, country_parameters, costs, core_lut, ci, cache,
+        curves, sizing, priced, site_densities)
+
+    if priced is None:
+        write_supply_outputs(data_supply, sizing_key, cost_key, path)
+
+    return data_supply
+
+
+class CountryInputs(object):
+    """
+    The inputs for a country which are the same for every option: the
+    clustering results, smartphone adoption, core network lookup, regions
+    and penetration forecasts. Each file is read and parsed once.
+
+    Regions, penetration forecasts, smartphone adoption and the core lookup
+    are handed out as copies, so one stage cannot change the inputs seen by
+    another.
+
+    """
+    def __init__(self, country):
+
+        iso3 = country['iso3']
+
+        self.iso3 = iso3
+
+        folder = os.path.join(BASE_PATH, '..', 'vis', 'clustering', 'results')
+        filename = 'data_clustering_results.csv'
+        self.cluster = load_cluster(os.path.join(folder, filename), iso3)
+
+        country = dict(country, cluster=self.cluster)
+
+        folder = os.path.join(DATA_RAW, 'wb_smartphone_survey')
+        filename = 'wb_smartphone_survey.csv'
+        self.smartphone_lut = load_smartphones(country,
+            os.path.join(folder, filename))
+
+        path = os.path.join(DATA_INTERMEDIATE, iso3, 'core_lut.csv')
+        self.core_lut = load_core_lut(path)
+        self.core_lut_fingerprint = get_file_fingerprint(path)
+
+        path = os.path.join(DATA_INTERMEDIATE, iso3, 'regional_data.csv')
+        self.regions = load_regions(iso3, path).to_dict('records')
+        self.regions_fingerprint = get_file_fingerprint(path)
+
+        path = os.path.join(DATA_INTERMEDIATE, iso3, 'subscriptions',
+            'subs_forecast.csv')
+        self.penetration = load_penetration_forecast(path)
+
+    def get_regions(self):
+        """
+        Return a copy of every region.
+
+        """
+        return [dict(region) for region in self.regions]
+
+    def get_penetration(self, scenario):
+        """
+        Return a copy of the penetration forecast for a scenario.
+
+        """
+        return dict(self.penetration.get(parse_scenario(scenario).label, {}))
+
+    def get_smartphone_lut(self):
+        """
+        Return a copy of the smartphone adoption lookup.
+
+        """
+        return {iso3: dict(values)
+            for iso3, values in self.smartphone_lut.items()}
+
+    def get_core_lut(self):
+        """
+        Return a copy of the core network lookup.
+
+        """
+        return {asset: dict(values) for asset, values in self.core_lut.items()}
+
+
+class DemandCache(object):
+    """
+    Demand results keyed by country, scenario and a fingerprint of the
+    other demand inputs.
+
+    Demand does not depend on the strategy, so options sharing a scenario
+    reuse the same results. Each caller gets its own copy of every region,
+    so later stages can add to them freely.
+
+    """
+    def __init__(self):
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, inputs, option, global_parameters, country_parameters,
+        timesteps, penetration_lut, tables=None):
+        """
+        Return the demand results for a country and scenario, estimating
+        demand from the country inputs on the first request. The country's
+        demand tables are built if not given.
+
+        """
+        key = (
+            inputs.iso3,
+            str(option['scenario']),
+            get_fingerprint(
+                inputs.regions_fingerprint,
+                global_parameters['overbooking_factor'],
+                global_parameters['discount_rate'],
+                country_parameters['networks'],
+                country_parameters['luminosity'],
+                country_parameters['arpu'],
+                timesteps,
+                penetration_lut,
+                inputs.get_smartphone_lut(),
+            ),
+        )
+
+        if key in self.results:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+            self.results[key] = estimate_demand(
+                inputs.get_regions(),
+                option,
+                global_parameters,
+                country_parameters,
+                timesteps,
+                penetration_lut,
+                inputs.get_smartphone_lut(),
+                tables
+            )
+
+        return [dict(region) for region in self.results[key]]
+
+
+#cost and capacity caches of a worker process, by cache key
+WORKER_CACHES = {}
+
+
+def get_worker_caches(cache_key, costs, core_lut, lookup):
+    """
+    Return the costs, core lookup and capacity lookup of a worker process
+    for a cache key, with the cost component cache and capacity curves
+    bound to them.
+
+    Each chunk sent to a worker brings its own copies of the inputs, so
+    the copies received first for a key are kept, and the caches built on
+    them are reused by every later chunk with the same key.
+
+    """
+    if cache_key not in WORKER_CACHES:
+        WORKER_CACHES[cache_key] = (costs, core_lut, lookup,
+            CostComponentCache(costs, core_lut), CapacityCurves(lookup))
+
+    return WORKER_CACHES[cache_key]
+
+
+def map_regions(regions, site_densities, lookup, option, global_parameters,
+    country_parameters, costs, core_lut, ci, sizing, priced, cache_key):
+    """
+    Map phase for a chunk of a country's regions: size and price the
+    network, restoring the chunk's persisted sizing and costs where given,
+    and assess each region.
+
+    """
+    costs, core_lut, lookup, cache, curves = get_worker_caches(cache_key,
+        costs, core_lut, lookup)
+
+    regions = estimate_supply_stages(regions, lookup, option,
+        global_parameters, country_parameters, costs, core_lut, ci, cache,
+        curves, sizing, priced, site_densities)
+
+    return assess_regions(regions, option, global_parameters,
+        country_parameters)
+
+
+def map_reduce_regions(executor, regions, site_densities, lookup, option,
+    global_parameters, country_parameters, costs, core_lut, ci, sizing_key,
+    cost_key, path, cache_key):
+    """
+    Split a country's regions into contiguous chunks, four per worker,
+    which are sized, priced and assessed by the executor's processes, then
+    allocate cross-subsidies across all regions at once.
+
+    Chunks are recombined in their original order, so the results are
+    the same as running assess over all regions in one process.
+
+    Demand is not part of the map phase. It is estimated for all regions
+    in the main process, once per scenario through the demand cache, and
+    the chunks receive the regions with demand and site densities already
+    found.
+
+    The cell's supply state is loaded and written here, as it is by
+    estimate_supply_incremental, and each chunk is given the persisted
+    sizing and costs of its own regions. Workers keep a cost component
+    cache and capacity curves for each cache_key, which should identify
+    the costs, core lookup and capacity lookup.
+
+    """
+    sizing, priced = find_supply_state(regions, load_supply_state(path),
+        sizing_key, cost_key)
+
+    chunk_count = global_parameters['region_workers'] * 4
+    chunk_size = max(1, -(-len(regions) // chunk_count))
+
+    futures = []
+
+    for start in range(0, len(regions), chunk_size):
+        chunk = regions[start:start + chunk_size]
+        futures.append(executor.submit(map_regions,
+            chunk,
+            site_densities[start:start + chunk_size],
+            lookup,
+            option,
+            global_parameters,
+            country_parameters,
+            costs,
+            core_lut,
+            ci,
+            None if sizing is None else select_columns(chunk, sizing),
+            None if priced is None else select_columns(chunk, priced),
+            cache_key,
+        ))
+
+    mapped = []
+    for future in futures:
+        mapped.extend(future.result())
+
+    if priced is None:
+        write_supply_outputs(mapped, sizing_key, cost_key, path)
+
+    return allocate_subsidies(mapped)
+
+
+def run_cell(country, regions, site_densities, demand_by_timestep, lookup,
+    option, global_parameters, country_parameters, costs, core_lut, ci,
+    timesteps, sizing_key, cost_key, state_path, cache=None, curves=None,
+    region_executor=None, cache_key=None):
+    """
+    Size, price and assess the network for one (country, option, ci) cell,
+    and allocate deciles.
+
+    Cells are independent of each other, so they can be run by separate
+    processes. The cost and capacity caches are only given when the cell
+    runs in the main process. If a region executor is given, the regions
+    of the cell are sized, priced and assessed in chunks by its processes,
+    with map_reduce_regions.
+
+    """
+    if global_parameters['rollout']:
+        data_supply = estimate_supply_rollout(
+            regions,
+            demand_by_timestep,
+            lookup,
+            option,
+            global_parameters,
+            country_parameters,
+            costs,
+            core_lut,
+            ci,
+            timesteps,
+            curves,
+        )
+    elif region_executor is not None:
+        data_assess = map_reduce_regions(
+            region_executor,
+            regions,
+            site_densities,
+            lookup,
+            option,
+            global_parameters,
+            country_parameters,
+            costs,
+            core_lut,
+            ci,
+            sizing_key,
+            cost_key,
+            state_path,
+            cache_key,
+        )
+        return allocate_deciles(data_assess)
+    else:
+        data_supply = estimate_supply_incremental(
+            regions,
+            lookup,
+            option,
+            global_parameters,
+            country_parameters,
+            costs,
+            core_lut,
+            ci,
+            cache,
+            curves,
+            sizing_key,
+            cost_key,
+            state_path,
+            site_densities,
+        )
+
+    data_assess = assess(
+        country,
+        data_supply,
+        option,
+        global_parameters,
+        country_parameters,
+    )
+
+    return allocate_deciles(data_assess)
+
+
+def run_cells(executor, cells, sink):
+    """
+    Run each cell, given as the arguments of run_cell, and add its results
+    to the sink, in the order the cells are given.
+
+    Without an executor, each cell is run in this process. With one, the
+    cells are run by its processes, and after each submission the results
+    of any leading cells which have finished are added, so results are
+    written while later cells run. If a cell fails, the cells not yet
+    started are cancelled.
+
+    """
+    if executor is None:
+        for cell in cells:
+            sink.add(run_cell(*cell))
+        return
+
+    futures = []
+
+    try:
+        for cell in cells:
+            futures.append(executor.submit(run_cell, *cell))
+            while futures and futures[0].done():
+                sink.add(futures.pop(0).result())
+
+        for future in futures:
+            sink.add(future.result())
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
 
 
 if __name__ == '__main__':
@@ -479,10 +908,41 @@ if __name__ == '__main__':
         'sectorization': 3,
         'confidence': [50], #[5, 50, 95],
         'regional_integration_factor': 20,
+        'rollout': False, #size and price the network in every timestep
+        'region_workers': 1, #processes sharing the regions of a country
+        'cell_workers': 1, #processes running (country, option, ci) cells, if region_workers is 1
         }
 
     path = os.path.join(DATA_RAW, 'pysim5g', 'capacity_lut_by_frequency.csv')
-    lookup = read_capacity_lookup(path)
+    compiled_path = os.path.join(DATA_INTERMEDIATE, 'capacity_lut_by_frequency')
+    if capacity_lookup_is_stale(compiled_path, path):
+        print('Compiling capacity lookup table')
+        compile_capacity_lookup(read_capacity_lookup(path), compiled_path)
+    lookup = load_capacity_lookup(compiled_path)
+    lookup_fingerprint = get_file_fingerprint(path)
+    capacity_curves = CapacityCurves(lookup)
+    demand_cache = DemandCache()
+
+    #inputs of each country, shared by all decision options
+    country_inputs = {}
+
+    if GLOBAL_PARAMETERS['cell_workers'] > 1 and GLOBAL_PARAMETERS['region_workers'] > 1:
+        raise ValueError('Cells and regions cannot both be run in parallel, '
+            'set either cell_workers or region_workers to 1')
+
+    if GLOBAL_PARAMETERS['cell_workers'] > 1:
+        cell_executor = ProcessPoolExecutor(GLOBAL_PARAMETERS['cell_workers'])
+    else:
+        cell_executor = None
+
+    if GLOBAL_PARAMETERS['region_workers'] > 1 and GLOBAL_PARAMETERS['rollout']:
+        print('Rollout mode sizes all regions of a country together, '
+            'so region_workers is not used')
+        region_executor = None
+    elif GLOBAL_PARAMETERS['region_workers'] > 1:
+        region_executor = ProcessPoolExecutor(GLOBAL_PARAMETERS['region_workers'])
+    else:
+        region_executor = None
 
     # countries, country_regional_levels = find_country_list(['Africa', 'South America'])
 
@@ -509,15 +969,14 @@ if __name__ == '__main__':
         'high'
     ]
 
-    for decision_option in decision_options:#[:1]:
-
-        print('Working on {}'.format(decision_option))
+    def get_cells(decision_option):
+        """
+        Prepare the inputs of each (country, option, ci) cell of a decision
+        option, and yield them as the arguments of run_cell.
 
+        """
         options = OPTIONS[decision_option]
 
-        regional_results = []
-        regional_cost_structure = []
-
         for country in countries:#[:1]:
 
             iso3 = country['iso3']
@@ -526,17 +985,20 @@ if __name__ == '__main__':
 
             country_parameters = COUNTRY_PARAMETERS[iso3]
 
-            folder = os.path.join(BASE_PATH, '..', 'vis', 'clustering', 'results')
-            filename = 'data_clustering_results.csv'
-            country['cluster'] = load_cluster(os.path.join(folder, filename), iso3)
+            if iso3 not in country_inputs:
+                country_inputs[iso3] = CountryInputs(country)
+            inputs = country_inputs[iso3]
+
+            country['cluster'] = inputs.cluster
+            core_lut = inputs.get_core_lut()
 
-            folder = os.path.join(DATA_RAW, 'wb_smartphone_survey')
-            filename = 'wb_smartphone_survey.csv'
-            smartphone_lut = load_smartphones(country, os.path.join(folder, filename))
+            #arpu, smartphone and network tables shared by all scenarios
+            demand_tables = get_demand_tables(GLOBAL_PARAMETERS,
+                country_parameters, TIMESTEPS, inputs.get_smartphone_lut())
 
-            folder = os.path.join(DATA_INTERMEDIATE, iso3)
-            filename = 'core_lut.csv'
-            core_lut = load_core_lut(os.path.join(folder, filename))
+            cost_cache = CostComponentCache(COSTS, core_lut)
+            cost_cache_key = get_fingerprint(iso3, COSTS,
+                inputs.core_lut_fingerprint, lookup_fingerprint)
 
             print('-----')
             print('Working on {} in {}'.format(decision_option, iso3))
@@ -548,54 +1010,121 @@ if __name__ == '__main__':
 
                 confidence_intervals = GLOBAL_PARAMETERS['confidence']
 
-                folder = os.path.join(DATA_INTERMEDIATE, iso3, 'subscriptions')
-                filename = 'subs_forecast.csv'
-                penetration_lut = load_penetration(option['scenario'], os.path.join(folder, filename))
+                penetration_lut = inputs.get_penetration(option['scenario'])
+
+                #demand does not depend on the strategy or confidence interval
+                data_demand = demand_cache.get(
+                    inputs,
+                    option,
+                    GLOBAL_PARAMETERS,
+                    country_parameters,
+                    TIMESTEPS,
+                    penetration_lut,
+                    demand_tables
+                )
+
+                generation = parse_strategy(option['strategy']).generation
+
+                site_densities = solve_site_densities(
+                    [region['demand_mbps_km2'] for region in data_demand],
+                    [GEOTYPES.index(region['geotype'].split(' ')[0])
+                        for region in data_demand],
+                    generation,
+                    country_parameters['frequencies'][generation],
+                    lookup,
+                    confidence_intervals,
+                    capacity_curves,
+                )
+
+                demand_by_timestep = None
+
+                if GLOBAL_PARAMETERS['rollout']:
+                    demand_by_timestep = estimate_demand_by_timestep(
+                        data_demand,
+                        option,
+                        GLOBAL_PARAMETERS,
+                        country_parameters,
+                        TIMESTEPS,
+                        penetration_lut,
+                        inputs.get_smartphone_lut(),
+                        demand_tables
+                    )
 
-                for ci in confidence_intervals:
+                for ci_index, ci in enumerate(confidence_intervals):
 
                     print('CI: {}'.format(ci))
 
-                    path = os.path.join(DATA_INTERMEDIATE, iso3, 'regional_data.csv')
-                    data = load_regions(iso3, path)
-
-                    data_initial = data.to_dict('records')
-
-                    data_demand = estimate_demand(
-                        data_initial,
+                    sizing_key, cost_key = get_supply_keys(
+                        iso3,
                         option,
+                        ci,
+                        TIMESTEPS,
                         GLOBAL_PARAMETERS,
                         country_parameters,
-                        TIMESTEPS,
+                        COSTS,
                         penetration_lut,
-                        smartphone_lut
+                        inputs.get_smartphone_lut(),
+                        inputs.regions_fingerprint,
+                        lookup_fingerprint,
+                        inputs.core_lut_fingerprint,
                     )
 
-                    data_supply = estimate_supply(
+                    filename = 'supply_{}_{}_{}.pkl'.format(
+                        option['scenario'], option['strategy'], ci)
+                    state_path = os.path.join(
+                        DATA_INTERMEDIATE, iso3, 'supply_state', filename)
+
+                    #the caches and region executor are only used when
+                    #the cell runs in this process
+                    local = cell_executor is None
+
+                    yield (
                         country,
-                        data_demand,
+                        [dict(region) for region in data_demand],
+                        site_densities[ci_index].tolist(),
+                        demand_by_timestep,
                         lookup,
                         option,
                         GLOBAL_PARAMETERS,
                         country_parameters,
                         COSTS,
                         core_lut,
-                        ci
+                        ci,
+                        TIMESTEPS,
+                        sizing_key,
+                        cost_key,
+                        state_path,
+                        cost_cache if local else None,
+                        capacity_curves if local else None,
+                        region_executor,
+                        cost_cache_key,
                     )
 
-                    data_assess = assess(
-                        country,
-                        data_supply,
-                        option,
-                        GLOBAL_PARAMETERS,
-                        country_parameters,
-                    )
+            #the cost cache is only used when cells are priced here
+            if (cell_executor is None and region_executor is None and
+                not GLOBAL_PARAMETERS['rollout']):
+                print('Cost component cache: {} hits, {} misses'.format(
+                    cost_cache.hits, cost_cache.misses))
+            print('Demand cache: {} hits, {} misses'.format(
+                demand_cache.hits, demand_cache.misses))
+
+    try:
+        for decision_option in decision_options:#[:1]:
+
+            print('Working on {}'.format(decision_option))
+
+            folder = os.path.join(BASE_PATH, '..', 'results')
+            sink = ResultsSink(folder, decision_option)
+
+            run_cells(cell_executor, get_cells(decision_option), sink)
 
-                    final_results = allocate_deciles(data_assess)
+            sink.close()
 
-                    regional_results = regional_results + final_results
+            print('Completed model run')
 
-        folder = os.path.join(BASE_PATH, '..', 'results')
-        write_results(regional_results, folder, decision_option)
+    finally:
+        if cell_executor is not None:
+            cell_executor.shutdown()
 
-        print('Completed model run')
+        if region_executor is not None:
+            region_executor.shutdown()
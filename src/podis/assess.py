@@ -6,6 +6,10 @@ Written by Ed Oughton.
 Winter 2020
 
 """
+import functools
+import numpy as np
+from podis.strategy import parse_strategy
+
 
 def assess(country, regions, option, global_parameters, country_parameters):
     """
@@ -33,62 +37,233 @@ def assess(country, regions, option, global_parameters, country_parameters):
         Contains all output data.
 
     """
-    interim = []
+    regions = assess_regions(regions, option, global_parameters,
+        country_parameters)
 
-    strategy = option['strategy']
-    available_for_cross_subsidy = 0
+    return allocate_subsidies(regions)
 
-    for region in regions:
 
-        # add customer acquition cost
-        region = get_subscriber_aquisition_cost(region,
-            country_parameters)
+def assess_regions(regions, option, global_parameters, country_parameters):
+    """
+    Assess the costs, revenue and excess or deficit of each region.
 
-        # npv spectrum cost
-        region['spectrum_cost'] = get_spectrum_costs(region, option['strategy'],
-            global_parameters, country_parameters)
+    Every value only depends on the region itself, so regions can be
+    assessed in separate chunks, with allocate_subsidies then run once
+    over all of them.
 
-        #tax on investment
-        region['tax'] = calculate_tax(region, strategy, country_parameters)
+    Parameters
+    ----------
+    regions : list of dicts
+        Data for all regions, after supply has been estimated.
+    option : dict
+        Contains the scenario and strategy.
+    global_parameters : dict
+        All global model parameters.
+    country_parameters : dict
+        All country specific parameters.
 
-        #profit margin value calculated on all costs + taxes
-        region['profit_margin'] = calculate_profit(region, country_parameters)
+    """
+    columns = get_assess_columns(regions)
 
-        region['total_cost'] = (
-            region['network_cost'] +
-            region['spectrum_cost'] +
-            region['tax'] +
-            region['profit_margin']
-        )
+    results = assess_columns(columns, option['strategy'], global_parameters,
+        country_parameters)
 
-        #avoid zero division
-        if region['total_cost'] > 0 and region['smartphones_on_network'] > 0:
-            region['cost_per_sp_user'] = region['total_cost'] / region['smartphones_on_network']
-        else:
-            region['cost_per_sp_user'] = 0
+    results = {key: value.tolist() for key, value in results.items()}
 
-        #revenue cost ratio = expenses / revenue
-        region['bcr'] = calculate_benefit_cost_ratio(region, country_parameters)
+    for i, region in enumerate(regions):
+        for key, value in results.items():
+            region[key] = value[i]
+
+    return regions
+
+
+def allocate_subsidies(regions):
+    """
+    Allocate the excess of all profitable regions to regions in deficit,
+    and find the state subsidy still required by each region.
+
+    Parameters
+    ----------
+    regions : list of dicts
+        All regions of a country, as returned by assess_regions. The
+        excess available for cross-subsidy is summed in this order.
+
+    Returns
+    -------
+    output : list of dicts
+        Regions sorted by deficit.
 
-        region = allocate_available_excess(region)
-        available_for_cross_subsidy += region['available_cross_subsidy']
+    """
+    deficit = np.array([region['deficit'] for region in regions], dtype=float)
+    total_cost = np.array([region['total_cost'] for region in regions],
+        dtype=float)
+    total_revenue = np.array([region['total_revenue'] for region in regions],
+        dtype=float)
+    available_cross_subsidy = np.array([region['available_cross_subsidy']
+        for region in regions], dtype=float)
 
-        interim.append(region)
+    order, used_cross_subsidy, required_state_subsidy = allocate_cross_subsidy(
+        deficit, total_cost, total_revenue, available_cross_subsidy)
 
-    interim = sorted(interim, key=lambda k: k['deficit'], reverse=False)
+    used_cross_subsidy = used_cross_subsidy.tolist()
+    required_state_subsidy = required_state_subsidy.tolist()
 
     output = []
 
-    for region in interim:
+    for i in order.tolist():
 
-        region, available_for_cross_subsidy = estimate_subsidies(
-            region, available_for_cross_subsidy)
+        region = regions[i]
+        region['used_cross_subsidy'] = used_cross_subsidy[i]
+        region['required_state_subsidy'] = required_state_subsidy[i]
 
         output.append(region)
 
     return output
 
 
+def get_assess_columns(regions):
+    """
+    Collect the region data used by assess_columns into equal-length arrays.
+
+    """
+    return {key: np.array([region[key] for region in regions], dtype=float)
+        for key in ['population', 'network_cost', 'phones_on_network',
+        'smartphones_on_network', 'total_revenue']}
+
+
+def assess_columns(columns, strategy, global_parameters, country_parameters):
+    """
+    Array form of the per-region assessment, giving the acquisition,
+    spectrum, tax and profit costs, the total cost, cost per smartphone
+    user, benefit cost ratio, and the excess or deficit of each region.
+
+    Parameters
+    ----------
+    columns : dict
+        Equal-length arrays describing each region, as produced by
+        get_assess_columns.
+    strategy : str
+        The strategy string.
+    global_parameters : dict
+        All global model parameters.
+    country_parameters : dict
+        All country specific parameters.
+
+    """
+    strategy = parse_strategy(strategy)
+    financials = country_parameters['financials']
+
+    network_cost = columns['network_cost']
+    smartphones_on_network = columns['smartphones_on_network']
+    total_revenue = columns['total_revenue']
+
+    # add customer acquition cost
+    acquisition_per_subscriber = (columns['phones_on_network'] *
+        financials['acquisition_per_subscriber'])
+
+    # npv spectrum cost
+    spectrum_cost = get_spectrum_costs_array(columns['population'], strategy,
+        global_parameters, country_parameters)
+
+    #tax on investment
+    tax = network_cost * (financials['tax_{}'.format(strategy.tax)] / 100)
+
+    #profit margin value calculated on all costs + taxes
+    profit_margin = ((network_cost + spectrum_cost + tax) *
+        (financials['profit_margin'] / 100))
+
+    total_cost = network_cost + spectrum_cost + tax + profit_margin
+
+    #avoid zero division
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        cost_per_sp_user = np.where(
+            (total_cost > 0) & (smartphones_on_network > 0),
+            total_cost / smartphones_on_network, 0)
+
+        #revenue cost ratio = expenses / revenue
+        bcr = np.where((total_revenue > 0) & (total_cost > 0),
+            total_revenue / total_cost, 0)
+
+    difference = total_revenue - total_cost
+
+    return {
+        'acquisition_per_subscriber': acquisition_per_subscriber,
+        'spectrum_cost': spectrum_cost,
+        'tax': tax,
+        'profit_margin': profit_margin,
+        'total_cost': total_cost,
+        'cost_per_sp_user': cost_per_sp_user,
+        'bcr': bcr,
+        'available_cross_subsidy': np.where(difference > 0, difference, 0),
+        'deficit': np.where(difference > 0, 0, np.abs(difference)),
+    }
+
+
+def allocate_cross_subsidy(deficit, total_cost, total_revenue,
+    available_cross_subsidy):
+    """
+    Allocate the excess of profitable regions to regions in deficit,
+    smallest deficit first, and find the state subsidy still required.
+
+    This gives the same result as running estimate_subsidies over the
+    regions sorted by deficit. The excess remaining before each region is
+    the total excess less the running sum of the deficits already met.
+    Every region is covered in full up to the first one the remaining
+    excess cannot cover, which gets whatever excess is left.
+
+    Parameters
+    ----------
+    deficit : array
+        Deficit of each region.
+    total_cost : array
+        Total cost of each region.
+    total_revenue : array
+        Total revenue of each region.
+    available_cross_subsidy : array
+        Excess of each region available to others.
+
+    Returns
+    -------
+    order : array
+        Region indices sorted by deficit.
+    used_cross_subsidy : array
+        Cross-subsidy received by each region.
+    required_state_subsidy : array
+        State subsidy required by each region.
+
+    """
+    order = np.argsort(deficit, kind='stable')
+
+    sorted_deficit = deficit[order]
+
+    #accumulate adds and subtracts in order, as the sequential loop does
+    available = np.add.accumulate(
+        np.concatenate([[0], available_cross_subsidy]))[-1]
+
+    remaining = np.subtract.accumulate(
+        np.concatenate([[available], sorted_deficit]))[:-1]
+
+    covered = remaining >= sorted_deficit
+
+    used = np.where(covered, sorted_deficit, 0)
+
+    if not covered.all():
+        first = np.argmin(covered)
+        used[first + 1:] = 0
+        if remaining[first] > 0:
+            used[first] = remaining[first]
+
+    used_cross_subsidy = np.empty(len(deficit))
+    used_cross_subsidy[order] = used
+
+    required_state_subsidy = total_cost - (total_revenue + used_cross_subsidy)
+    required_state_subsidy = np.where(required_state_subsidy > 0,
+        required_state_subsidy, 0)
+
+    return order, used_cross_subsidy, required_state_subsidy
+
+
 def get_subscriber_aquisition_cost(region, country_parameters):
     """
     There is an acquistion cost to obtaining and retaining subscribers
@@ -124,48 +299,70 @@ def get_spectrum_costs(region, strategy, global_parameters, country_parameters):
 
     """
     population = int(round(region['population']))
-    frequencies = country_parameters['frequencies']
-    generation = strategy.split('_')[0]
-    frequencies = frequencies[generation]
 
-    spectrum_cost = strategy.split('_')[5]
+    return population * get_spectrum_price_factor(strategy, country_parameters)
 
-    coverage_spectrum_cost = 'spectrum_coverage_baseline_usd_mhz_pop'
-    capacity_spectrum_cost = 'spectrum_capacity_baseline_usd_mhz_pop'
 
-    coverage_cost_usd_mhz_pop = country_parameters['financials'][coverage_spectrum_cost]
-    capacity_cost_usd_mhz_pop = country_parameters['financials'][capacity_spectrum_cost]
+def get_spectrum_costs_array(population, strategy, global_parameters,
+    country_parameters):
+    """
+    Array form of get_spectrum_costs for the population of each region.
 
-    if spectrum_cost == 'low':
-        coverage_cost_usd_mhz_pop = (coverage_cost_usd_mhz_pop *
-            (country_parameters['financials']['spectrum_cost_low'] /100))
-        capacity_cost_usd_mhz_pop = (capacity_cost_usd_mhz_pop *
-            (country_parameters['financials']['spectrum_cost_low'] /100))
+    """
+    return np.round(population) * get_spectrum_price_factor(strategy,
+        country_parameters)
+
+
+def get_spectrum_price_factor(strategy, country_parameters):
+    """
+    Return the spectrum cost per person for a strategy, summed over all
+    frequencies of its generation. The factor is cached for each set of
+    frequencies and prices.
 
-    if spectrum_cost == 'high':
+    """
+    strategy = parse_strategy(strategy)
+    financials = country_parameters['financials']
+
+    frequencies = tuple((frequency['frequency'], frequency['bandwidth'])
+        for frequency in country_parameters['frequencies'][strategy.generation])
+
+    if strategy.spectrum == 'low':
+        price_change = financials['spectrum_cost_low']
+    elif strategy.spectrum == 'high':
+        price_change = financials['spectrum_cost_high']
+    else:
+        price_change = None
+
+    return _spectrum_price_factor(
+        frequencies,
+        financials['spectrum_coverage_baseline_usd_mhz_pop'],
+        financials['spectrum_capacity_baseline_usd_mhz_pop'],
+        price_change,
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def _spectrum_price_factor(frequencies, coverage_cost_usd_mhz_pop,
+    capacity_cost_usd_mhz_pop, price_change):
+
+    if price_change is not None:
         coverage_cost_usd_mhz_pop = (coverage_cost_usd_mhz_pop *
-            (country_parameters['financials']['spectrum_cost_high'] / 100))
+            (price_change / 100))
         capacity_cost_usd_mhz_pop = (capacity_cost_usd_mhz_pop *
-            (country_parameters['financials']['spectrum_cost_high'] / 100))
+            (price_change / 100))
 
     all_costs = []
 
-    for frequency in frequencies:
+    for frequency, bandwidth in frequencies:
 
-        channel_number = int(frequency['bandwidth'].split('x')[0])
-        channel_bandwidth = int(frequency['bandwidth'].split('x')[1])
+        channel_number = int(bandwidth.split('x')[0])
+        channel_bandwidth = int(bandwidth.split('x')[1])
         bandwidth_total = channel_number * channel_bandwidth
 
-        if frequency['frequency'] < 1000:
-            cost = (
-                coverage_cost_usd_mhz_pop * bandwidth_total *
-                population)
-            all_costs.append(cost)
+        if frequency < 1000:
+            all_costs.append(coverage_cost_usd_mhz_pop * bandwidth_total)
         else:
-            cost = (
-                capacity_cost_usd_mhz_pop * bandwidth_total *
-                population)
-            all_costs.append(cost)
+            all_costs.append(capacity_cost_usd_mhz_pop * bandwidth_total)
 
     return sum(all_costs)
 
@@ -175,7 +372,7 @@ def calculate_tax(region, strategy, country_parameters):
     Calculate tax.
 
     """
-    tax_rate = strategy.split('_')[6]
+    tax_rate = parse_strategy(strategy).tax
     tax_rate = 'tax_{}'.format(tax_rate)
 
     tax_rate = country_parameters['financials'][tax_rate]
@@ -268,3 +465,4 @@ def calculate_benefit_cost_ratio(region, country_parameters):
         bcr = 0
 
     return bcr
+
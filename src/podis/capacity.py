@@ -0,0 +1,131 @@
+"""
+Compiled capacity lookup tables.
+
+Written by Ed Oughton.
+
+Winter 2020
+
+"""
+import os
+import json
+import numpy as np
+from collections.abc import Mapping
+
+
+KEY_SEPARATOR = '|'
+
+
+class CapacityLookup(Mapping):
+    """
+    A capacity lookup table read from a compiled binary file.
+
+    All (site density, capacity) pairs are held in a single memory-mapped
+    float array, with an index giving the rows for each (environment,
+    ant_type, frequency, generation, ci) key. It can be used anywhere the
+    dict produced by read_capacity_lookup is used. Each value is a
+    read-only array of (site density, capacity) rows, sorted by density.
+
+    Parallel workers reading the same file share one copy of the pages,
+    and a pickled lookup reopens the file rather than copying the table.
+
+    """
+    def __init__(self, path, data, index):
+        self.path = path
+        self.data = data
+        self.index = index
+
+    def __getitem__(self, key):
+        start, stop = self.index[KEY_SEPARATOR.join(key)]
+        return self.data[start:stop]
+
+    def __contains__(self, key):
+        return KEY_SEPARATOR.join(key) in self.index
+
+    def __iter__(self):
+        for key in self.index.keys():
+            yield tuple(key.split(KEY_SEPARATOR))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __reduce__(self):
+        return (load_capacity_lookup, (self.path,))
+
+
+def get_compiled_paths(path):
+    """
+    Return the paths of the data and index files of a compiled lookup.
+
+    """
+    return path + '.npy', path + '.json'
+
+
+def compile_capacity_lookup(lookup, path):
+    """
+    Write a capacity lookup table to a compiled binary file.
+
+    Parameters
+    ----------
+    lookup : dict
+        Lists of (site density, capacity) tuples keyed by (environment,
+        ant_type, frequency, generation, ci), as produced by
+        read_capacity_lookup.
+    path : string
+        Path of the compiled lookup, without an extension.
+
+    """
+    data_path, index_path = get_compiled_paths(path)
+
+    folder = os.path.dirname(data_path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    index = {}
+    rows = []
+
+    for key in sorted(lookup.keys()):
+        density_capacities = lookup[key]
+        index[KEY_SEPARATOR.join(key)] = [len(rows),
+            len(rows) + len(density_capacities)]
+        rows.extend(density_capacities)
+
+    data = np.array(rows, dtype=np.float64).reshape(len(rows), 2)
+
+    np.save(data_path, data)
+
+    with open(index_path, 'w') as sink:
+        json.dump(index, sink)
+
+
+def load_capacity_lookup(path):
+    """
+    Open a compiled capacity lookup table.
+
+    Parameters
+    ----------
+    path : string
+        Path of the compiled lookup, without an extension.
+
+    """
+    data_path, index_path = get_compiled_paths(path)
+
+    with open(index_path, 'r') as source:
+        index = {key: tuple(value) for key, value in json.load(source).items()}
+
+    data = np.load(data_path, mmap_mode='r')
+
+    return CapacityLookup(path, data, index)
+
+
+def capacity_lookup_is_stale(path, source_path):
+    """
+    Check whether a compiled lookup is missing or older than its source.
+
+    """
+    for compiled_path in get_compiled_paths(path):
+        if not os.path.exists(compiled_path):
+            return True
+        if os.path.getmtime(compiled_path) < os.path.getmtime(source_path):
+            return True
+
+    return False
@@ -8,14 +8,21 @@ https://github.com/edwardoughton/pytal
 
 """
 import math
-from itertools import tee
-import collections, functools, operator
+import functools
+
+import numpy as np
+
+from podis.strategy import parse_strategy
 
 def find_single_network_cost(region, option, costs, global_parameters,
-    country_parameters, core_lut):
+    country_parameters, core_lut, cache=None):
     """
     Calculates the annual total cost using capex and opex.
 
+    Sites are grouped into classes (upgraded or greenfield, with or without
+    new backhaul) and each class is priced once, so the cost of a region
+    does not grow with the number of sites.
+
     Parameters
     ----------
     region : dict
@@ -28,8 +35,11 @@ def find_single_network_cost(region, option, costs, global_parameters,
         Contains all global_parameters.
     country_parameters :
         ???
-    backhaul_lut : dict
-        Backhaul distance by region.
+    core_lut : dict
+        Core and regional network assets by region.
+    cache : CostComponentCache, optional
+        Cache of region-level network components, bound to costs and
+        core_lut. A cache for this region only is used if not given.
 
     Returns
     -------
@@ -38,10 +48,8 @@ def find_single_network_cost(region, option, costs, global_parameters,
         opex costs.
 
     """
-    strategy = option['strategy']
-    generation = strategy.split('_')[0]
-    core = strategy.split('_')[1]
-    backhaul = strategy.split('_')[2]
+    strategy = parse_strategy(option['strategy'])
+    generation = strategy.generation
 
     new_sites = region['new_sites']
     upgraded_sites = region['upgraded_sites']
@@ -49,79 +57,116 @@ def find_single_network_cost(region, option, costs, global_parameters,
 
     new_backhaul = region['backhaul_new']
 
-    regional_cost = []
-    regional_asset_cost = []
+    if cache is None:
+        cache = CostComponentCache(costs, core_lut)
 
-    for i in range(1, int(all_sites) + 1):
+    accumulator = CostAccumulator()
 
-        if i <= upgraded_sites and generation == '3G':
+    for site_type, backhaul_quant, quantity in get_site_classes(
+        upgraded_sites, all_sites, new_backhaul):
 
-            cost_structure = upgrade_to_3g(region,strategy, costs,
-                global_parameters, core_lut, country_parameters)
+        if quantity == 0:
+            continue
 
-            backhaul_quant = backhaul_quantity(i, new_backhaul)
+        if generation not in GENERATION_SITE_ASSETS:
+            continue
 
-            total_cost, cost_by_asset = calc_costs(region, strategy, cost_structure,
-                backhaul_quant, global_parameters, country_parameters)
-
-            regional_cost.append(total_cost)
-            regional_asset_cost.append(cost_by_asset)
+        cost_structure = get_cost_structure(region, strategy, generation,
+            site_type, costs, core_lut, country_parameters, cache)
 
-        if i <= upgraded_sites and generation == '4G':
+        total_cost, cost_by_asset = calc_costs(region, strategy, cost_structure,
+            backhaul_quant, global_parameters, country_parameters)
 
-            cost_structure = upgrade_to_4g(region,strategy, costs,
-                global_parameters, core_lut, country_parameters, )
+        accumulator.add(cost_by_asset, quantity)
 
-            backhaul_quant = backhaul_quantity(i, new_backhaul)
-
-            total_cost, cost_by_asset = calc_costs(region, strategy, cost_structure,
-                backhaul_quant, global_parameters, country_parameters)
-
-            regional_cost.append(total_cost)
-            regional_asset_cost.append(cost_by_asset)
+    network_cost = 0
+    for k, v in accumulator.to_dict().items():
+        region[k] = v
+        network_cost += v
 
+    region['network_cost'] = network_cost
 
-        if i > upgraded_sites and generation == '3G':
+    return region
 
-            cost_structure = greenfield_3g(region, strategy, costs,
-                global_parameters, core_lut, country_parameters)
 
-            backhaul_quant = backhaul_quantity(i, new_backhaul)
+class CostAccumulator(object):
+    """
+    Fixed-width accumulator of costs by cost category, backed by a small
+    float array. Costs are added in place, so the per-site cost breakdowns
+    do not need to be kept.
 
-            total_cost, cost_by_asset = calc_costs(region, strategy, cost_structure,
-                backhaul_quant, global_parameters, country_parameters)
+    """
+    __slots__ = ('categories', 'values', 'updates')
 
-            regional_cost.append(total_cost)
-            regional_asset_cost.append(cost_by_asset)
+    def __init__(self, categories=None):
+        if categories is None:
+            categories = COST_CATEGORIES.keys()
+        self.categories = list(categories)
+        self.values = np.zeros(len(self.categories))
+        self.updates = 0
 
+    def add(self, cost_by_category, quantity=1):
+        """
+        Add a cost breakdown by category, multiplied by quantity.
 
-        if i > upgraded_sites and generation == '4G':
+        """
+        values = self.values
+        for i, key in enumerate(self.categories):
+            values[i] += cost_by_category[key] * quantity
+        self.updates += 1
 
-            cost_structure = greenfield_4g(region, strategy, costs,
-                global_parameters, core_lut, country_parameters)
+    def to_dict(self):
+        """
+        Return the accumulated costs by category, or an empty dict if
+        nothing has been added.
 
-            backhaul_quant = backhaul_quantity(i, new_backhaul)
+        """
+        if self.updates == 0:
+            return {}
 
-            total_cost, cost_by_asset = calc_costs(region, strategy, cost_structure,
-                backhaul_quant, global_parameters, country_parameters)
+        return {key: float(value) for key, value in
+            zip(self.categories, self.values)}
 
-            regional_cost.append(total_cost)
-            regional_asset_cost.append(cost_by_asset)
 
+def get_site_classes(upgraded_sites, all_sites, new_backhaul):
+    """
+    Count the sites in each cost class of a region.
 
-    counter = collections.Counter()
-    for d in regional_asset_cost:
-        counter.update(d)
-    test = dict(counter)
+    Sites are numbered from 1 to all_sites, with the upgraded sites first,
+    and site i receives new backhaul if i <= new_backhaul (see
+    backhaul_quantity). Every site is therefore either upgraded or
+    greenfield, with or without new backhaul, and each class only needs
+    to be priced once.
 
-    network_cost = 0
-    for k, v in test.items():
-        region[k] = v
-        network_cost += v
+    Parameters
+    ----------
+    upgraded_sites : float
+        Number of existing sites to upgrade.
+    all_sites : float
+        Total number of upgraded and greenfield sites.
+    new_backhaul : float
+        Number of new backhaul links required.
 
-    region['network_cost'] = network_cost
+    Returns
+    -------
+    output : list of tuples
+        Contains (site_type, backhaul_quantity, quantity) for the four
+        site classes.
 
-    return region
+    """
+    total = max(int(all_sites), 0)
+    upgraded = min(max(math.floor(upgraded_sites), 0), total)
+    backhaul = min(max(math.floor(new_backhaul), 0), total)
+
+    upgraded_with_backhaul = min(upgraded, backhaul)
+    greenfield_with_backhaul = backhaul - upgraded_with_backhaul
+
+    return [
+        ('upgraded', 1, upgraded_with_backhaul),
+        ('upgraded', 0, upgraded - upgraded_with_backhaul),
+        ('greenfield', 1, greenfield_with_backhaul),
+        ('greenfield', 0, total - upgraded - greenfield_with_backhaul),
+    ]
 
 
 def backhaul_quantity(i, new_backhaul):
@@ -131,244 +176,679 @@ def backhaul_quantity(i, new_backhaul):
         return 0
 
 
-def upgrade_to_3g(region, strategy, costs, global_parameters,
-    core_lut, country_parameters):
+def find_network_cost_sensitivity(region, option, costs, global_parameters,
+    country_parameters, core_lut):
     """
-    Reflects the baseline scenario of needing to build a single dedicated
-    network.
+    Calculate the partial derivative of each regional cost category with
+    respect to each unit cost in costs.
+
+    For the site and backhaul quantities of a region (the output of
+    estimate_supply), network cost is linear in the unit costs, once the
+    backhaul size band has been chosen from the distance to a node. The
+    rounding applied when discounting and the truncation of core network
+    costs are ignored, so re-priced costs match find_single_network_cost
+    to within that rounding.
+
+    Parameters
+    ----------
+    region : dict
+        The region being assessed, with site and backhaul quantities.
+    option : dict
+        Contains the scenario and strategy.
+    costs : dict
+        Contains the costs of each necessary equipment item.
+    global_parameters : dict
+        All global model parameters.
+    country_parameters : dict
+        All country specific parameters.
+    core_lut : dict
+        Core and regional network assets by region.
+
+    Returns
+    -------
+    sensitivity : dict
+        For each cost category, the partial derivative of cost with
+        respect to each key of costs it depends on.
 
     """
-    backhaul = '{}_backhaul'.format(strategy.split('_')[2])
-    sharing = strategy.split('_')[3]
+    strategy = parse_strategy(option['strategy'])
+    generation = strategy.generation
     geotype = region['geotype'].split(' ')[0]
 
-    # generation_core_backhaul_sharing_networks_spectrum_tax
-    network_strategy = strategy.split('_')[4]
-    networks = country_parameters['networks']['baseline' + '_' + geotype]
+    all_sites = region['new_sites'] + region['upgraded_sites']
 
-    if network_strategy == 'srn' and geotype == 'rural':
-        sharing = 'cns'
-
-    shared_assets = INFRA_SHARING_ASSETS[sharing]
-
-    assets = {
-        'single_sector_antenna': costs['single_sector_antenna'],
-        'single_remote_radio_unit': costs['single_remote_radio_unit'],
-        'io_fronthaul': costs['io_fronthaul'],
-        'processing': costs['processing'],
-        'io_s1_x2': costs['io_s1_x2'],
-        'control_unit': costs['control_unit'],
-        'cooling_fans': costs['cooling_fans'],
-        'distributed_power_supply_converter': costs['distributed_power_supply_converter'],
-        'bbu_cabinet': costs['bbu_cabinet'],
-        'installation': costs['installation'],
-        'site_rental': costs['site_rental_{}'.format(geotype)],
-        'router': costs['router'],
-        'backhaul': get_backhaul_costs(region, backhaul, costs, core_lut),
-        'core_edge': core_costs(region, 'core_edge', costs, core_lut, strategy, country_parameters),
-        'core_node': core_costs(region, 'core_node', costs, core_lut, strategy, country_parameters),
-        'regional_edge': regional_net_costs(region, 'regional_edge', costs, core_lut, strategy, country_parameters),
-        'regional_node': regional_net_costs(region, 'regional_node', costs, core_lut, strategy, country_parameters),
-        'per_site_spectrum_acquisition_cost': costs['per_site_spectrum_acquisition_cost'],
-        'per_site_administration_cost': costs['per_site_administration_cost'],
+    unit_costs = {key: 1 for key in costs.keys()}
+
+    cost_keys = {
+        'site_rental': 'site_rental_{}'.format(geotype),
+        'backhaul': get_backhaul_tech(region, strategy.backhaul, core_lut)[0],
+        'core_node': 'core_node_{}'.format(strategy.core),
+        'regional_node': 'regional_node_{}'.format(strategy.core),
     }
 
-    cost_structure = {}
+    sensitivity = {key: {} for key in COST_CATEGORIES.keys()}
+    categories = list(COST_CATEGORIES.keys())
 
-    for key, value in assets.items():
-        if not key in shared_assets:
-            cost_structure[key] = value
-        else:
-            if network_strategy == 'srn' and geotype == 'rural':
-                value = value * (1 / networks)
-                cost_structure[key] = value
-            else:
-                value = value / networks
-                cost_structure[key] = value
+    for site_type, backhaul_quant, quantity in get_site_classes(
+        region['upgraded_sites'], all_sites, region['backhaul_new']):
 
-    return cost_structure
+        if quantity == 0 or generation not in GENERATION_SITE_ASSETS:
+            continue
 
+        #with unit costs, each asset in the structure is its quantity
+        unit_structure = get_cost_structure(region, strategy, generation,
+            site_type, unit_costs, core_lut, country_parameters)
 
-def upgrade_to_4g(region, strategy, costs, global_parameters,
-    core_lut, country_parameters):
+        for asset_name, asset_quantity in unit_structure.items():
+
+            factor = get_asset_cost_factor(region, strategy, asset_name,
+                backhaul_quant, global_parameters, country_parameters)
+
+            if factor is None:
+                continue
+
+            category = ASSET_CATALOG['info'][asset_name][1]
+            key = cost_keys.get(asset_name, asset_name)
+
+            if category < 0 or key is None:
+                continue
+
+            coefficients = sensitivity[categories[category]]
+            coefficients[key] = (coefficients.get(key, 0) +
+                quantity * asset_quantity * factor)
+
+    return sensitivity
+
+
+def get_asset_cost_factor(region, strategy, asset_name, backhaul_quantity,
+    global_parameters, country_parameters):
     """
-    Reflects the baseline scenario of needing to build a single dedicated
-    network.
+    Return the linear multiplier that calc_costs applies to the cost of an
+    asset, without rounding, or None if the asset is not priced.
 
     """
-    backhaul = '{}_backhaul'.format(strategy.split('_')[2])
-    sharing = strategy.split('_')[3]
-    geotype = region['geotype'].split(' ')[0]
+    info = ASSET_CATALOG['info'].get(asset_name)
 
-    # generation_core_backhaul_sharing_networks_spectrum_tax
-    network_strategy = strategy.split('_')[4]
-    networks = country_parameters['networks']['baseline' + '_' + geotype]
+    if info is None or info[0] < 0:
+        return None
 
-    if network_strategy == 'srn' and geotype == 'rural':
-        sharing = 'cns'
-
-    shared_assets = INFRA_SHARING_ASSETS[sharing]
-
-    assets = {
-        'single_sector_antenna': costs['single_sector_antenna'],
-        'single_remote_radio_unit': costs['single_remote_radio_unit'],
-        'io_fronthaul': costs['io_fronthaul'],
-        'processing': costs['processing'],
-        'io_s1_x2': costs['io_s1_x2'],
-        'control_unit': costs['control_unit'],
-        'cooling_fans': costs['cooling_fans'],
-        'distributed_power_supply_converter': costs['distributed_power_supply_converter'],
-        'bbu_cabinet': costs['bbu_cabinet'],
-        'installation': costs['installation'],
-        'site_rental': costs['site_rental_{}'.format(geotype)],
-        'router': costs['router'],
-        'backhaul': get_backhaul_costs(region, backhaul, costs, core_lut),
-        'core_edge': core_costs(region, 'core_edge', costs, core_lut, strategy, country_parameters),
-        'core_node': core_costs(region, 'core_node', costs, core_lut, strategy, country_parameters),
-        'regional_edge': regional_net_costs(region, 'regional_edge', costs, core_lut, strategy, country_parameters),
-        'regional_node': regional_net_costs(region, 'regional_node', costs, core_lut, strategy, country_parameters),
-        'per_site_spectrum_acquisition_cost': costs['per_site_spectrum_acquisition_cost'],
-        'per_site_administration_cost': costs['per_site_administration_cost'],
-    }
+    type_of_cost, category, flags = info
 
-    cost_structure = {}
+    if asset_name == 'backhaul' and backhaul_quantity == 0:
+        return None
 
-    for key, value in assets.items():
-        if not key in shared_assets:
-            cost_structure[key] = value
-        else:
-            if network_strategy == 'srn' and geotype == 'rural':
-                value = value * (1 / networks)
-                cost_structure[key] = value
-            else:
-                value = value / networks
-                cost_structure[key] = value
+    if flags & SKIP_WITH_MICROWAVE and parse_strategy(strategy).backhaul == 'microwave':
+        return None
 
-    return cost_structure
+    annuity_factor, wacc_factor = get_annuity_factors(
+        global_parameters['return_period'],
+        global_parameters['discount_rate'],
+        country_parameters['financials']['wacc']
+    )
 
+    if type_of_cost == CAPEX_AND_OPEX:
+        factor = (1 + (global_parameters['opex_percentage_of_capex'] / 100) *
+            annuity_factor) * wacc_factor
+    elif type_of_cost == OPEX:
+        factor = annuity_factor * wacc_factor
+    else:
+        factor = 1
 
-def greenfield_3g(region, strategy, costs, global_parameters,
-    core_lut, country_parameters):
+    if region['integration'] == 'integration' and flags & HALVED_WITH_INTEGRATION:
+        factor = factor / 2
+    elif region['integration'] == 'integration':
+        factor = factor * (1 - (global_parameters['regional_integration_factor'] / 100))
+
+    if flags & SECTORIZED:
+        factor = factor * global_parameters['sectorization']
+
+    if flags & SHARED_BY_SITES:
+        factor = factor / (region['upgraded_sites'] + region['new_sites'])
+
+    return factor
+
+
+def reprice_network_cost(sensitivity, costs):
     """
-    Build a greenfield 3G asset.
+    Re-price a region under new unit costs from its cost sensitivity,
+    without re-running estimate_supply.
+
+    Parameters
+    ----------
+    sensitivity : dict
+        Output of find_network_cost_sensitivity for the region.
+    costs : dict
+        Contains the new costs of each equipment item.
+
+    Returns
+    -------
+    output : dict
+        Contains the cost of each cost category and the total
+        network_cost.
 
     """
-    backhaul = '{}_backhaul'.format(strategy.split('_')[2])
-    sharing = strategy.split('_')[3]
-    geotype = region['geotype'].split(' ')[0]
+    output = {}
+    network_cost = 0
 
-    # generation_core_backhaul_sharing_networks_spectrum_tax
-    network_strategy = strategy.split('_')[4]
-    networks = country_parameters['networks']['baseline' + '_' + geotype]
+    for category, coefficients in sensitivity.items():
+        cost = 0
+        for key, coefficient in coefficients.items():
+            cost += coefficient * costs[key]
+        output[category] = cost
+        network_cost += cost
 
-    if network_strategy == 'srn' and geotype == 'rural':
-        sharing = 'cns'
-
-    shared_assets = INFRA_SHARING_ASSETS[sharing]
-
-    assets = {
-        'single_sector_antenna': costs['single_sector_antenna'],
-        'single_remote_radio_unit': costs['single_remote_radio_unit'],
-        'io_fronthaul': costs['io_fronthaul'],
-        'processing': costs['processing'],
-        'io_s1_x2': costs['io_s1_x2'],
-        'control_unit': costs['control_unit'],
-        'cooling_fans': costs['cooling_fans'],
-        'distributed_power_supply_converter': costs['distributed_power_supply_converter'],
-        'power_generator_battery_system': costs['power_generator_battery_system'],
-        'bbu_cabinet': costs['bbu_cabinet'],
-        'tower': costs['tower'],
-        'civil_materials': costs['civil_materials'],
-        'transportation': costs['transportation'],
-        'installation': costs['installation'],
-        'site_rental': costs['site_rental_{}'.format(geotype)],
-        'router': costs['router'],
-        'backhaul': get_backhaul_costs(region, backhaul, costs, core_lut),
-        'core_edge': core_costs(region, 'core_edge', costs, core_lut, strategy, country_parameters),
-        'core_node': core_costs(region, 'core_node', costs, core_lut, strategy, country_parameters),
-        'regional_edge': regional_net_costs(region, 'regional_edge', costs, core_lut, strategy, country_parameters),
-        'regional_node': regional_net_costs(region, 'regional_node', costs, core_lut, strategy, country_parameters),
-        'per_site_spectrum_acquisition_cost': costs['per_site_spectrum_acquisition_cost'],
-        'per_site_administration_cost': costs['per_site_administration_cost'],
-    }
+    output['network_cost'] = network_cost
+
+    return output
 
-    cost_structure = {}
 
-    for key, value in assets.items():
-        if not key in shared_assets:
-            cost_structure[key] = value
+def find_network_costs(columns, option, costs, global_parameters,
+    country_parameters):
+    """
+    Vectorized equivalent of find_single_network_cost for many regions.
+
+    Parameters
+    ----------
+    columns : dict
+        Equal-length arrays describing each region, as produced by
+        get_cost_columns.
+    option : dict
+        Contains the scenario and strategy.
+    costs : dict
+        Contains the costs of each necessary equipment item.
+    global_parameters : dict
+        All global model parameters.
+    country_parameters : dict
+        All country specific parameters.
+
+    Returns
+    -------
+    output : dict
+        Contains an array for each cost category and the total
+        network_cost, in the same order as the input regions.
+
+    """
+    strategy = parse_strategy(option['strategy'])
+    generation = strategy.generation
+    core = strategy.core
+    backhaul = strategy.backhaul
+    sharing = strategy.sharing
+    network_strategy = strategy.networks
+
+    geotype = np.asarray(columns['geotype'])
+    area_km2 = np.asarray(columns['area_km2'], dtype=float)
+    new_sites = np.asarray(columns['new_sites'], dtype=float)
+    upgraded_sites = np.asarray(columns['upgraded_sites'], dtype=float)
+    new_backhaul = np.asarray(columns['backhaul_new'], dtype=float)
+    integration = np.asarray(columns['integration'], dtype=bool)
+    nodes = np.asarray(columns['nodes'], dtype=float)
+
+    networks = np.array([country_parameters['networks']['baseline' + '_' + g]
+        for g in GEOTYPES], dtype=float)[geotype]
+
+    all_sites = new_sites + upgraded_sites
+    sites = all_sites / networks
+
+    if network_strategy == 'srn':
+        srn_rural = geotype == GEOTYPES.index('rural')
+    else:
+        srn_rural = np.zeros(len(geotype), dtype=bool)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        #region-level network components, as in get_backhaul_costs,
+        #core_costs and regional_net_costs
+        node_density_km2 = nodes / area_km2
+        ave_distance_to_a_node_m = np.where(node_density_km2 > 0,
+            (np.sqrt(1 / node_density_km2) / 2) * 1000,
+            np.round(np.sqrt(area_km2) * 1000))
+
+        if backhaul == 'microwave':
+            backhaul_cost = np.select([
+                ave_distance_to_a_node_m < 15000,
+                (15000 < ave_distance_to_a_node_m) & (ave_distance_to_a_node_m < 30000)
+                ], [
+                costs['microwave_small'],
+                costs['microwave_medium'],
+                ], costs['microwave_large'] * (ave_distance_to_a_node_m / 30000))
+        elif backhaul == 'fiber':
+            cost_per_meter = np.array([costs['fiber_{}_m'.format(g)]
+                for g in GEOTYPES], dtype=float)[geotype]
+            backhaul_cost = cost_per_meter * ave_distance_to_a_node_m
         else:
-            if network_strategy == 'srn' and geotype == 'rural':
-                value = value * (1 / networks)
-                cost_structure[key] = value
+            print('Did not recognise the backhaul technology {}'.format(backhaul))
+            backhaul_cost = np.zeros(len(geotype))
+
+        core_edge = np.trunc(np.asarray(columns['core_edge'], dtype=float) * costs['core_edge'])
+        core_node = np.trunc(np.asarray(columns['core_node'], dtype=float) *
+            costs['core_node_{}'.format(core)])
+        regional_edge = np.trunc(np.asarray(columns['regional_edge'], dtype=float) * costs['regional_edge'])
+        regional_node = np.trunc(np.asarray(columns['regional_node'], dtype=float) *
+            costs['regional_node_{}'.format(core)])
+
+        assets = {
+            'site_rental': np.array([costs['site_rental_{}'.format(g)]
+                for g in GEOTYPES], dtype=float)[geotype],
+            'backhaul': backhaul_cost,
+            'core_edge': np.where(sites == 0, 0,
+                np.where(sites < 1, core_edge, core_edge / sites)),
+            'core_node': np.where(sites == 0, 0,
+                np.where(sites < 1, core_node, core_node / sites)),
+            'regional_edge': np.where(sites == 0, 0,
+                np.where(sites <= 1, regional_edge * sites, regional_edge / sites)),
+            'regional_node': np.where(sites == 0, 0,
+                np.where(sites <= 1, regional_node, regional_node / sites)),
+        }
+
+        total = np.maximum(np.trunc(all_sites), 0)
+        upgraded = np.clip(np.floor(upgraded_sites), 0, total)
+        backhaul_links = np.clip(np.floor(new_backhaul), 0, total)
+        upgraded_with_backhaul = np.minimum(upgraded, backhaul_links)
+        greenfield_with_backhaul = backhaul_links - upgraded_with_backhaul
+
+        site_classes = [
+            ('upgraded', 1, upgraded_with_backhaul),
+            ('upgraded', 0, upgraded - upgraded_with_backhaul),
+            ('greenfield', 1, greenfield_with_backhaul),
+            ('greenfield', 0, total - upgraded - greenfield_with_backhaul),
+        ]
+
+        output = {key: np.zeros(len(geotype)) for key in COST_CATEGORIES.keys()}
+
+        if generation not in GENERATION_SITE_ASSETS:
+            site_classes = []
+
+        catalog = ASSET_CATALOG
+
+        for site_type, backhaul_quant, quantity in site_classes:
+
+            asset_names = []
+            for asset in GENERATION_SITE_ASSETS[generation][site_type]:
+                type_of_cost, category, flags = catalog['info'].get(asset, (-1, -1, 0))
+                if type_of_cost < 0:
+                    continue
+                if asset == 'backhaul' and backhaul_quant == 0:
+                    continue
+                if flags & SKIP_WITH_MICROWAVE and backhaul == 'microwave':
+                    continue
+                asset_names.append(asset)
+
+            index = np.array([catalog['index'][asset] for asset in asset_names])
+
+            cost = np.array([assets[asset] if asset in assets else
+                np.full(len(geotype), float(costs[asset]))
+                for asset in asset_names])
+
+            shared = np.where(srn_rural,
+                catalog['sharing']['cns'][index][:, np.newaxis],
+                catalog['sharing'][sharing][index][:, np.newaxis])
+            cost = np.where(shared,
+                np.where(srn_rural, cost * (1 / networks), cost / networks),
+                cost)
+
+            cost = calc_asset_costs(index, cost, all_sites, integration,
+                global_parameters, country_parameters)
+
+            category_costs = catalog['categories'][:, index].dot(cost)
+
+            for i, key in enumerate(COST_CATEGORIES.keys()):
+                output[key] = output[key] + category_costs[i] * quantity
+
+    network_cost = 0
+    for key in COST_CATEGORIES.keys():
+        network_cost = network_cost + output[key]
+    output['network_cost'] = network_cost
+
+    return output
+
+
+def calc_asset_costs(index, cost, all_sites, integration,
+    global_parameters, country_parameters):
+    """
+    Vectorized equivalent of the per-asset pricing in calc_costs.
+
+    Parameters
+    ----------
+    index : array
+        ASSET_CATALOG index of each asset (row) being priced.
+    cost : array
+        Undiscounted asset costs, with one row per asset and one column
+        per region.
+
+    """
+    type_of_cost = ASSET_CATALOG['cost_type'][index][:, np.newaxis]
+    flags = ASSET_CATALOG['flags'][index][:, np.newaxis]
+    integration_factor = 1 - (global_parameters['regional_integration_factor'] / 100)
+
+    cost = np.select([
+        type_of_cost == CAPEX_AND_OPEX,
+        type_of_cost == OPEX,
+        ], [
+        discount_capex_and_opex_array(cost, global_parameters, country_parameters),
+        discount_opex_array(cost, global_parameters, country_parameters),
+        ], cost)
+
+    cost = np.where(integration,
+        np.where(flags & HALVED_WITH_INTEGRATION, cost / 2, cost * integration_factor),
+        cost)
+
+    cost = np.where(flags & SECTORIZED,
+        cost * global_parameters['sectorization'], cost)
+
+    cost = np.where(flags & SHARED_BY_SITES,
+        np.where(all_sites > 0, cost / all_sites, 0), cost)
+
+    return cost
+
+
+def get_cost_columns(regions, core_lut):
+    """
+    Convert a list of regions into the columnar arrays used by
+    find_network_costs.
+
+    Parameters
+    ----------
+    regions : list of dicts
+        Regions with site and backhaul quantities already estimated.
+    core_lut : dict
+        Core and regional network assets by region.
+
+    Returns
+    -------
+    columns : dict
+        Contains an array for each region attribute.
+
+    """
+    columns = get_region_columns(regions, core_lut)
+
+    for key in ['new_sites', 'upgraded_sites', 'backhaul_new']:
+        columns[key] = np.array([region[key] for region in regions], dtype=float)
+
+    return columns
+
+
+def get_region_columns(regions, core_lut):
+    """
+    Convert a list of regions into the columnar arrays used by
+    find_network_costs which do not depend on site quantities.
+
+    """
+    columns = {}
+
+    columns['area_km2'] = np.array([region['area_km2'] for region in regions],
+        dtype=float)
+
+    columns['geotype'] = np.array([GEOTYPES.index(region['geotype'].split(' ')[0])
+        for region in regions], dtype=int)
+    columns['integration'] = np.array([region['integration'] == 'integration'
+        for region in regions], dtype=bool)
+
+    for asset_type in ['core_edge', 'core_node', 'regional_edge', 'regional_node']:
+        lut = core_lut.get(asset_type, {})
+        columns[asset_type] = np.array([
+            lut.get('{}_{}'.format(region['GID_id'], 'new'), 0)
+            for region in regions], dtype=float)
+
+    nodes = np.zeros(len(regions))
+    for asset_type in ['core_node', 'regional_node']:
+        lut = core_lut.get(asset_type, {})
+        for age in ['new', 'existing']:
+            nodes = nodes + np.array([
+                lut.get('{}_{}'.format(region['GID_id'], age), 0)
+                for region in regions], dtype=float)
+    columns['nodes'] = nodes
+
+    return columns
+
+
+class CostComponentCache(object):
+    """
+    Cache of the region-level backhaul, core and regional network cost
+    components used in every site cost structure of a region.
+
+    Components are keyed by region, strategy components and the number of
+    sites they are shared over. A cache is bound to one costs dict and
+    core_lut, and a new cache is needed if either changes. The hits and
+    misses counters record how often components were reused.
+
+    The region-independent part of each site cost structure is also kept,
+    see get_structure.
+
+    """
+    __slots__ = ('costs', 'core_lut', 'components', 'structures', 'hits',
+        'misses')
+
+    def __init__(self, costs, core_lut):
+        self.costs = costs
+        self.core_lut = core_lut
+        self.components = {}
+        self.structures = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_structure(self, generation, build_type, geotype, sharing,
+        network_strategy, networks):
+        """
+        Return the site cost structure without the region-level network
+        components, and a list of (component, shared) pairs giving the
+        components still to be added.
+
+        """
+        key = (generation, build_type, geotype, sharing, network_strategy,
+            networks)
+
+        if key in self.structures:
+            return self.structures[key]
+
+        if network_strategy == 'srn' and geotype == 'rural':
+            sharing = 'cns'
+
+        shared_assets = INFRA_SHARING_ASSETS[sharing]
+        rural_srn = network_strategy == 'srn' and geotype == 'rural'
+
+        costs = self.costs
+
+        structure = {}
+        shared_components = []
+
+        for asset in GENERATION_SITE_ASSETS[generation][build_type]:
+            shared = asset in shared_assets
+            if asset in NETWORK_COMPONENTS:
+                #placeholder which keeps the order of the assets
+                structure[asset] = None
+                shared_components.append((asset, shared))
             else:
-                value = value / networks
-                cost_structure[key] = value
+                if asset == 'site_rental':
+                    value = costs['site_rental_{}'.format(geotype)]
+                else:
+                    value = costs[asset]
+                structure[asset] = share_asset_cost(value, shared,
+                    rural_srn, networks)
+
+        self.structures[key] = (structure, shared_components)
+
+        return self.structures[key]
+
+    def get(self, region, strategy, country_parameters):
+        """
+        Return the network components for a region, computing them on the
+        first request.
+
+        """
+        strategy = parse_strategy(strategy)
+        geotype = region['geotype'].split(' ')[0]
+        networks = country_parameters['networks']['baseline' + '_' + geotype]
+
+        key = (
+            region['GID_id'],
+            strategy.core,
+            strategy.backhaul,
+            geotype,
+            networks,
+            region['area_km2'],
+            region['upgraded_sites'] + region['new_sites'],
+        )
 
-    return cost_structure
+        if key in self.components:
+            self.hits += 1
+            return self.components[key]
 
+        self.misses += 1
 
-def greenfield_4g(region, strategy, costs, global_parameters,
-    core_lut, country_parameters):
+        costs = self.costs
+        core_lut = self.core_lut
+        backhaul = '{}_backhaul'.format(strategy.backhaul)
+
+        components = {
+            'backhaul': get_backhaul_costs(region, backhaul, costs, core_lut),
+            'core_edge': core_costs(region, 'core_edge', costs, core_lut, strategy, country_parameters),
+            'core_node': core_costs(region, 'core_node', costs, core_lut, strategy, country_parameters),
+            'regional_edge': regional_net_costs(region, 'regional_edge', costs, core_lut, strategy, country_parameters),
+            'regional_node': regional_net_costs(region, 'regional_node', costs, core_lut, strategy, country_parameters),
+        }
+
+        self.components[key] = components
+
+        return components
+
+    def clear(self):
+        """
+        Remove all cached components and reset the counters.
+
+        """
+        self.components = {}
+        self.structures = {}
+        self.hits = 0
+        self.misses = 0
+
+
+def get_network_components(region, strategy, costs, core_lut,
+    country_parameters, cache=None):
     """
-    Build a greenfield 4G asset.
+    Return the backhaul, core and regional network cost components of a
+    region, using the cache when one is given.
 
     """
-    backhaul = '{}_backhaul'.format(strategy.split('_')[2])
-    sharing = strategy.split('_')[3]
-    geotype = region['geotype'].split(' ')[0]
+    if cache is None:
+        cache = CostComponentCache(costs, core_lut)
+    elif cache.costs is not costs or cache.core_lut is not core_lut:
+        raise ValueError('Cache is bound to a different costs or core_lut')
+
+    return cache.get(region, strategy, country_parameters)
+
+
+def get_cost_structure(region, strategy, generation, build_type, costs,
+    core_lut, country_parameters, cache=None):
+    """
+    Return the cost of each asset of a single site, after splitting the
+    cost of shared assets across networks.
+
+    The assets and sharing split only depend on the generation, build
+    type, geotype, sharing, network strategy and number of networks, so
+    that part of the structure is built once per cache. Only the
+    region-level backhaul, core and regional network components are merged
+    in for each region.
+
+    Parameters
+    ----------
+    region : dict
+        The region being assessed and all associated parameters.
+    strategy : str
+        Infrastructure sharing strategy.
+    generation : str
+        Technology generation, a key of GENERATION_SITE_ASSETS.
+    build_type : str
+        Either 'upgraded' or 'greenfield'.
+    costs : dict
+        Contains the costs of each necessary equipment item.
+    core_lut : dict
+        Core and regional network assets by region.
+    country_parameters : dict
+        All country specific parameters.
+    cache : CostComponentCache, optional
+        Cache bound to costs and core_lut.
 
-    # generation_core_backhaul_sharing_networks_spectrum_tax
-    network_strategy = strategy.split('_')[4]
+    """
+    strategy = parse_strategy(strategy)
+    geotype = region['geotype'].split(' ')[0]
     networks = country_parameters['networks']['baseline' + '_' + geotype]
 
-    if network_strategy == 'srn' and geotype == 'rural':
-        sharing = 'cns'
-
-    shared_assets = INFRA_SHARING_ASSETS[sharing]
-
-    assets = {
-        'single_sector_antenna': costs['single_sector_antenna'],
-        'single_remote_radio_unit': costs['single_remote_radio_unit'],
-        'io_fronthaul': costs['io_fronthaul'],
-        'processing': costs['processing'],
-        'io_s1_x2': costs['io_s1_x2'],
-        'control_unit': costs['control_unit'],
-        'cooling_fans': costs['cooling_fans'],
-        'distributed_power_supply_converter': costs['distributed_power_supply_converter'],
-        'power_generator_battery_system': costs['power_generator_battery_system'],
-        'bbu_cabinet': costs['bbu_cabinet'],
-        'tower': costs['tower'],
-        'civil_materials': costs['civil_materials'],
-        'transportation': costs['transportation'],
-        'installation': costs['installation'],
-        'site_rental': costs['site_rental_{}'.format(geotype)],
-        'router': costs['router'],
-        'backhaul': get_backhaul_costs(region, backhaul, costs, core_lut),
-        'core_edge': core_costs(region, 'core_edge', costs, core_lut, strategy, country_parameters),
-        'core_node': core_costs(region, 'core_node', costs, core_lut, strategy, country_parameters),
-        'regional_edge': regional_net_costs(region, 'regional_edge', costs, core_lut, strategy, country_parameters),
-        'regional_node': regional_net_costs(region, 'regional_node', costs, core_lut, strategy, country_parameters),
-        'per_site_spectrum_acquisition_cost': costs['per_site_spectrum_acquisition_cost'],
-        'per_site_administration_cost': costs['per_site_administration_cost'],
-    }
+    if cache is None:
+        cache = CostComponentCache(costs, core_lut)
 
-    cost_structure = {}
+    structure, shared_components = cache.get_structure(generation,
+        build_type, geotype, strategy.sharing, strategy.networks, networks)
 
-    for key, value in assets.items():
-        if not key in shared_assets:
-            cost_structure[key] = value
-        else:
-            if network_strategy == 'srn' and geotype == 'rural':
-                value = value * (1 / networks)
-                cost_structure[key] = value
-            else:
-                value = value / networks
-                cost_structure[key] = value
+    components = get_network_components(region, strategy, costs, core_lut,
+        country_parameters, cache)
+
+    cost_structure = dict(structure)
+
+    rural_srn = strategy.networks == 'srn' and geotype == 'rural'
+
+    for key, shared in shared_components:
+        cost_structure[key] = share_asset_cost(components[key], shared,
+            rural_srn, networks)
 
     return cost_structure
 
 
+def share_asset_cost(value, shared, rural_srn, networks):
+    """
+    Split the cost of a shared asset across networks.
+
+    """
+    if not shared:
+        return value
+
+    if rural_srn:
+        return value * (1 / networks)
+
+    return value / networks
+
+
+def upgrade_to_3g(region, strategy, costs, global_parameters,
+    core_lut, country_parameters, cache=None):
+    """
+    Reflects the baseline scenario of needing to build a single dedicated
+    network.
+
+    """
+    return get_cost_structure(region, strategy, '3G', 'upgraded', costs,
+        core_lut, country_parameters, cache)
+
+
+def upgrade_to_4g(region, strategy, costs, global_parameters,
+    core_lut, country_parameters, cache=None):
+    """
+    Reflects the baseline scenario of needing to build a single dedicated
+    network.
+
+    """
+    return get_cost_structure(region, strategy, '4G', 'upgraded', costs,
+        core_lut, country_parameters, cache)
+
+
+def greenfield_3g(region, strategy, costs, global_parameters,
+    core_lut, country_parameters, cache=None):
+    """
+    Build a greenfield 3G asset.
+
+    """
+    return get_cost_structure(region, strategy, '3G', 'greenfield', costs,
+        core_lut, country_parameters, cache)
+
+
+def greenfield_4g(region, strategy, costs, global_parameters,
+    core_lut, country_parameters, cache=None):
+    """
+    Build a greenfield 4G asset.
+
+    """
+    return get_cost_structure(region, strategy, '4G', 'greenfield', costs,
+        core_lut, country_parameters, cache)
+
+
 def get_fronthaul_costs(region, costs):
     """
     Calculate fronthaul costs.
@@ -387,6 +867,29 @@ def get_backhaul_costs(region, backhaul, costs, core_lut):
     """
     Calculate backhaul costs.
     # backhaul_fiber backhaul_copper backhaul_microwave	backhaul_satellite
+    """
+    tech, quantity = get_backhaul_tech(region, backhaul, core_lut)
+
+    if tech is None:
+        print('Did not recognise the backhaul technology {}'.format(backhaul))
+        return 0
+
+    return costs[tech] * quantity
+
+
+def get_backhaul_tech(region, backhaul, core_lut):
+    """
+    Find the backhaul cost item for a region and the quantity of it needed
+    per link, given the average distance to a core or regional node.
+
+    Returns
+    -------
+    tech : str
+        Key of the backhaul item in costs, or None if the backhaul
+        technology is not recognised.
+    quantity : float
+        Number of cost units per backhaul link (meters for fiber).
+
     """
     backhaul_tech = backhaul.split('_')[0]
     geotype = region['geotype'].split(' ')[0]
@@ -405,33 +908,24 @@ def get_backhaul_costs(region, backhaul, costs, core_lut):
 
     if backhaul_tech == 'microwave':
         if ave_distance_to_a_node_m < 15000:
-            tech = '{}_{}'.format(backhaul_tech, 'small')
-            cost = costs[tech]
+            return '{}_{}'.format(backhaul_tech, 'small'), 1
         elif 15000 < ave_distance_to_a_node_m < 30000:
-            tech = '{}_{}'.format(backhaul_tech, 'medium')
-            cost = costs[tech]
+            return '{}_{}'.format(backhaul_tech, 'medium'), 1
         else:
-            tech = '{}_{}'.format(backhaul_tech, 'large')
-            cost = costs[tech] * (ave_distance_to_a_node_m / 30000)
-
+            return ('{}_{}'.format(backhaul_tech, 'large'),
+                ave_distance_to_a_node_m / 30000)
 
     elif backhaul_tech == 'fiber':
-        tech = '{}_{}_m'.format(backhaul_tech, geotype)
-        cost_per_meter = costs[tech]
-        cost = cost_per_meter * ave_distance_to_a_node_m
-
-    else:
-        print('Did not recognise the backhaul technology {}'.format(backhaul_tech))
-        cost = 0
+        return '{}_{}_m'.format(backhaul_tech, geotype), ave_distance_to_a_node_m
 
-    return cost
+    return None, 0
 
 
 def regional_net_costs(region, asset_type, costs, core_lut, strategy, country_parameters):
     """
     Return regional asset costs for only the 'new' assets that have been planned.
     """
-    core = strategy.split('_')[1]
+    core = parse_strategy(strategy).core
     geotype = region['geotype'].split(' ')[0]
 
     networks = country_parameters['networks']['baseline' + '_' + geotype]
@@ -484,7 +978,7 @@ def core_costs(region, asset_type, costs, core_lut, strategy, country_parameters
     Return core asset costs for only the 'new' assets that have been planned.
 
     """
-    core = strategy.split('_')[1]
+    core = parse_strategy(strategy).core
     geotype = region['geotype'].split(' ')[0]
     networks = country_parameters['networks']['baseline' + '_' + geotype]
 
@@ -546,6 +1040,69 @@ def core_costs(region, asset_type, costs, core_lut, strategy, country_parameters
     return 0
 
 
+@functools.lru_cache(maxsize=256)
+def get_annuity_factors(return_period, discount_rate, wacc):
+    """
+    Return the annuity and wacc factors used to discount opex.
+
+    The annuity factor is the sum of the discount factors over the return
+    period, so a constant annual opex is discounted with one multiply.
+
+    Parameters
+    ----------
+    return_period : int
+        Number of years over which opex is incurred.
+    discount_rate : float
+        Discount rate as a percentage.
+    wacc : float
+        Weighted average cost of capital as a percentage.
+
+    Returns
+    -------
+    annuity_factor : float
+        Sum of 1 / (1 + discount_rate)**i for i in the return period.
+    wacc_factor : float
+        Multiplier applied to add the cost of capital.
+
+    """
+    discount_rate = discount_rate / 100
+
+    annuity_factor = 0
+    for i in range(0, return_period):
+        annuity_factor += 1 / (1 + discount_rate)**i
+
+    return annuity_factor, 1 + (wacc/100)
+
+
+@functools.lru_cache(maxsize=1024)
+def get_compound_factor(discount_rate, timestep):
+    """
+    Return (1 + discount_rate)**timestep, with discount_rate as a
+    percentage.
+
+    """
+    return (1 + discount_rate / 100) ** timestep
+
+
+@functools.lru_cache(maxsize=256)
+def _compound_factors(discount_rate, timesteps):
+
+    compound_factors = np.array([get_compound_factor(discount_rate, timestep)
+        for timestep in timesteps], dtype=float)
+    compound_factors.setflags(write=False)
+
+    return compound_factors
+
+
+def get_compound_factors(discount_rate, timesteps):
+    """
+    Array form of get_compound_factor for a sequence of timesteps. The
+    returned array is cached and read-only.
+
+    """
+    return _compound_factors(discount_rate, tuple(timesteps))
+
+
 def discount_capex_and_opex(capex, global_parameters, country_parameters):
     """
     Discount costs based on return period.
@@ -560,25 +1117,18 @@ def discount_capex_and_opex(capex, global_parameters, country_parameters):
     discounted_cost : float
         The discounted cost over the desired time period.
     """
-    return_period = global_parameters['return_period']
-    discount_rate = global_parameters['discount_rate'] / 100
-    wacc = country_parameters['financials']['wacc']
-
-    costs_over_time_period = []
-
-    costs_over_time_period.append(capex)
+    annuity_factor, wacc_factor = get_annuity_factors(
+        global_parameters['return_period'],
+        global_parameters['discount_rate'],
+        country_parameters['financials']['wacc']
+    )
 
     opex = round(capex * (global_parameters['opex_percentage_of_capex'] / 100))
 
-    for i in range(0, return_period):
-        costs_over_time_period.append(
-            opex / (1 + discount_rate)**i
-        )
-
-    discounted_cost = round(sum(costs_over_time_period))
+    discounted_cost = round(capex + opex * annuity_factor)
 
     #add wacc
-    discounted_cost = discounted_cost * (1 + (wacc/100))
+    discounted_cost = discounted_cost * wacc_factor
 
     return discounted_cost
 
@@ -588,177 +1138,126 @@ def discount_opex(opex, global_parameters, country_parameters):
     Discount opex based on return period.
 
     """
-    return_period = global_parameters['return_period']
-    discount_rate = global_parameters['discount_rate'] / 100
-    wacc = country_parameters['financials']['wacc']
+    annuity_factor, wacc_factor = get_annuity_factors(
+        global_parameters['return_period'],
+        global_parameters['discount_rate'],
+        country_parameters['financials']['wacc']
+    )
 
-    costs_over_time_period = []
-
-    for i in range(0, return_period):
-        costs_over_time_period.append(
-            opex / (1 + discount_rate)**i
-        )
-
-    discounted_cost = round(sum(costs_over_time_period))
+    discounted_cost = round(opex * annuity_factor)
 
     #add wacc
-    discounted_cost = discounted_cost * (1 + (wacc/100))
+    discounted_cost = discounted_cost * wacc_factor
 
     return discounted_cost
 
 
-def calc_costs(region, strategy, cost_structure, backhaul_quantity,
-    global_parameters, country_parameters):
+def discount_capex_and_opex_array(capex, global_parameters, country_parameters):
     """
+    Vectorized equivalent of discount_capex_and_opex.
 
     """
-    # generation = strategy.split('_')[0]
-    core = strategy.split('_')[1]
-    backhaul = strategy.split('_')[2]
-    regional_integration = region['integration']
+    annuity_factor, wacc_factor = get_annuity_factors(
+        global_parameters['return_period'],
+        global_parameters['discount_rate'],
+        country_parameters['financials']['wacc']
+    )
 
-    all_sites = region['upgraded_sites'] + region['new_sites']
+    capex = np.asarray(capex, dtype=float)
+    opex = np.round(capex * (global_parameters['opex_percentage_of_capex'] / 100))
 
-    total_cost = 0
-    cost_by_asset = []
+    discounted_cost = np.round(capex + opex * annuity_factor)
 
-    for asset_name1, cost in cost_structure.items():
-        for asset_name2, type_of_cost in COST_TYPE.items():
-            if asset_name1 == asset_name2:
+    #add wacc
+    discounted_cost = discounted_cost * wacc_factor
 
-                if asset_name1 == 'backhaul' and backhaul_quantity == 0:
-                    continue
+    return discounted_cost
 
-                if asset_name1 == 'regional_node' and backhaul == 'microwave':
-                    continue
 
-                if asset_name1 == 'regional_edge' and backhaul == 'microwave':
-                    continue
+def discount_opex_array(opex, global_parameters, country_parameters):
+    """
+    Vectorized equivalent of discount_opex.
 
-                if type_of_cost == 'capex_and_opex':
+    """
+    annuity_factor, wacc_factor = get_annuity_factors(
+        global_parameters['return_period'],
+        global_parameters['discount_rate'],
+        country_parameters['financials']['wacc']
+    )
 
-                    cost = discount_capex_and_opex(cost, global_parameters, country_parameters)
+    discounted_cost = np.round(np.asarray(opex, dtype=float) * annuity_factor)
 
-                    if regional_integration == 'integration':
-                        print('------')
-                        cost = (cost * (1 -
-                            (global_parameters['regional_integration_factor'] /  100)))
+    #add wacc
+    discounted_cost = discounted_cost * wacc_factor
 
-                    if asset_name1 == 'single_sector_antenna':
-                        cost = cost * global_parameters['sectorization']
+    return discounted_cost
 
-                    if asset_name1 in [
-                        'core_edge',
-                        'core_node',
-                        'regional_edge',
-                        'regional_node',
-                        ]:
-                        cost = cost / all_sites
 
-                elif type_of_cost == 'capex':
+def calc_costs(region, strategy, cost_structure, backhaul_quantity,
+    global_parameters, country_parameters):
+    """
+    Calculate the discounted cost of a single site from its cost structure.
 
-                    cost = cost
+    Each asset is classified with the precompiled ASSET_CATALOG rather than
+    by matching its name against COST_TYPE and the category lists.
 
-                    if regional_integration == 'integration' and asset_name1 == 'per_site_spectrum_acquisition_cost':
-                        cost = cost / 2
-                    elif regional_integration == 'integration':
-                        cost = (cost * (1 -
-                            (global_parameters['regional_integration_factor'] /  100)))
+    Returns
+    -------
+    total_cost : float
+        Total discounted cost of the site.
+    cost_by_asset : dict
+        Discounted cost of the site by cost category.
 
-                elif type_of_cost == 'opex':
+    """
+    backhaul = parse_strategy(strategy).backhaul
+    integration = region['integration'] == 'integration'
+    integration_factor = 1 - (global_parameters['regional_integration_factor'] / 100)
 
-                    cost = discount_opex(cost, global_parameters, country_parameters)
+    all_sites = region['upgraded_sites'] + region['new_sites']
 
-                    if regional_integration == 'integration' and asset_name1 == 'per_site_administration_cost':
-                        cost = cost / 2
-                    elif regional_integration == 'integration' and asset_name1 == 'per_site_facilities_cost':
-                        cost = cost / 2
-                    elif regional_integration == 'integration':
-                        cost = (cost * (1 -
-                            (global_parameters['regional_integration_factor'] /  100)))
+    asset_info = ASSET_CATALOG['info']
 
-                else:
-                    return 'Did not recognize cost type'
+    total_cost = 0
+    category_costs = [0] * len(COST_CATEGORIES)
 
-                total_cost += cost
+    for asset_name, cost in cost_structure.items():
 
-                cost_by_asset.append({
-                    'asset': asset_name1,
-                    'cost': cost,
-                })
+        if asset_name not in asset_info:
+            continue
 
-    cost_by_asset = {item['asset']: item['cost'] for item in cost_by_asset}
+        type_of_cost, category, flags = asset_info[asset_name]
 
-    ran = [
-        'single_sector_antenna',
-        'single_remote_radio_unit',
-        'io_fronthaul',
-        'processing',
-        'io_s1_x2',
-        'control_unit',
-        'cooling_fans',
-        'distributed_power_supply_converter',
-        'bbu_cabinet',
-        'cots_processing',
-        'io_n2_n3',
-        'low_latency_switch',
-        'rack',
-        'cloud_power_supply_converter',
-        'software'
-    ]
+        if type_of_cost < 0:
+            continue
 
-    backhaul_fronthaul = [
-        'fronthaul',
-        'backhaul',
-    ]
+        if asset_name == 'backhaul' and backhaul_quantity == 0:
+            continue
 
-    civils = [
-        'tower',
-        'civil_materials',
-        'transportation',
-        'installation',
-        'site_rental',
-        'power_generator_battery_system',
-    ]
+        if flags & SKIP_WITH_MICROWAVE and backhaul == 'microwave':
+            continue
 
-    core = [
-        'cloud_backhaul',
-        'regional_node',
-        'regional_edge',
-        'core_node',
-        'core_edge',
-    ]
+        if type_of_cost == CAPEX_AND_OPEX:
+            cost = discount_capex_and_opex(cost, global_parameters, country_parameters)
+        elif type_of_cost == OPEX:
+            cost = discount_opex(cost, global_parameters, country_parameters)
 
-    admin_and_ops = [
-        'per_site_spectrum_acquisition_cost',
-        'per_site_administration_cost',
-    ]
+        if integration and flags & HALVED_WITH_INTEGRATION:
+            cost = cost / 2
+        elif integration:
+            cost = cost * integration_factor
 
-    ran_cost = 0
-    backhaul_fronthaul_cost = 0
-    civils_cost = 0
-    core_cost = 0
-    admin_and_ops_cost = 0
-
-    for key, value in cost_by_asset.items():
-        if key in ran:
-            ran_cost += value
-        if key in backhaul_fronthaul:
-            backhaul_fronthaul_cost += value
-        if key in civils:
-            civils_cost += value
-        if key in core:
-            core_cost += value
-        if key in admin_and_ops:
-            admin_and_ops_cost += value
-
-    cost_by_asset = {
-        'ran': ran_cost,
-        'backhaul_fronthaul': backhaul_fronthaul_cost,
-        'civils': civils_cost,
-        'core_network': core_cost,
-        'admin_and_ops': admin_and_ops_cost,
-    }
+        if flags & SECTORIZED:
+            cost = cost * global_parameters['sectorization']
+
+        if flags & SHARED_BY_SITES:
+            cost = cost / all_sites
+
+        total_cost += cost
+
+        if category >= 0:
+            category_costs[category] += cost
+
+    cost_by_asset = dict(zip(COST_CATEGORIES.keys(), category_costs))
 
     return total_cost, cost_by_asset
 
@@ -874,3 +1373,210 @@ COST_TYPE = {
     'per_site_spectrum_acquisition_cost': 'capex',
     'per_site_administration_cost': 'opex',
 }
+
+COST_CATEGORIES = {
+    'ran': [
+        'single_sector_antenna',
+        'single_remote_radio_unit',
+        'io_fronthaul',
+        'processing',
+        'io_s1_x2',
+        'control_unit',
+        'cooling_fans',
+        'distributed_power_supply_converter',
+        'bbu_cabinet',
+        'cots_processing',
+        'io_n2_n3',
+        'low_latency_switch',
+        'rack',
+        'cloud_power_supply_converter',
+        'software'
+    ],
+    'backhaul_fronthaul': [
+        'fronthaul',
+        'backhaul',
+    ],
+    'civils': [
+        'tower',
+        'civil_materials',
+        'transportation',
+        'installation',
+        'site_rental',
+        'power_generator_battery_system',
+    ],
+    'core_network': [
+        'cloud_backhaul',
+        'regional_node',
+        'regional_edge',
+        'core_node',
+        'core_edge',
+    ],
+    'admin_and_ops': [
+        'per_site_spectrum_acquisition_cost',
+        'per_site_administration_cost',
+    ],
+}
+
+SITE_ASSETS = {
+    'upgraded': [
+        'single_sector_antenna',
+        'single_remote_radio_unit',
+        'io_fronthaul',
+        'processing',
+        'io_s1_x2',
+        'control_unit',
+        'cooling_fans',
+        'distributed_power_supply_converter',
+        'bbu_cabinet',
+        'installation',
+        'site_rental',
+        'router',
+        'backhaul',
+        'core_edge',
+        'core_node',
+        'regional_edge',
+        'regional_node',
+        'per_site_spectrum_acquisition_cost',
+        'per_site_administration_cost',
+    ],
+    'greenfield': [
+        'single_sector_antenna',
+        'single_remote_radio_unit',
+        'io_fronthaul',
+        'processing',
+        'io_s1_x2',
+        'control_unit',
+        'cooling_fans',
+        'distributed_power_supply_converter',
+        'power_generator_battery_system',
+        'bbu_cabinet',
+        'tower',
+        'civil_materials',
+        'transportation',
+        'installation',
+        'site_rental',
+        'router',
+        'backhaul',
+        'core_edge',
+        'core_node',
+        'regional_edge',
+        'regional_node',
+        'per_site_spectrum_acquisition_cost',
+        'per_site_administration_cost',
+    ],
+}
+
+GENERATION_SITE_ASSETS = {
+    '3G': SITE_ASSETS,
+    '4G': SITE_ASSETS,
+}
+
+NETWORK_COMPONENTS = [
+    'backhaul',
+    'core_edge',
+    'core_node',
+    'regional_edge',
+    'regional_node',
+]
+
+GEOTYPES = ['urban', 'suburban', 'rural']
+
+def compile_asset_catalog(cost_type, cost_categories, infra_sharing_assets):
+    """
+    Compile the asset lists into integer-indexed arrays and bitmasks.
+
+    Parameters
+    ----------
+    cost_type : dict
+        Type of cost ('capex_and_opex', 'capex' or 'opex') by asset.
+    cost_categories : dict
+        Assets in each cost category.
+    infra_sharing_assets : dict
+        Assets shared under each infrastructure sharing strategy.
+
+    Returns
+    -------
+    catalog : dict
+        Contains the asset names, an index by name, arrays of cost type
+        codes, category codes and flags, a category membership matrix,
+        sharing masks and an 'info' dict of (cost type, category, flags)
+        by asset name for per-site pricing.
+
+    """
+    assets = list(cost_type.keys())
+
+    for names in list(cost_categories.values()) + list(infra_sharing_assets.values()):
+        for name in names:
+            if name not in assets:
+                assets.append(name)
+
+    index = {name: i for i, name in enumerate(assets)}
+
+    type_codes = np.array([COST_TYPES.index(cost_type[name])
+        if name in cost_type else -1 for name in assets])
+
+    categories = np.zeros((len(cost_categories), len(assets)))
+    category_codes = np.full(len(assets), -1)
+    for i, names in enumerate(cost_categories.values()):
+        for name in names:
+            categories[i, index[name]] = 1
+            category_codes[index[name]] = i
+
+    flags = np.zeros(len(assets), dtype=int)
+    for flag, names in ASSET_FLAGS.items():
+        for name in names:
+            if name in index:
+                flags[index[name]] |= flag
+
+    sharing = {key: np.array([name in names for name in assets])
+        for key, names in infra_sharing_assets.items()}
+
+    info = {name: (int(type_codes[i]), int(category_codes[i]), int(flags[i]))
+        for i, name in enumerate(assets)}
+
+    return {
+        'assets': assets,
+        'index': index,
+        'cost_type': type_codes,
+        'category': category_codes,
+        'flags': flags,
+        'categories': categories,
+        'sharing': sharing,
+        'info': info,
+    }
+
+
+COST_TYPES = ['capex_and_opex', 'capex', 'opex']
+
+CAPEX_AND_OPEX = 0
+CAPEX = 1
+OPEX = 2
+
+HALVED_WITH_INTEGRATION = 1
+SECTORIZED = 2
+SHARED_BY_SITES = 4
+SKIP_WITH_MICROWAVE = 8
+
+ASSET_FLAGS = {
+    HALVED_WITH_INTEGRATION: [
+        'per_site_spectrum_acquisition_cost',
+        'per_site_administration_cost',
+        'per_site_facilities_cost',
+    ],
+    SECTORIZED: [
+        'single_sector_antenna',
+    ],
+    SHARED_BY_SITES: [
+        'core_edge',
+        'core_node',
+        'regional_edge',
+        'regional_node',
+    ],
+    SKIP_WITH_MICROWAVE: [
+        'regional_edge',
+        'regional_node',
+    ],
+}
+
+ASSET_CATALOG = compile_asset_catalog(COST_TYPE, COST_CATEGORIES,
+    INFRA_SHARING_ASSETS)
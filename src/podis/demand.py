@@ -6,9 +6,14 @@ Written by Ed Oughton.
 Winter 2020
 
 """
+import numpy as np
+from podis.costs import get_compound_factor, get_compound_factors, GEOTYPES
+from podis.strategy import parse_scenario
+
 
 def estimate_demand(regions, option, global_parameters,
-    country_parameters, timesteps, penetration_lut, smartphone_lut):
+    country_parameters, timesteps, penetration_lut, smartphone_lut,
+    tables=None):
     """
     Estimate the total revenue based on current demand.
 
@@ -29,6 +34,11 @@ def estimate_demand(regions, option, global_parameters,
         All years for the assessment period.
     penetration_lut : list of dicts
         Contains annual penetration values.
+    smartphone_lut : dict
+        Smartphone adoption by country and settlement type.
+    tables : dict, optional
+        Demand tables from get_demand_tables, which can be shared by all
+        scenarios of a country. Built if not given.
 
     Returns
     -------
@@ -36,96 +46,269 @@ def estimate_demand(regions, option, global_parameters,
         Geopandas dataframe of all regions.
 
     """
-    output = []
+    regions = [region for region in regions if region['area_km2'] > 0]
+
+    if tables is None:
+        tables = get_demand_tables(global_parameters, country_parameters,
+            timesteps, smartphone_lut)
+
+    columns = get_demand_columns(regions, option, tables)
+
+    demand = find_demand(columns, tables, global_parameters, timesteps,
+        penetration_lut)
+
+    #the values of the final timestep are kept on each region
+    arpu = demand['arpu'][:, -1].tolist()
+    population_with_phones = demand['population_with_phones'][:, -1].tolist()
+    phones_on_network = demand['phones_on_network'][:, -1].tolist()
+    smartphones_on_network = demand['smartphones_on_network'][:, -1].tolist()
+    total_revenue = demand['total_revenue'].tolist()
+    revenue_km2 = demand['revenue_km2'].tolist()
+    demand_mbps_km2 = demand['demand_mbps_km2'].tolist()
+
+    for i, region in enumerate(regions):
+        region['arpu'] = arpu[i]
+        region['population_with_phones'] = population_with_phones[i]
+        region['phones_on_network'] = phones_on_network[i]
+        region['smartphones_on_network'] = smartphones_on_network[i]
+        region['total_revenue'] = total_revenue[i]
+        region['revenue_km2'] = revenue_km2[i]
+        region['demand_mbps_km2'] = demand_mbps_km2[i]
+
+    return regions
+
+
+def estimate_demand_by_timestep(regions, option, global_parameters,
+    country_parameters, timesteps, penetration_lut, smartphone_lut,
+    tables=None):
+    """
+    Estimate demand (Mbps per km^2) for each region (rows) in each timestep
+    (columns), for the regions kept by estimate_demand.
+
+    """
+    regions = [region for region in regions if region['area_km2'] > 0]
+
+    if tables is None:
+        tables = get_demand_tables(global_parameters, country_parameters,
+            timesteps, smartphone_lut)
+
+    columns = get_demand_columns(regions, option, tables)
+
+    demand = find_demand(columns, tables, global_parameters, timesteps,
+        penetration_lut)
+
+    return demand['demand_mbps_km2_by_timestep']
+
+
+def get_demand_tables(global_parameters, country_parameters, timesteps,
+    smartphone_lut):
+    """
+    Precompute the region-independent inputs to demand for a country as
+    small arrays, so demand only needs integer-indexed lookups.
+
+    Parameters
+    ----------
+    global_parameters : dict
+        All global model parameters.
+    country_parameters : dict
+        All country specific parameters.
+    timesteps : list
+        All years for the assessment period.
+    smartphone_lut : dict
+        Smartphone adoption by country and settlement type.
 
-    # # generation_core_backhaul_sharing_networks_spectrum_tax_integration
-    # network_strategy = option['strategy'].split('_')[4]
+    Returns
+    -------
+    tables : dict
+        Contains the discounted arpu by luminosity tier (rows, in the order
+        of LUMINOSITY_TIERS) and timestep (columns), the luminosity
+        thresholds, the networks by geotype code, and the smartphone share
+        by country code (rows) and geotype code (columns), with the code of
+        each country.
 
-    for region in regions:
+    """
+    luminosity = country_parameters['luminosity']
+    arpu = country_parameters['arpu']
+
+    compound_factors = get_compound_factors(global_parameters['discount_rate'],
+        [timestep - 2020 for timestep in timesteps])
 
-        if not region['area_km2'] > 0:
-            continue
+    arpu_by_tier = np.array([arpu[tier] for tier in LUMINOSITY_TIERS],
+        dtype=float)
 
-        geotype = region['geotype'].split(' ')[0]
-        # net_handle = network_strategy + '_' + geotype
-        # networks = country_parameters['networks'][net_handle]
-        networks = country_parameters['networks']['baseline' + '_' + geotype]
+    countries = {}
+    smartphones = []
 
-        if geotype == 'suburban':
+    for iso3, settlements in smartphone_lut.items():
+        countries[iso3] = len(smartphones)
+        row = []
+        for geotype in GEOTYPES:
             #smartphone lut only has urban-rural split, hence no suburban
-            geotype_sps = 'urban'
-        else:
-            geotype_sps = geotype
-        iso3 = region['GID_0']
-        smartphones = smartphone_lut[iso3][geotype_sps]
+            settlement = 'urban' if geotype == 'suburban' else geotype
+            if settlement in settlements:
+                row.append(settlements[settlement]['smartphone'])
+            else:
+                row.append(np.nan)
+        smartphones.append(row)
+
+    return {
+        'arpu': arpu_by_tier[:, np.newaxis] / compound_factors[np.newaxis, :],
+        'luminosity': (luminosity['high'], luminosity['medium']),
+        'networks': np.array([country_parameters['networks']['baseline' + '_' + g]
+            for g in GEOTYPES], dtype=float),
+        'countries': countries,
+        'smartphones': np.array(smartphones, dtype=float).reshape(
+            len(smartphones), len(GEOTYPES)),
+    }
+
+
+def get_demand_columns(regions, option, tables):
+    """
+    Collect the region data used by find_demand into equal-length arrays,
+    with the geotype, luminosity tier and country of each region as codes
+    into the demand tables.
+
+    Parameters
+    ----------
+    regions : list of dicts
+        Data for all regions.
+    option : dict
+        Contains the scenario and strategy.
+    tables : dict
+        Demand tables from get_demand_tables.
+
+    """
+    geotype = np.array([GEOTYPES.index(region['geotype'].split(' ')[0])
+        for region in regions], dtype=int)
 
-        revenue = []
-        demand_mbps_km2 = []
+    country = np.array([tables['countries'][region['GID_0']]
+        for region in regions], dtype=int)
 
-        scenario_per_user_capacity = get_per_user_capacity(region['geotype'], option)
+    if np.isnan(tables['smartphones'][country, geotype]).any():
+        raise KeyError('Smartphone adoption missing for a settlement type')
 
-        for timestep in timesteps:
+    mean_luminosity_km2 = np.array([region['mean_luminosity_km2']
+        for region in regions], dtype=float)
 
-            region['arpu'] = estimate_arpu(
-                region,
-                timestep,
-                global_parameters,
-                country_parameters
-            )
+    high, medium = tables['luminosity']
 
-            penetration = penetration_lut[timestep]
+    luminosity_tier = np.select([
+        mean_luminosity_km2 > high,
+        mean_luminosity_km2 > medium,
+        ], [0, 1], 2)
 
-            #cell_penetration : float
-            #Number of cell phones per member of the population.
-            region['population_with_phones'] = (
-                region['population'] * (penetration / 100))
+    per_user_capacity = np.array([get_per_user_capacity(g, option)
+        for g in GEOTYPES], dtype=float)
 
-            #phones : int
-            #Total number of phones on the network being modeled.
-            region['phones_on_network'] = (
-                region['population_with_phones'] / networks)
+    return {
+        'population': np.array([r['population'] for r in regions], dtype=float),
+        'area_km2': np.array([r['area_km2'] for r in regions], dtype=float),
+        'geotype': geotype,
+        'luminosity_tier': luminosity_tier,
+        'country': country,
+        'per_user_capacity': per_user_capacity[geotype],
+    }
 
-            #phones : int
-            #Total number of smartphones on the network being modeled.
-            region['smartphones_on_network'] = (
-                region['phones_on_network'] * smartphones['smartphone'])
 
-            # demand_mbps_km2 : float
-            # Total demand in mbps / km^2.
-            demand_mbps_km2.append(
-                (region['smartphones_on_network'] *
-                scenario_per_user_capacity / #User demand in Mbps
-                global_parameters['overbooking_factor'] /
-                region['area_km2']
-                ))
+def find_demand(columns, tables, global_parameters, timesteps,
+    penetration_lut):
+    """
+    Estimate revenue and demand for all regions and timesteps at once.
 
-            revenue.append(region['arpu'] * region['phones_on_network'])
+    Each quantity is a (regions x timesteps) matrix, computed with the
+    same operations as the per-region model, and the totals are summed
+    over timesteps in order, so results are identical.
 
-        region['total_revenue'] = round(sum(revenue))# * subsidy_factor)
-        region['revenue_km2'] = round(sum(revenue) / region['area_km2']) #* subsidy_factor / region['area_km2'])
-        region['demand_mbps_km2'] = round(sum(demand_mbps_km2) / len(demand_mbps_km2))
+    Parameters
+    ----------
+    columns : dict
+        Equal-length arrays describing each region, as produced by
+        get_demand_columns.
+    tables : dict
+        Demand tables from get_demand_tables, for the same timesteps.
+    global_parameters : dict
+        All global model parameters.
+    timesteps : list
+        All years for the assessment period.
+    penetration_lut : dict
+        Penetration (%) by year.
 
-        output.append(region)
+    Returns
+    -------
+    output : dict
+        Contains total_revenue, revenue_km2 and demand_mbps_km2 for each
+        region, and the arpu, population_with_phones, phones_on_network,
+        smartphones_on_network, revenue and demand_mbps_km2_by_timestep
+        matrices.
 
-    return output
+    """
+    area_km2 = columns['area_km2']
+    geotype = columns['geotype']
+
+    penetration = np.array([penetration_lut[timestep] for timestep in timesteps],
+        dtype=float)
+
+    #cell_penetration : float
+    #Number of cell phones per member of the population.
+    population_with_phones = (columns['population'][:, np.newaxis] *
+        (penetration / 100)[np.newaxis, :])
+
+    #phones : int
+    #Total number of phones on the network being modeled.
+    phones_on_network = (population_with_phones /
+        tables['networks'][geotype][:, np.newaxis])
+
+    #phones : int
+    #Total number of smartphones on the network being modeled.
+    smartphones_on_network = (phones_on_network *
+        tables['smartphones'][columns['country'], geotype][:, np.newaxis])
+
+    # demand_mbps_km2 : float
+    # Total demand in mbps / km^2.
+    demand_mbps_km2 = (smartphones_on_network *
+        columns['per_user_capacity'][:, np.newaxis] / #User demand in Mbps
+        global_parameters['overbooking_factor'] /
+        area_km2[:, np.newaxis])
+
+    arpu = tables['arpu'][columns['luminosity_tier']]
+
+    revenue = arpu * phones_on_network
+
+    #accumulate sums each row in order, as the built-in sum does
+    total_revenue = np.add.accumulate(revenue, axis=1)[:, -1]
+    total_demand = np.add.accumulate(demand_mbps_km2, axis=1)[:, -1]
+
+    return {
+        'total_revenue': np.round(total_revenue).astype(np.int64),
+        'revenue_km2': np.round(total_revenue / area_km2).astype(np.int64),
+        'demand_mbps_km2': np.round(total_demand / len(timesteps)).astype(np.int64),
+        'arpu': arpu,
+        'population_with_phones': population_with_phones,
+        'phones_on_network': phones_on_network,
+        'smartphones_on_network': smartphones_on_network,
+        'revenue': revenue,
+        'demand_mbps_km2_by_timestep': demand_mbps_km2,
+    }
 
 
 def get_per_user_capacity(geotype, option):
     """
+    Return the per user capacity (Mbps) of the scenario for a geotype.
 
     """
+    scenario = parse_scenario(option['scenario'])
 
     if geotype.split(' ')[0] == 'urban':
 
-        return int(option['scenario'].split('_')[1])
+        return scenario.urban
 
     elif geotype.split(' ')[0] == 'suburban':
 
-        return int(option['scenario'].split('_')[2])
+        return scenario.suburban
 
     elif geotype.split(' ')[0] == 'rural':
 
-        return int(option['scenario'].split('_')[3])
+        return scenario.rural
 
     else:
         return 'Did not recognise geotype'
@@ -172,8 +355,10 @@ def discount_arpu(arpu, timestep, global_parameters):
         The discounted revenue over the desired time period.
 
     """
-    discount_rate = global_parameters['discount_rate'] / 100
-
-    discounted_arpu = arpu / (1 + discount_rate) ** timestep
+    discounted_arpu = arpu / get_compound_factor(
+        global_parameters['discount_rate'], timestep)
 
     return discounted_arpu
+
+
+LUMINOSITY_TIERS = ['high', 'medium', 'low']
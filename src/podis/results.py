@@ -0,0 +1,357 @@
+"""
+Decile allocation and aggregation of regional results.
+
+Written by Ed Oughton.
+
+Winter 2020
+
+"""
+import os
+import numpy as np
+import pandas as pd
+
+
+DECILE_GROUP_KEYS = ['GID_0', 'scenario', 'strategy', 'confidence']
+
+DECILE_LABELS = [100, 90, 80, 70, 60, 50, 40, 30, 20, 10, 0]
+
+
+NATIONAL_KEYS = ['GID_0', 'scenario', 'strategy', 'integration', 'confidence']
+
+DECILE_KEYS = NATIONAL_KEYS + ['decile']
+
+NATIONAL_COLUMNS = [
+    'GID_0', 'scenario', 'strategy', 'integration', 'confidence', 'population',
+    'area_km2', 'population_km2', 'phones_on_network', 'smartphones_on_network',
+    'sites_estimated_total', 'existing_network_sites', 'upgraded_sites', 'new_sites',
+    'total_revenue', 'total_cost', 'cost_per_sp_user',
+]
+
+NATIONAL_COST_COLUMNS = [
+    'GID_0', 'scenario', 'strategy', 'integration','confidence', 'population',
+    'population_km2', 'phones_on_network', 'cost_per_sp_user',
+    'total_revenue', 'ran', 'backhaul_fronthaul', 'civils', 'core_network',
+    'admin_and_ops', 'acquisition_per_subscriber',
+    'spectrum_cost', 'tax', 'profit_margin', 'total_cost',
+    'available_cross_subsidy', 'deficit', 'used_cross_subsidy',
+    'required_state_subsidy',
+]
+
+DECILE_COLUMNS = [
+    'GID_0', 'scenario', 'strategy', 'integration','decile', 'confidence',
+    'population', 'area_km2', #'population_km2',
+    'phones_on_network', #'phone_density_on_network_km2',
+    'smartphones_on_network', #'sp_density_on_network_km2',
+    'sites_estimated_total', 'existing_network_sites', 'upgraded_sites', 'new_sites',
+    'total_revenue', 'total_cost', #'cost_per_sp_user',
+]
+
+DECILE_COST_COLUMNS = [
+    'GID_0', 'scenario', 'strategy', 'integration', 'decile', 'confidence',
+    'population', 'area_km2', #'population_km2',
+    'phones_on_network', #'cost_per_sp_user',
+    'total_revenue', 'ran', 'backhaul_fronthaul', 'civils', 'core_network',
+    'admin_and_ops', 'acquisition_per_subscriber', 'spectrum_cost', 'tax', 'profit_margin', 'total_cost',
+    'available_cross_subsidy', 'deficit', 'used_cross_subsidy',
+    'required_state_subsidy',
+]
+
+REGIONAL_COLUMNS = [
+    'GID_0', 'GID_id', 'scenario', 'strategy', 'integration', 'geotype', #'decile',
+    'confidence', 'population', 'area_km2', #'population_km2',
+    'phones_on_network', 'cost_per_sp_user',
+    'upgraded_sites','new_sites', 'total_revenue', 'total_cost',
+]
+
+
+def define_deciles(regions):
+    """
+    Sort regions by population density and allocate each to a decile
+    within its country, scenario, strategy and confidence interval.
+
+    """
+    groups = regions.groupby(DECILE_GROUP_KEYS, sort=False).ngroup().to_numpy()
+
+    order, codes = find_decile_codes(
+        regions['population_km2'].to_numpy(dtype=float), groups)
+
+    regions = regions.iloc[order].copy()
+
+    regions['decile'] = pd.Categorical.from_codes(codes[order],
+        categories=DECILE_LABELS, ordered=True)
+
+    return regions
+
+
+def find_decile_codes(population_km2, groups):
+    """
+    Find the population density decile of each region within its group,
+    with the same bins and labels as pd.qcut(q=11, duplicates='drop').
+
+    Regions are sorted by density once, as sort_values does, and then
+    stably by group, so each group's densities are contiguous and in
+    order. Bin edges are the same percentiles qcut uses, and each region
+    is placed by its position among them.
+
+    Parameters
+    ----------
+    population_km2 : numpy array
+        Population density of each region.
+    groups : numpy array
+        Integer group code of each region, negative for no group.
+
+    Returns
+    -------
+    order : numpy array
+        Indices of the regions sorted by population density, with missing
+        densities last.
+    codes : numpy array
+        Index into DECILE_LABELS of each region, or -1 for regions with a
+        missing density or group.
+
+    """
+    missing = np.isnan(population_km2)
+
+    index = np.arange(len(population_km2))
+    order = np.concatenate([
+        index[~missing][np.argsort(population_km2[~missing], kind='quicksort')],
+        index[missing],
+    ])
+
+    grouped = order[np.argsort(groups[order], kind='stable')]
+    grouped = grouped[groups[grouped] >= 0]
+
+    bounds = np.flatnonzero(np.diff(groups[grouped])) + 1
+
+    quantiles = np.linspace(0, 1, len(DECILE_LABELS) + 1) * 100
+
+    codes = np.full(len(population_km2), -1, dtype=int)
+
+    if len(grouped) == 0:
+        return order, codes
+
+    for members in np.split(grouped, bounds):
+
+        members = members[~missing[members]]
+        values = population_km2[members]
+
+        if len(values) == 0:
+            edges = np.array([np.nan])
+        else:
+            edges = np.unique(np.percentile(values, quantiles))
+
+        #duplicate edges are dropped, which leaves too few for the labels
+        if len(edges) != len(DECILE_LABELS) + 1:
+            raise ValueError(
+                'Bin labels must be one fewer than the number of bin edges')
+
+        bins = np.searchsorted(edges, values, side='left')
+        bins[values == edges[0]] = 1
+
+        codes[members] = bins - 1
+
+    return order, codes
+
+
+def allocate_deciles(data):
+    """
+    Define the decile of each region, and return the regions sorted by
+    population density, as define_deciles does.
+
+    """
+    group_codes = {}
+
+    groups = np.array([group_codes.setdefault(
+        tuple(region[key] for key in DECILE_GROUP_KEYS), len(group_codes))
+        for region in data], dtype=int)
+
+    population_km2 = np.array([region['population_km2'] for region in data],
+        dtype=float)
+
+    order, codes = find_decile_codes(population_km2, groups)
+
+    for region, code in zip(data, codes.tolist()):
+        region['decile'] = DECILE_LABELS[code] if code >= 0 else np.nan
+
+    return [data[i] for i in order.tolist()]
+
+
+def get_value_columns(*column_lists):
+    """
+    Return the columns to be summed for a set of outputs, in order of first
+    appearance, leaving out the group keys.
+
+    """
+    output = []
+
+    for columns in column_lists:
+        for column in columns:
+            if column not in DECILE_KEYS and column not in output:
+                output.append(column)
+
+    return output
+
+
+def aggregate_results(data):
+    """
+    Sum the regional results of a cell to the national and decile levels
+    in one grouped pass each, and select the regional outputs.
+
+    The national sums hold every column of the national and national cost
+    outputs, and the decile sums every column of the decile and decile
+    cost outputs, using the decile labels already held by each region.
+
+    This is two grouped passes rather than one. Reducing the decile sums
+    to national totals would add the regions in a different order, and as
+    pandas sums each group with compensated summation, the national
+    totals would then differ from the per-region sums in the last digits.
+    Summing the national totals over regions keeps every output the same
+    as summing it separately. The sums of all cells are grouped once more
+    by ResultsSink.close, which only combines one row per group and cell.
+
+    Parameters
+    ----------
+    data : dataframe
+        Regional results, with a decile for each region.
+
+    Returns
+    -------
+    output : dict
+        Contains the national and decile sums, and the regional results.
+
+    """
+    national = data.groupby(NATIONAL_KEYS, as_index=True)[
+        get_value_columns(NATIONAL_COLUMNS, NATIONAL_COST_COLUMNS)].sum()
+
+    #deciles are ordered from 100 to 0, as labelled by define_deciles
+    deciles = pd.Categorical(data['decile'], categories=DECILE_LABELS,
+        ordered=True)
+
+    decile = data.assign(decile=deciles).groupby(DECILE_KEYS, as_index=True,
+        observed=True)[get_value_columns(DECILE_COLUMNS, DECILE_COST_COLUMNS)].sum()
+
+    regional = data[REGIONAL_COLUMNS].copy()
+    regional['cost_per_network_user'] = (
+        regional['total_cost'] / regional['phones_on_network'])
+
+    return {
+        'national': national,
+        'decile': decile,
+        'regional': regional,
+    }
+
+
+class ResultsSink(object):
+    """
+    Write results as the regional results of each (country, option, ci)
+    cell arrive.
+
+    Regional rows are appended to the regional results file straight away,
+    and only the national and decile sums of each cell are kept until
+    close, so memory does not grow with the number of cells. Each group of
+    the national and decile results falls within a single cell, so summing
+    cell by cell gives the same totals as summing all regions at once.
+
+    Deciles are those each cell was given by allocate_deciles. The regions
+    of a country modeled in more than one run, such as CIV in the CIV and
+    SEN-MLI-CIV runs, are therefore ranked within each run rather than
+    together.
+
+    """
+    def __init__(self, folder, metric):
+        self.folder = folder
+        self.metric = metric
+        self.regional_path = os.path.join(folder,
+            'regional_results_{}.csv'.format(metric))
+        self.rows = 0
+        self.national = []
+        self.decile = []
+
+    def add(self, regions):
+        """
+        Add the regional results of a cell. Deciles are defined for the
+        cell if the regions do not already have them.
+
+        """
+        if len(regions) == 0:
+            return
+
+        data = pd.DataFrame(regions)
+
+        if 'decile' not in data.columns:
+            data = define_deciles(data)
+
+        output = aggregate_results(data)
+
+        self.national.append(output['national'])
+        self.decile.append(output['decile'])
+
+        regional_results = output['regional']
+        regional_results.index = pd.RangeIndex(self.rows,
+            self.rows + len(regional_results))
+
+        regional_results.to_csv(self.regional_path, index=True,
+            mode='a' if self.rows > 0 else 'w', header=self.rows == 0)
+
+        self.rows += len(regional_results)
+
+    def close(self):
+        """
+        Write the national and decile results of all cells.
+
+        """
+        if self.rows == 0:
+            return
+
+        national = pd.concat(self.national).groupby(
+            NATIONAL_KEYS, as_index=True).sum()
+        decile = pd.concat(self.decile).groupby(
+            DECILE_KEYS, as_index=True, observed=True).sum()
+
+        print('Writing national results')
+        national_results = national[get_value_columns(NATIONAL_COLUMNS)].copy()
+        national_results['cost_per_network_user'] = (
+            national_results['total_cost'] / national_results['phones_on_network'])
+
+        path = os.path.join(self.folder,'national_results_{}.csv'.format(self.metric))
+        national_results.to_csv(path, index=True)
+
+        print('Writing national cost composition results')
+        national_cost_results = national[
+            get_value_columns(NATIONAL_COST_COLUMNS)].copy()
+        national_cost_results['cost_per_network_user'] = (
+            national_cost_results['total_cost'] / national_cost_results['phones_on_network'])
+
+        path = os.path.join(self.folder,'national_cost_results_{}.csv'.format(self.metric))
+        national_cost_results.to_csv(path, index=True)
+
+        print('Writing general decile results')
+        decile_results = decile[get_value_columns(DECILE_COLUMNS)].copy()
+
+        decile_results['population_km2'] = (
+            decile_results['population'] / decile_results['area_km2'])
+        decile_results['phone_density_on_network_km2'] = (
+            decile_results['phones_on_network'] / decile_results['area_km2'])
+        decile_results['sp_density_on_network_km2'] = (
+            decile_results['smartphones_on_network'] / decile_results['area_km2'])
+        decile_results['sites_estimated_total_km2'] = (
+            decile_results['sites_estimated_total'] / decile_results['area_km2'])
+        decile_results['existing_network_sites_km2'] = (
+            decile_results['existing_network_sites'] / decile_results['area_km2'])
+        decile_results['cost_per_network_user'] = (
+            decile_results['total_cost'] / decile_results['phones_on_network'])
+        decile_results['cost_per_sp_user'] = (
+            decile_results['total_cost'] / decile_results['smartphones_on_network'])
+
+        path = os.path.join(self.folder,'decile_results_{}.csv'.format(self.metric))
+        decile_results.to_csv(path, index=True)
+
+        print('Writing cost decile results')
+        decile_cost_results = decile[get_value_columns(DECILE_COST_COLUMNS)].copy()
+        decile_cost_results['cost_per_network_user'] = (
+            decile_cost_results['total_cost'] / decile_cost_results['phones_on_network'])
+
+        path = os.path.join(self.folder,'decile_cost_results_{}.csv'.format(self.metric))
+        decile_cost_results.to_csv(path, index=True)
+
+        print('Regional results written to {}'.format(self.regional_path))
@@ -0,0 +1,134 @@
+"""
+Parse strategy and scenario strings.
+
+Written by Ed Oughton.
+
+Winter 2020
+
+"""
+
+STRATEGY_FIELDS = (
+    'generation',
+    'core',
+    'backhaul',
+    'sharing',
+    'networks',
+    'spectrum',
+    'tax',
+    'integration',
+)
+
+SCENARIO_FIELDS = (
+    'label',
+    'urban',
+    'suburban',
+    'rural',
+)
+
+
+class Strategy(object):
+    """
+    A strategy string split into its components.
+
+    The strategy string is defined as
+    generation_core_backhaul_sharing_networks_spectrum_tax_integration.
+    Components missing from a shorter string are None. A Strategy compares
+    and hashes equal to the string it was parsed from.
+
+    """
+    __slots__ = ('name',) + STRATEGY_FIELDS
+
+    def __init__(self, name):
+
+        self.name = name
+
+        parts = name.split('_')
+
+        for i, field in enumerate(STRATEGY_FIELDS):
+            setattr(self, field, parts[i] if i < len(parts) else None)
+
+    def __eq__(self, other):
+        if isinstance(other, Strategy):
+            return self.name == other.name
+        return self.name == other
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return 'Strategy({!r})'.format(self.name)
+
+
+class Scenario(object):
+    """
+    A scenario string split into its components.
+
+    The scenario string is defined as label_urban_suburban_rural, where
+    label selects the penetration forecast and the remaining values are
+    the per user capacity (Mbps) for each geotype. A Scenario compares and
+    hashes equal to the string it was parsed from.
+
+    """
+    __slots__ = ('name',) + SCENARIO_FIELDS
+
+    def __init__(self, name):
+
+        self.name = name
+
+        parts = name.split('_')
+
+        self.label = parts[0]
+
+        for i, field in enumerate(SCENARIO_FIELDS[1:], 1):
+            setattr(self, field, int(parts[i]) if i < len(parts) else None)
+
+    def __eq__(self, other):
+        if isinstance(other, Scenario):
+            return self.name == other.name
+        return self.name == other
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return 'Scenario({!r})'.format(self.name)
+
+
+_STRATEGIES = {}
+_SCENARIOS = {}
+
+
+def parse_strategy(strategy):
+    """
+    Return the interned Strategy for a strategy string. Strategy objects
+    are returned unchanged, so functions can accept either form.
+
+    """
+    if isinstance(strategy, Strategy):
+        return strategy
+
+    if strategy not in _STRATEGIES:
+        _STRATEGIES[strategy] = Strategy(strategy)
+
+    return _STRATEGIES[strategy]
+
+
+def parse_scenario(scenario):
+    """
+    Return the interned Scenario for a scenario string. Scenario objects
+    are returned unchanged, so functions can accept either form.
+
+    """
+    if isinstance(scenario, Scenario):
+        return scenario
+
+    if scenario not in _SCENARIOS:
+        _SCENARIOS[scenario] = Scenario(scenario)
+
+    return _SCENARIOS[scenario]
@@ -7,14 +7,15 @@ Winter 2020
 
 """
 import math
-from itertools import tee
-from operator import itemgetter
+import numpy as np
 
-from podis.costs import find_single_network_cost
+from podis.costs import (find_single_network_cost, find_network_costs,
+    get_region_columns, get_compound_factors, GEOTYPES)
+from podis.strategy import parse_strategy
 
 
 def estimate_supply(country, regions, lookup, option, global_parameters,
-    country_parameters, costs, core_lut, ci):
+    country_parameters, costs, core_lut, ci, cache=None, curves=None):
     """
     For each region, optimize the network design and estimate
     the financial cost.
@@ -40,25 +41,111 @@ def estimate_supply(country, regions, lookup, option, global_parameters,
         ???
     ci : int
         Confidence interval.
+    cache : CostComponentCache, optional
+        Cache of region-level network cost components, bound to costs and
+        core_lut, which can be shared across options.
+    curves : CapacityCurves, optional
+        Cache of capacity curves bound to lookup, which can be shared
+        across countries and options.
 
     """
+    regions = size_network(regions, lookup, option, country_parameters, ci,
+        curves)
+
+    regions = price_network(regions, option, global_parameters,
+        country_parameters, costs, core_lut, cache)
+
+    return regions
+
+
+def size_network(regions, lookup, option, country_parameters, ci,
+    curves=None, site_densities=None):
+    """
+    For each region, find the site density required to meet demand and the
+    resulting site upgrades, new sites and backhaul.
+
+    The outputs only depend on demand, the capacity lookup and the
+    generation and backhaul of the strategy, so they can be kept and re-priced
+    with price_network when only costs or financial parameters change.
+
+    Parameters
+    ----------
+    regions : list of dicts
+        Data for all regions, after demand has been estimated.
+    lookup : dict
+        A dictionary containing the lookup capacities.
+    option : dict
+        Contains the scenario and strategy.
+    country_parameters : dict
+        All country specific parameters.
+    ci : int
+        Confidence interval.
+    curves : CapacityCurves, optional
+        Cache of capacity curves bound to lookup.
+    site_densities : list, optional
+        Site density of each region, if already found with
+        solve_site_densities.
+
+    """
+    strategy = parse_strategy(option['strategy'])
+
+    if site_densities is None:
+        site_densities = find_site_densities(regions, option,
+            country_parameters, lookup, ci, curves)
+
     output_regions = []
 
-    for region in regions:
+    for region, site_density in zip(regions, site_densities):
 
-        region['site_density'] = find_site_density(region, option,
-            country_parameters, lookup, ci)
+        region['site_density'] = site_density
 
         total_sites_required = math.ceil(region['site_density'] * region['area_km2'])
 
         region = estimate_site_upgrades(
             region,
-            option['strategy'],
+            strategy,
             total_sites_required,
             country_parameters
         )
 
-        region = estimate_backhaul_upgrades(region, option['strategy'])
+        region = estimate_backhaul_upgrades(region, strategy)
+
+        region['scenario'] = option['scenario']
+        region['strategy'] = option['strategy']
+        region['confidence'] = ci
+
+        output_regions.append(region)
+
+    return output_regions
+
+
+def price_network(regions, option, global_parameters, country_parameters,
+    costs, core_lut, cache=None):
+    """
+    Estimate the financial cost of the network designed by size_network
+    for each region.
+
+    Parameters
+    ----------
+    regions : list of dicts
+        Data for all regions, after the network has been sized.
+    option : dict
+        Contains the scenario and strategy.
+    global_parameters : dict
+        All global model parameters.
+    country_parameters : dict
+        All country specific parameters.
+    costs : dict
+        All equipment costs.
+    core_lut : dict
+        Core and regional network assets by region.
+    cache : CostComponentCache, optional
+        Cache of region-level network cost components.
+
+    """
+    output_regions = []
+
+    for region in regions:
 
         region = find_single_network_cost(
             region,
@@ -67,118 +154,422 @@ def estimate_supply(country, regions, lookup, option, global_parameters,
             global_parameters,
             country_parameters,
             core_lut,
+            cache,
         )
 
+        output_regions.append(region)
+
+    return output_regions
+
+
+def estimate_supply_rollout(regions, demand_by_timestep, lookup, option,
+    global_parameters, country_parameters, costs, core_lut, ci, timesteps,
+    curves=None):
+    """
+    Size the network in every timestep and price the sites added in each
+    timestep, rather than sizing once for demand averaged over all
+    timesteps.
+
+    The network needed in each timestep is found for all regions and
+    timesteps at once and is never smaller than in the previous timestep.
+    The cumulative network of every timestep is priced in one call to
+    find_network_costs, and the cost of each timestep's additions is
+    discounted back to the base year before being summed.
+
+    The cost of a timestep's additions is the cost of its network less the
+    cost of the previous timestep's network, and is summed as it is. Core
+    and regional network costs are shared over the sites of a region, so
+    an increment can be negative, and it is then netted off the total
+    rather than clamped at zero. Undiscounted, the increments therefore
+    add up to the cost of the final network.
+
+    The new sites, upgraded sites and backhaul of each region are those of
+    the final timestep, which are the largest of any timestep. The site
+    density is the one needed for the final timestep's demand, which can
+    be lower than in an earlier timestep if demand falls.
+
+    Parameters
+    ----------
+    regions : list of dicts
+        Data for all regions, after demand has been estimated.
+    demand_by_timestep : array
+        Demand (Mbps per km^2) of each region (rows) in each timestep
+        (columns), as given by estimate_demand_by_timestep.
+    lookup : dict
+        A dictionary containing the lookup capacities.
+    option : dict
+        Contains the scenario and strategy.
+    global_parameters : dict
+        All global model parameters.
+    country_parameters : dict
+        All country specific parameters.
+    costs : dict
+        All equipment costs.
+    core_lut : dict
+        Core and regional network assets by region.
+    ci : int
+        Confidence interval.
+    timesteps : list
+        All years for the assessment period.
+    curves : CapacityCurves, optional
+        Cache of capacity curves bound to lookup.
+
+    Returns
+    -------
+    regions : list of dicts
+        Regions with the site density and site quantities of the final
+        timestep, and the discounted cost of the whole rollout.
+
+    """
+    strategy = parse_strategy(option['strategy'])
+    generation = strategy.generation
+
+    if len(regions) == 0:
+        return []
+
+    columns = get_region_columns(regions, core_lut)
+
+    networks = np.array([country_parameters['networks']['baseline' + '_' + g]
+        for g in GEOTYPES], dtype=float)[columns['geotype']]
+
+    demand = np.round(np.asarray(demand_by_timestep, dtype=float))
+
+    #densities of shape (timesteps, regions)
+    site_densities = solve_site_densities(demand.T, columns['geotype'],
+        generation, country_parameters['frequencies'][generation], lookup,
+        [ci], curves)[0]
+
+    #sites are not decommissioned once built
+    total_sites_required = np.maximum.accumulate(
+        np.ceil(site_densities * columns['area_km2']), axis=0)
+
+    existing_network_sites = np.array([region['sites_estimated_total']
+        for region in regions], dtype=float) / networks
+    existing_4G_sites = np.ceil(np.array([region['sites_4G']
+        for region in regions], dtype=float) / networks)
+
+    new_sites, upgraded_sites = estimate_site_upgrades_array(
+        total_sites_required, existing_network_sites, existing_4G_sites,
+        generation)
+
+    backhaul_new = estimate_backhaul_upgrades_array(
+        new_sites + upgraded_sites,
+        np.array([region['backhaul_fiber'] for region in regions], dtype=float),
+        np.array([region['backhaul_microwave'] for region in regions], dtype=float),
+        strategy.backhaul)
+
+    #price the cumulative network of every timestep in one call
+    periods = len(timesteps)
+    cumulative_columns = {key: np.tile(value, periods)
+        for key, value in columns.items()}
+    cumulative_columns['new_sites'] = new_sites.ravel()
+    cumulative_columns['upgraded_sites'] = upgraded_sites.ravel()
+    cumulative_columns['backhaul_new'] = backhaul_new.ravel()
+
+    cumulative_costs = find_network_costs(cumulative_columns, option, costs,
+        global_parameters, country_parameters)
+
+    compound_factors = get_compound_factors(global_parameters['discount_rate'],
+        [timestep - timesteps[0] for timestep in timesteps])
+
+    rollout_costs = {}
+    for key, value in cumulative_costs.items():
+        increments = np.diff(value.reshape(periods, len(regions)), axis=0,
+            prepend=0)
+        rollout_costs[key] = (increments /
+            compound_factors[:, np.newaxis]).sum(axis=0).tolist()
+
+    site_density = site_densities[-1].tolist()
+    new = new_sites[-1].tolist()
+    upgraded = upgraded_sites[-1].tolist()
+    backhaul = backhaul_new[-1].tolist()
+    existing = existing_network_sites.tolist()
+
+    for i, region in enumerate(regions):
+
+        region['site_density'] = site_density[i]
+        region['existing_network_sites'] = existing[i]
+        region['new_sites'] = int(new[i])
+        region['upgraded_sites'] = upgraded[i]
+        region['backhaul_new'] = backhaul[i]
+
+        for key, value in rollout_costs.items():
+            region[key] = value[i]
+
         region['scenario'] = option['scenario']
         region['strategy'] = option['strategy']
         region['confidence'] = ci
 
-        output_regions.append(region)
-
-    return output_regions
+    return regions
 
 
-def find_site_density(region, option, country_parameters, lookup, ci):
+def find_site_density(region, option, country_parameters, lookup, ci,
+    curves=None):
     """
     For a given region, provide an optmized network.
     """
-    geotype = region['geotype'].split(' ')[0]
+    return find_site_densities([region], option, country_parameters,
+        lookup, ci, curves)[0]
 
-    demand = region['demand_mbps_km2']
-    geotype = region['geotype'].split(' ')[0]
-    ant_type = 'macro'
 
-    generation = option['strategy'].split('_')[0]
+def find_site_densities(regions, option, country_parameters, lookup, ci,
+    curves=None):
+    """
+    Find the site density needed to meet demand in each region.
 
-    frequencies = country_parameters['frequencies']
+    The density-capacity curve of each geotype is taken from curves and
+    site density is found by a binary search over the curve for all
+    regions of a geotype at once.
 
-    frequencies = frequencies[generation]
+    Parameters
+    ----------
+    regions : list of dicts
+        Data for all regions, with demand_mbps_km2 and geotype.
+    option : dict
+        Contains the scenario and strategy.
+    country_parameters : dict
+        All country specific parameters.
+    lookup : dict
+        A dictionary containing the lookup capacities.
+    ci : int
+        Confidence interval.
+    curves : CapacityCurves, optional
+        Cache of capacity curves bound to lookup. A new one is used if
+        not given.
 
-    ci = str(ci)
+    Returns
+    -------
+    site_densities : list
+        Site density (sites per km^2) for each region.
 
-    unique_densities = set()
+    """
+    if curves is None:
+        curves = CapacityCurves(lookup)
+    elif curves.lookup is not lookup:
+        raise ValueError('Capacity curves are bound to a different lookup')
 
-    capacity = 0
+    generation = parse_strategy(option['strategy']).generation
+    frequencies = country_parameters['frequencies'][generation]
 
-    for item in frequencies:
+    site_densities = [None] * len(regions)
 
-        frequency = str(item['frequency'])
-        bandwidth = str(item['bandwidth'].split('x')[1])
+    by_geotype = {}
+    for i, region in enumerate(regions):
+        geotype = region['geotype'].split(' ')[0]
+        by_geotype.setdefault(geotype, []).append(i)
 
-        density_capacities = lookup_capacity(
-            lookup,
-            geotype,
-            ant_type,
-            frequency,
-            generation,
-            ci
-            )
+    for geotype, indices in by_geotype.items():
+
+        densities, capacities = curves.get(geotype, generation, ci,
+            frequencies)
+
+        demand = np.array([regions[i]['demand_mbps_km2'] for i in indices],
+            dtype=float)
+
+        answer = resolve_site_density(densities, capacities, demand)
+
+        for i, site_density in zip(indices, answer.tolist()):
+            site_densities[i] = site_density
+
+    return site_densities
+
+
+def solve_site_densities(demand, geotype, generation, frequencies, lookup,
+    confidence_intervals, curves=None):
+    """
+    Find the site density needed to meet demand for many regions,
+    scenarios and confidence intervals in one call.
+
+    Parameters
+    ----------
+    demand : array
+        Demand (Mbps per km^2), with regions along the last axis, e.g. an
+        array of shape (scenarios, regions).
+    geotype : array
+        Index of the geotype of each region in GEOTYPES.
+    generation : str
+        Technology generation, e.g. '4G'.
+    frequencies : list of dicts
+        The frequencies and bandwidths of the generation.
+    lookup : dict
+        A dictionary containing the lookup capacities.
+    confidence_intervals : list
+        Confidence intervals to solve for.
+    curves : CapacityCurves, optional
+        Cache of capacity curves bound to lookup.
+
+    Returns
+    -------
+    site_densities : array
+        Site density (sites per km^2), of shape
+        (len(confidence_intervals),) + demand.shape.
+
+    """
+    if curves is None:
+        curves = CapacityCurves(lookup)
+    elif curves.lookup is not lookup:
+        raise ValueError('Capacity curves are bound to a different lookup')
+
+    demand = np.asarray(demand, dtype=float)
+    geotype = np.asarray(geotype)
+
+    site_densities = np.empty((len(confidence_intervals),) + demand.shape)
+
+    for code in np.unique(geotype).tolist():
+
+        in_geotype = geotype == code
+        geotype_demand = demand[..., in_geotype]
+
+        for i, ci in enumerate(confidence_intervals):
+
+            densities, capacities = curves.get(GEOTYPES[code], generation,
+                ci, frequencies)
+
+            site_densities[i][..., in_geotype] = resolve_site_density(
+                densities, capacities, geotype_demand.ravel()
+                ).reshape(geotype_demand.shape)
+
+    return site_densities
+
+
+def resolve_site_density(densities, capacities, demand):
+    """
+    Find the site density at which capacity meets demand by linear
+    interpolation along a density-capacity curve.
+
+    Demand above the capacity of the densest network returns the highest
+    density and demand below the capacity of the sparsest network returns
+    the lowest density.
+
+    Parameters
+    ----------
+    densities : array
+        Site densities in ascending order.
+    capacities : array
+        Capacity (Mbps per km^2) at each density.
+    demand : array
+        Demand (Mbps per km^2) for each region.
+
+    """
+    demand = np.asarray(demand, dtype=float)
 
-        for item in density_capacities:
-            site_density, capacity = item
-            unique_densities.add(site_density)
+    if len(densities) == 1:
+        return np.full(len(demand), densities[0])
 
-    density_lut = []
+    if np.any(np.diff(capacities) < 0):
+        #capacity falls with density somewhere, so scan each curve segment
+        return np.array([scan_site_density(densities, capacities, d)
+            for d in demand.tolist()], dtype=float)
 
-    for density in list(unique_densities):
+    index = np.searchsorted(capacities, demand, side='right') - 1
+    index = np.clip(index, 0, len(capacities) - 2)
 
-        capacity = 0
+    x0 = capacities[index]
+    x1 = capacities[index + 1]
+    y0 = densities[index]
+    y1 = densities[index + 1]
 
-        for item in frequencies:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        site_density = interpolate(x0, y0, x1, y1, demand)
 
-            frequency = str(item['frequency'])
-            bandwidth = float(item['bandwidth'].split('x')[1])
+    site_density = np.where(demand >= capacities[-1], densities[-1],
+        site_density)
+    site_density = np.where(demand < capacities[0], densities[0],
+        site_density)
 
-            density_capacities = lookup_capacity(
-                lookup,
-                geotype,
-                ant_type,
-                frequency,
-                generation,
-                ci
+    return site_density
+
+
+def scan_site_density(densities, capacities, demand):
+    """
+    Find the site density for one region by scanning the curve for the
+    first segment containing demand.
+
+    """
+    if demand > capacities[-1]:
+        return densities[-1]
+
+    elif demand < capacities[0]:
+        return densities[0]
+
+    for i in range(len(densities) - 1):
+        if capacities[i] <= demand < capacities[i + 1]:
+            return interpolate(
+                capacities[i], densities[i],
+                capacities[i + 1], densities[i + 1],
+                demand
             )
 
-            for density_capacity in density_capacities:
+    return densities[-1]
 
-                if density_capacity[0] == density:
-                    capacity += density_capacity[1]
 
-        density_lut.append((density, capacity))
+class CapacityCurves(object):
+    """
+    Cache of the aggregate density-capacity curve across all frequencies
+    of a generation, for each geotype, confidence interval and set of
+    frequencies.
 
-    density_lut = sorted(density_lut, key=lambda tup: tup[0])
+    A curve sums the capacity of every frequency at each site density, and
+    is scaled by the bandwidth of the last frequency. Curves are bound to
+    one lookup, and a new cache is needed if it changes.
 
-    max_density, max_capacity = density_lut[-1]
-    min_density, min_capacity = density_lut[0]
+    """
+    __slots__ = ('lookup', 'curves')
 
-    max_capacity = max_capacity * bandwidth
-    min_capacity = min_capacity * bandwidth
+    def __init__(self, lookup):
+        self.lookup = lookup
+        self.curves = {}
 
-    if demand > max_capacity:
+    def get(self, geotype, generation, ci, frequencies, ant_type='macro'):
+        """
+        Return the densities and capacities of a curve as sorted arrays,
+        building the curve on the first request.
 
-        return max_density
+        """
+        key = (geotype, ant_type, generation, str(ci),
+            tuple((item['frequency'], item['bandwidth']) for item in frequencies))
 
-    elif demand < min_capacity:
+        if key not in self.curves:
+            self.curves[key] = build_capacity_curve(self.lookup, geotype,
+                ant_type, generation, str(ci), frequencies)
 
-        return min_density
+        return self.curves[key]
 
-    else:
 
-        for a, b in pairwise(density_lut):
+def build_capacity_curve(lookup, geotype, ant_type, generation, ci,
+    frequencies):
+    """
+    Sum the capacity of each frequency at every site density in the lookup.
+
+    """
+    totals = {}
+
+    for item in frequencies:
+
+        frequency = str(item['frequency'])
+
+        density_capacities = lookup_capacity(
+            lookup,
+            geotype,
+            ant_type,
+            frequency,
+            generation,
+            ci
+        )
+
+        for site_density, capacity in density_capacities:
+            totals[site_density] = totals.get(site_density, 0) + capacity
 
-            lower_density, lower_capacity  = a
-            upper_density, upper_capacity  = b
+    bandwidth = float(frequencies[-1]['bandwidth'].split('x')[1])
 
-            lower_capacity = lower_capacity * bandwidth
-            upper_capacity = upper_capacity * bandwidth
+    densities = np.array(sorted(totals.keys()), dtype=float)
+    capacities = np.array([totals[d] for d in densities.tolist()],
+        dtype=float) * bandwidth
 
-            if lower_capacity <= demand < upper_capacity:
+    densities.flags.writeable = False
+    capacities.flags.writeable = False
 
-                site_density = interpolate(
-                    lower_capacity, lower_density,
-                    upper_capacity, upper_density,
-                    demand
-                )
-                return site_density
+    return densities, capacities
 
 
 def lookup_capacity(lookup, environment, ant_type, frequency,
@@ -210,18 +601,6 @@ def interpolate(x0, y0, x1, y1, x):
     return y
 
 
-def pairwise(iterable):
-    """
-    Return iterable of 2-tuples in a sliding window.
-    >>> list(pairwise([1,2,3,4]))
-    [(1,2),(2,3),(3,4)]
-    """
-    a, b = tee(iterable)
-    next(b, None)
-
-    return zip(a, b)
-
-
 def estimate_site_upgrades(region, strategy, total_sites_required, country_parameters):
     """
     Estimate the number of greenfield sites and brownfield upgrades.
@@ -245,7 +624,7 @@ def estimate_site_upgrades(region, strategy, total_sites_required, country_param
         Contains all regional data.
 
     """
-    generation = strategy.split('_')[0]
+    generation = parse_strategy(strategy).generation
     geotype = region['geotype'].split(' ')[0]
 
     #get the number of networks in the area
@@ -302,7 +681,7 @@ def estimate_backhaul_upgrades(region, strategy):
         Contains all regional data.
 
     """
-    backhaul = strategy.split('_')[2]
+    backhaul = parse_strategy(strategy).backhaul
 
     all_sites = region['new_sites'] + region['upgraded_sites']
 
@@ -325,3 +704,49 @@ def estimate_backhaul_upgrades(region, strategy):
             region['backhaul_new'] = 0
 
     return region
+
+
+def estimate_site_upgrades_array(total_sites_required, existing_network_sites,
+    existing_4G_sites, generation):
+    """
+    Array form of estimate_site_upgrades, returning the number of new sites
+    and upgraded sites for each element of total_sites_required.
+
+    """
+    upgrade_4G = (generation == '4G') & (existing_4G_sites > 0)
+
+    needs_new = total_sites_required > existing_network_sites
+
+    new_sites = np.where(needs_new,
+        np.round(total_sites_required - existing_network_sites), 0)
+
+    upgraded_with_new = np.where(existing_network_sites > 0,
+        np.where(upgrade_4G, existing_network_sites - existing_4G_sites,
+        existing_network_sites), 0)
+
+    upgraded_without_new = np.where(upgrade_4G,
+        np.maximum(total_sites_required - existing_4G_sites, 0),
+        total_sites_required)
+
+    upgraded_sites = np.where(needs_new, upgraded_with_new,
+        upgraded_without_new)
+
+    return new_sites, upgraded_sites
+
+
+def estimate_backhaul_upgrades_array(all_sites, backhaul_fiber,
+    backhaul_microwave, backhaul):
+    """
+    Array form of estimate_backhaul_upgrades, returning the number of new
+    backhaul links for each element of all_sites.
+
+    """
+    if backhaul == 'fiber':
+        existing_backhaul = backhaul_fiber
+    elif backhaul == 'microwave':
+        existing_backhaul = backhaul_microwave + backhaul_fiber
+    else:
+        return np.zeros(np.shape(all_sites))
+
+    return np.where(existing_backhaul < all_sites,
+        all_sites - existing_backhaul, 0)
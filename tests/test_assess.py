@@ -1,7 +1,10 @@
 import pytest
+import numpy as np
 from podis.assess import (get_spectrum_costs, calculate_tax,
     calculate_profit, calculate_benefit_cost_ratio, assess,
-    estimate_subsidies, allocate_available_excess)
+    estimate_subsidies, allocate_available_excess, allocate_cross_subsidy,
+    get_spectrum_price_factor, get_spectrum_costs_array, assess_regions,
+    allocate_subsidies)
 
 def test_get_spectrum_costs(setup_region, setup_option, setup_global_parameters,
     setup_country_parameters):
@@ -26,6 +29,25 @@ def test_get_spectrum_costs(setup_region, setup_option, setup_global_parameters,
         setup_global_parameters, setup_country_parameters) == (
             400000 * (setup_country_parameters['financials']['spectrum_cost_low'] / 100))
 
+def test_get_spectrum_price_factor(setup_option, setup_global_parameters,
+    setup_country_parameters):
+
+    # 40 = 1 * 20 + 1 * 20 (factor = cost_mhz_pop * bw, for each band)
+    assert get_spectrum_price_factor(setup_option['strategy'],
+        setup_country_parameters) == 40
+
+    assert get_spectrum_price_factor(
+        '4G_epc_microwave_baseline_baseline_high_baseline',
+        setup_country_parameters) == 40 * (
+        setup_country_parameters['financials']['spectrum_cost_high'] / 100)
+
+    answer = get_spectrum_costs_array(np.array([10000, 2.5, 0]),
+        setup_option['strategy'], setup_global_parameters,
+        setup_country_parameters)
+
+    assert answer.tolist() == [400000, 80, 0]
+
+
 def test_calculate_tax(setup_region, setup_option, setup_country_parameters):
 
     setup_region[0]['network_cost'] = 1e6
@@ -135,6 +157,33 @@ def test_estimate_subsidies():
     assert available_cross_subsidy == 0
 
 
+def test_allocate_cross_subsidy():
+
+    total_revenue = np.array([10000, 5000, 2000, 0, 7000, 1000], dtype=float)
+    total_cost = np.array([4000, 7000, 5000, 1000, 7000, 1500], dtype=float)
+    difference = total_revenue - total_cost
+    available = np.where(difference > 0, difference, 0)
+    deficit = np.where(difference > 0, 0, np.abs(difference))
+
+    order, used, required = allocate_cross_subsidy(deficit, total_cost,
+        total_revenue, available)
+
+    #6000 available is used on deficits of 500, 1000, 2000 and 2500 of 3000
+    assert order.tolist() == [0, 4, 5, 3, 1, 2]
+    assert used.tolist() == [0, 2000, 2500, 1000, 0, 500]
+    assert required.tolist() == [0, 0, 500, 0, 0, 0]
+
+    #the same as running estimate_subsidies in order
+    available_for_cross_subsidy = available.sum()
+    for i in order.tolist():
+        region, available_for_cross_subsidy = estimate_subsidies({
+            'deficit': deficit[i],
+            'total_cost': total_cost[i],
+            'total_revenue': total_revenue[i]}, available_for_cross_subsidy)
+        assert region['used_cross_subsidy'] == used[i]
+        assert region['required_state_subsidy'] == required[i]
+
+
 def test_assess(setup_option, setup_global_parameters, setup_country_parameters):
 
     regions = [
@@ -221,6 +270,39 @@ def test_assess(setup_option, setup_global_parameters, setup_country_parameters)
     assert answer[1]['required_state_subsidy'] == 53300.0
 
 
+def test_assess_in_chunks(setup_option, setup_global_parameters,
+    setup_country_parameters):
+
+    regions = [
+        {
+            'GID_id': str(i),
+            'population': 100 * i,
+            'total_revenue': revenue,
+            'network_cost': 5000,
+            'phones_on_network': 250,
+            'smartphones_on_network': 250,
+        }
+        for i, revenue in enumerate([20000, 2500, 90000, 0, 12000, 40000])
+    ]
+
+    expected = assess('MWI', [dict(region) for region in regions],
+        setup_option, setup_global_parameters, setup_country_parameters)
+
+    #regions assessed in chunks, with subsidies allocated over all of them
+    mapped = []
+    for start in range(0, len(regions), 4):
+        mapped.extend(assess_regions(
+            [dict(region) for region in regions[start:start + 4]],
+            setup_option, setup_global_parameters, setup_country_parameters))
+
+    assert 'used_cross_subsidy' not in mapped[0]
+
+    answer = allocate_subsidies(mapped)
+
+    assert answer == expected
+    assert sum(region['used_cross_subsidy'] for region in answer) > 0
+
+
 def test_allocate_available_excess():
 
     region = {
@@ -0,0 +1,67 @@
+import pickle
+import pytest
+from podis.capacity import (CapacityLookup, compile_capacity_lookup,
+    load_capacity_lookup, capacity_lookup_is_stale)
+from podis.supply import find_site_densities
+
+
+def test_compile_capacity_lookup(tmpdir, setup_lookup):
+
+    path = str(tmpdir.join('capacity_lut'))
+
+    compile_capacity_lookup(setup_lookup, path)
+
+    answer = load_capacity_lookup(path)
+
+    assert isinstance(answer, CapacityLookup)
+    assert len(answer) == 2
+    assert set(answer) == set(setup_lookup)
+    assert ('urban', 'macro', '800', '4G', '50') in answer
+    assert ('rural', 'macro', '800', '4G', '50') not in answer
+
+    for key, value in setup_lookup.items():
+        assert [tuple(row) for row in answer[key].tolist()] == value
+
+    with pytest.raises(KeyError):
+        answer[('rural', 'macro', '800', '4G', '50')]
+
+    #pickling reopens the compiled file
+    answer = pickle.loads(pickle.dumps(answer))
+
+    assert answer[('urban', 'macro', '1800', '4G', '50')].tolist()[-1] == [2, 1000]
+
+
+def test_compiled_site_densities(tmpdir, setup_lookup, setup_option,
+    setup_country_parameters, setup_ci):
+
+    path = str(tmpdir.join('capacity_lut'))
+
+    compile_capacity_lookup(setup_lookup, path)
+    lookup = load_capacity_lookup(path)
+
+    regions = [
+        {'demand_mbps_km2': 100000, 'geotype': 'urban'},
+        {'demand_mbps_km2': 0.005, 'geotype': 'urban'},
+        {'demand_mbps_km2': 250, 'geotype': 'urban'},
+        {'demand_mbps_km2': 137, 'geotype': 'urban'},
+    ]
+
+    assert find_site_densities(regions, setup_option,
+        setup_country_parameters, lookup, setup_ci) == find_site_densities(
+        regions, setup_option, setup_country_parameters, setup_lookup,
+        setup_ci)
+
+
+def test_capacity_lookup_is_stale(tmpdir, setup_lookup):
+
+    source_path = str(tmpdir.join('capacity_lut.csv'))
+    with open(source_path, 'w') as source:
+        source.write('')
+
+    path = str(tmpdir.join('capacity_lut'))
+
+    assert capacity_lookup_is_stale(path, source_path)
+
+    compile_capacity_lookup(setup_lookup, path)
+
+    assert not capacity_lookup_is_stale(path, source_path)
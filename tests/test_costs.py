@@ -5,7 +5,13 @@ from podis.costs import (upgrade_to_3g, upgrade_to_4g,
     get_fronthaul_costs, get_backhaul_costs,
     regional_net_costs, core_costs, discount_opex,
     discount_capex_and_opex, calc_costs,
-    find_single_network_cost)
+    find_single_network_cost, get_site_classes,
+    find_network_costs, get_cost_columns, get_annuity_factors,
+    get_compound_factors, compile_asset_catalog, ASSET_CATALOG,
+    COST_TYPE, COST_CATEGORIES, INFRA_SHARING_ASSETS, SECTORIZED,
+    CostComponentCache, get_network_components, CostAccumulator,
+    find_network_cost_sensitivity, reprice_network_cost, get_backhaul_tech,
+    get_cost_structure)
 
 #test approach is to:
 #test each function which returns the cost structure
@@ -486,6 +492,102 @@ def test_greenfield_4g(setup_region, setup_option, setup_costs,
         (setup_costs['core_edge'] * 1000))
 
 
+def test_cost_component_cache(setup_region, setup_costs, setup_core_lut,
+    setup_country_parameters):
+
+    setup_region[0]['upgraded_sites'] = 1
+    setup_region[0]['new_sites'] = 1
+
+    cache = CostComponentCache(setup_costs, setup_core_lut)
+
+    strategy = '4G_epc_microwave_baseline_baseline_baseline_baseline_baseline'
+
+    answer = get_network_components(setup_region[0], strategy, setup_costs,
+        setup_core_lut, setup_country_parameters, cache)
+
+    assert answer['backhaul'] == setup_costs['microwave_small']
+    assert answer['core_edge'] == core_costs(setup_region[0], 'core_edge',
+        setup_costs, setup_core_lut, strategy, setup_country_parameters)
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    #sharing strategies reuse the same components
+    get_network_components(setup_region[0],
+        '4G_epc_microwave_moran_baseline_baseline_baseline_baseline',
+        setup_costs, setup_core_lut, setup_country_parameters, cache)
+
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    get_network_components(setup_region[0],
+        '4G_epc_fiber_baseline_baseline_baseline_baseline_baseline',
+        setup_costs, setup_core_lut, setup_country_parameters, cache)
+
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    setup_region[0]['new_sites'] = 10
+    setup_region[0]['upgraded_sites'] = 5
+    setup_region[0]['backhaul_new'] = 10
+
+    find_single_network_cost(setup_region[0], {'strategy': strategy},
+        setup_costs, {'return_period': 2, 'discount_rate': 5,
+        'opex_percentage_of_capex': 10, 'sectorization': 3,
+        'regional_integration_factor': 10}, setup_country_parameters,
+        setup_core_lut, cache)
+
+    #upgraded and greenfield sites share the components of the region
+    assert (cache.hits, cache.misses) == (3, 3)
+
+    cache.clear()
+
+    assert (cache.hits, cache.misses, cache.components) == (0, 0, {})
+
+    with pytest.raises(ValueError):
+        get_network_components(setup_region[0], strategy, dict(setup_costs),
+            setup_core_lut, setup_country_parameters, cache)
+
+
+def test_get_cost_structure(setup_region, setup_costs, setup_core_lut,
+    setup_country_parameters):
+
+    setup_region[0]['upgraded_sites'] = 1
+    setup_region[0]['new_sites'] = 1
+
+    cache = CostComponentCache(setup_costs, setup_core_lut)
+
+    strategy = '4G_epc_microwave_psb_baseline_baseline_baseline_baseline'
+
+    answer = get_cost_structure(setup_region[0], strategy, '4G',
+        'greenfield', setup_costs, setup_core_lut, setup_country_parameters,
+        cache)
+
+    assert answer == greenfield_4g(setup_region[0], strategy, setup_costs,
+        {}, setup_core_lut, setup_country_parameters)
+    assert answer['tower'] == (setup_costs['tower'] /
+        setup_country_parameters['networks']['baseline_urban'])
+    assert answer['backhaul'] == (setup_costs['microwave_small'] /
+        setup_country_parameters['networks']['baseline_urban'])
+    assert len(cache.structures) == 1
+
+    #spectrum and tax do not change the structure
+    get_cost_structure(setup_region[0],
+        '4G_epc_microwave_psb_baseline_high_high_baseline', '4G',
+        'greenfield', setup_costs, setup_core_lut, setup_country_parameters,
+        cache)
+
+    assert len(cache.structures) == 1
+
+    #the cached structure does not hold region components
+    setup_region[0]['new_sites'] = 10
+    setup_region[0]['area_km2'] = 10000
+
+    answer = get_cost_structure(setup_region[0], strategy, '4G',
+        'greenfield', setup_costs, setup_core_lut, setup_country_parameters,
+        cache)
+
+    assert answer == greenfield_4g(setup_region[0], strategy, setup_costs,
+        {}, setup_core_lut, setup_country_parameters)
+    assert len(cache.structures) == 1
+
+
 def test_backhaul_quantity():
 
     assert backhaul_quantity(2, 1) == 0
@@ -656,6 +758,49 @@ def test_discount_opex(setup_global_parameters, setup_country_parameters):
         1952 * (1 + (setup_country_parameters['financials']['wacc'] / 100)))
 
 
+def test_get_annuity_factors():
+
+    annuity_factor, wacc_factor = get_annuity_factors(2, 5, 15)
+
+    assert annuity_factor == pytest.approx(1 + 1 / 1.05)
+    assert wacc_factor == 1.15
+
+    assert get_annuity_factors(2, 5, 15) == (annuity_factor, wacc_factor)
+    assert get_annuity_factors(0, 5, 15)[0] == 0
+
+
+def test_get_compound_factors():
+
+    answer = get_compound_factors(10, [0, 1, 2])
+
+    assert list(answer) == [1, 1.1, 1.1 ** 2]
+    assert get_compound_factors(10, (0, 1, 2)) is answer
+
+    with pytest.raises(ValueError):
+        answer[0] = 2
+
+
+def test_compile_asset_catalog():
+
+    catalog = compile_asset_catalog(COST_TYPE, COST_CATEGORIES,
+        INFRA_SHARING_ASSETS)
+
+    index = catalog['index']['single_sector_antenna']
+
+    assert catalog['assets'][index] == 'single_sector_antenna'
+    assert catalog['info']['single_sector_antenna'] == (0, 0, SECTORIZED)
+    assert catalog['categories'][:, index].tolist() == [1, 0, 0, 0, 0]
+    assert catalog['sharing']['moran'][index]
+    assert not catalog['sharing']['pss'][index]
+
+    #assets only listed for sharing are catalogued without a cost type
+    assert catalog['info']['local_node'][0] == -1
+
+    #every asset belongs to at most one cost category
+    assert catalog['categories'].sum(axis=0).max() == 1
+    assert set(ASSET_CATALOG['assets']) == set(catalog['assets'])
+
+
 def test_calc_costs(setup_region, setup_global_parameters, setup_country_parameters):
 
     setup_region[0]['sites_4G'] = 0
@@ -833,6 +978,198 @@ def test_calc_costs(setup_region, setup_global_parameters, setup_country_paramet
 
     assert answer == 224.24999999999997 / 2
 
+def test_get_site_classes():
+
+    assert get_site_classes(2, 5, 3) == [
+        ('upgraded', 1, 2),
+        ('upgraded', 0, 0),
+        ('greenfield', 1, 1),
+        ('greenfield', 0, 2),
+    ]
+
+    #fractional upgrades and backhaul links are truncated, as in the site loop
+    assert get_site_classes(2.5, 4.5, 1.5) == [
+        ('upgraded', 1, 1),
+        ('upgraded', 0, 1),
+        ('greenfield', 1, 0),
+        ('greenfield', 0, 2),
+    ]
+
+    assert get_site_classes(-0.5, 0, 0) == [
+        ('upgraded', 1, 0),
+        ('upgraded', 0, 0),
+        ('greenfield', 1, 0),
+        ('greenfield', 0, 0),
+    ]
+
+
+def test_cost_accumulator():
+
+    accumulator = CostAccumulator()
+
+    assert accumulator.to_dict() == {}
+
+    accumulator.add({'ran': 1, 'backhaul_fronthaul': 2, 'civils': 3,
+        'core_network': 4, 'admin_and_ops': 5}, 10)
+    accumulator.add({'ran': 1, 'backhaul_fronthaul': 0, 'civils': 0,
+        'core_network': 0, 'admin_and_ops': 0.5})
+
+    assert accumulator.to_dict() == {'ran': 11, 'backhaul_fronthaul': 20,
+        'civils': 30, 'core_network': 40, 'admin_and_ops': 50.5}
+
+    accumulator = CostAccumulator(['a'])
+    accumulator.add({'a': 2, 'b': 3}, 2)
+
+    assert accumulator.to_dict() == {'a': 4}
+
+
+def test_find_single_network_cost(setup_region, setup_costs,
+    setup_global_parameters, setup_country_parameters, setup_core_lut):
+
+    setup_region[0]['new_sites'] = 7
+    setup_region[0]['upgraded_sites'] = 5
+    setup_region[0]['backhaul_new'] = 8
+
+    strategy = '4G_epc_microwave_baseline_baseline_baseline_baseline_baseline'
+
+    answer = find_single_network_cost(
+        dict(setup_region[0]),
+        {'strategy': strategy},
+        setup_costs,
+        setup_global_parameters,
+        setup_country_parameters,
+        setup_core_lut
+    )
+
+    #compare against pricing every site individually
+    expected = 0
+    for i in range(1, 12 + 1):
+        if i <= 5:
+            cost_structure = upgrade_to_4g(setup_region[0], strategy,
+                setup_costs, setup_global_parameters,
+                setup_core_lut, setup_country_parameters)
+        else:
+            cost_structure = greenfield_4g(setup_region[0], strategy,
+                setup_costs, setup_global_parameters,
+                setup_core_lut, setup_country_parameters)
+        total_cost, _ = calc_costs(setup_region[0], strategy, cost_structure,
+            backhaul_quantity(i, 8), setup_global_parameters,
+            setup_country_parameters)
+        expected += total_cost
+
+    assert answer['network_cost'] == pytest.approx(expected)
+    assert answer['network_cost'] == pytest.approx(sum(answer[k] for k in
+        ['ran', 'backhaul_fronthaul', 'civils', 'core_network', 'admin_and_ops']))
+
+    setup_region[0]['new_sites'] = 0
+    setup_region[0]['upgraded_sites'] = 0
+    setup_region[0]['backhaul_new'] = 0
+
+    answer = find_single_network_cost(
+        dict(setup_region[0]),
+        {'strategy': strategy},
+        setup_costs,
+        setup_global_parameters,
+        setup_country_parameters,
+        setup_core_lut
+    )
+
+    assert answer['network_cost'] == 0
+
+def test_find_network_cost_sensitivity(setup_region, setup_costs,
+    setup_global_parameters, setup_country_parameters, setup_core_lut):
+
+    setup_region[0]['new_sites'] = 7
+    setup_region[0]['upgraded_sites'] = 5
+    setup_region[0]['backhaul_new'] = 8
+
+    option = {'strategy': '4G_epc_microwave_baseline_baseline_baseline_baseline_baseline'}
+
+    sensitivity = find_network_cost_sensitivity(setup_region[0], option,
+        setup_costs, setup_global_parameters, setup_country_parameters,
+        setup_core_lut)
+
+    #7 greenfield towers, each a capex item
+    assert sensitivity['civils']['tower'] == 7
+    assert sensitivity['backhaul_fronthaul'] == {
+        'microwave_small': 8 * (1 + 0.1 * (1 + 1 / 1.05)) * 1.15}
+    assert 'site_rental_urban' in sensitivity['civils']
+    #regional assets are not priced with microwave backhaul
+    assert 'regional_node_epc' not in sensitivity['core_network']
+
+    expected = find_single_network_cost(dict(setup_region[0]), option,
+        setup_costs, setup_global_parameters, setup_country_parameters,
+        setup_core_lut)
+
+    answer = reprice_network_cost(sensitivity, setup_costs)
+
+    assert answer['network_cost'] == pytest.approx(expected['network_cost'], rel=1e-3)
+
+    new_costs = dict(setup_costs)
+    new_costs['tower'] = 20000
+    new_costs['microwave_small'] = 5000
+
+    expected = find_single_network_cost(dict(setup_region[0]), option,
+        new_costs, setup_global_parameters, setup_country_parameters,
+        setup_core_lut)
+
+    answer = reprice_network_cost(sensitivity, new_costs)
+
+    assert answer['civils'] == pytest.approx(expected['civils'], rel=1e-3)
+    assert answer['network_cost'] == pytest.approx(expected['network_cost'], rel=1e-3)
+
+
+def test_get_backhaul_tech(setup_region, setup_core_lut):
+
+    assert get_backhaul_tech(setup_region[0], 'microwave',
+        setup_core_lut) == ('microwave_small', 1)
+    assert get_backhaul_tech(setup_region[0], 'fiber',
+        setup_core_lut) == ('fiber_urban_m', 250)
+    assert get_backhaul_tech(setup_region[0], 'satellite',
+        setup_core_lut) == (None, 0)
+
+
+def test_find_network_costs(setup_region, setup_costs,
+    setup_global_parameters, setup_country_parameters, setup_core_lut):
+
+    regions = []
+    for geotype, new_sites, upgraded_sites, backhaul_new in [
+        ('urban', 7, 5, 8),
+        ('suburban 1', 0, 3.5, 0),
+        ('rural 3', 20, 0, 20),
+        ('rural 3', 0, 0, 0),
+        ]:
+        region = dict(setup_region[0])
+        region['geotype'] = geotype
+        region['new_sites'] = new_sites
+        region['upgraded_sites'] = upgraded_sites
+        region['backhaul_new'] = backhaul_new
+        regions.append(region)
+
+    columns = get_cost_columns(regions, setup_core_lut)
+
+    assert list(columns['geotype']) == [0, 1, 2, 2]
+    assert list(columns['nodes']) == [8, 8, 8, 8]
+
+    for strategy in [
+        '4G_epc_microwave_baseline_baseline_baseline_baseline_baseline',
+        '3G_epc_fiber_pss_baseline_baseline_baseline_baseline',
+        '4G_epc_fiber_cns_srn_baseline_baseline_baseline',
+        ]:
+
+        answer = find_network_costs(columns, {'strategy': strategy},
+            setup_costs, setup_global_parameters, setup_country_parameters)
+
+        for i, region in enumerate(regions):
+            expected = find_single_network_cost(dict(region),
+                {'strategy': strategy}, setup_costs,
+                setup_global_parameters, setup_country_parameters,
+                setup_core_lut)
+
+            for key in ['ran', 'backhaul_fronthaul', 'civils',
+                'core_network', 'admin_and_ops', 'network_cost']:
+                assert answer[key][i] == pytest.approx(expected.get(key, 0))
+
 # # # def test_find_single_network_cost(setup_region, setup_costs,
 # # #     setup_global_parameters, setup_country_parameters,
 # # #     setup_backhaul_lut, setup_core_lut):
@@ -1,6 +1,7 @@
 import pytest
 from podis.demand import (estimate_demand, get_per_user_capacity,
-    estimate_arpu, discount_arpu)
+    estimate_arpu, discount_arpu, get_demand_tables, get_demand_columns,
+    find_demand)
 
 
 def test_estimate_demand(
@@ -76,6 +77,67 @@ def test_estimate_demand(
     assert answer == []
 
 
+def test_find_demand(
+    setup_region,
+    setup_option,
+    setup_global_parameters,
+    setup_country_parameters,
+    ):
+
+    regions = [dict(setup_region[0]), dict(setup_region[0])]
+    regions[1]['geotype'] = 'rural 1'
+    regions[1]['mean_luminosity_km2'] = 0
+
+    smartphone_lut = {'MWI': {
+        'urban': {'smartphone': 0.5},
+        'rural': {'smartphone': 0.2},
+    }}
+
+    timesteps = [2020, 2021, 2022]
+    penetration_lut = {2020: 50, 2021: 60, 2022: 70}
+
+    tables = get_demand_tables(setup_global_parameters,
+        setup_country_parameters, timesteps, smartphone_lut)
+
+    assert tables['arpu'].shape == (3, 3)
+    assert tables['smartphones'].tolist() == [[0.5, 0.5, 0.2]]
+
+    columns = get_demand_columns(regions, setup_option, tables)
+
+    assert columns['geotype'].tolist() == [0, 2]
+    assert columns['luminosity_tier'].tolist() == [0, 2]
+
+    answer = find_demand(columns, tables, setup_global_parameters,
+        timesteps, penetration_lut)
+
+    assert answer['phones_on_network'].shape == (2, 3)
+
+    #the matrix matches the region by region model in every timestep
+    for i, timestep in enumerate(timesteps):
+        expected = estimate_demand([dict(region) for region in regions],
+            setup_option, setup_global_parameters, setup_country_parameters,
+            [timestep], penetration_lut, smartphone_lut)
+        for j in range(2):
+            assert answer['phones_on_network'][j, i] == expected[j]['phones_on_network']
+            assert answer['arpu'][j, i] == expected[j]['arpu']
+            assert answer['demand_mbps_km2_by_timestep'][j, i] == pytest.approx(
+                expected[j]['demand_mbps_km2'], abs=0.5)
+
+    expected = estimate_demand([dict(region) for region in regions],
+        setup_option, setup_global_parameters, setup_country_parameters,
+        timesteps, penetration_lut, smartphone_lut)
+
+    assert answer['total_revenue'].tolist() == [r['total_revenue'] for r in expected]
+    assert answer['total_revenue'][1] == round(sum(
+        2 / 1.05 ** t * 10000 * p / 100 / 2 for t, p in [(0, 50), (1, 60), (2, 70)]))
+
+    #a settlement type missing from the smartphone lut cannot be looked up
+    with pytest.raises(KeyError):
+        get_demand_columns(regions, setup_option, get_demand_tables(
+            setup_global_parameters, setup_country_parameters, timesteps,
+            {'MWI': {'urban': {'smartphone': 0.5}}}))
+
+
 def test_get_per_user_capacity():
 
     answer = get_per_user_capacity('urban', {'scenario': 'S1_25_5_1'})
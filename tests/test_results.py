@@ -0,0 +1,229 @@
+import pytest
+import numpy as np
+import pandas as pd
+from podis.results import (define_deciles, find_decile_codes,
+    allocate_deciles, aggregate_results, ResultsSink, DECILE_GROUP_KEYS, DECILE_LABELS,
+    NATIONAL_COLUMNS, NATIONAL_COST_COLUMNS, DECILE_COLUMNS,
+    DECILE_COST_COLUMNS, REGIONAL_COLUMNS, NATIONAL_KEYS, DECILE_KEYS)
+
+
+def qcut_deciles(regions):
+    """
+    Deciles from pd.qcut applied to each group of the sorted regions.
+
+    """
+    regions = regions.sort_values(by='population_km2', ascending=True)
+
+    deciles = pd.Series(np.nan, index=regions.index)
+
+    for _, group in regions.groupby(DECILE_GROUP_KEYS):
+        deciles.loc[group.index] = np.asarray(pd.qcut(group['population_km2'],
+            q=11, precision=0, labels=DECILE_LABELS,
+            duplicates='drop')).astype(float)
+
+    regions['decile'] = deciles
+
+    return regions
+
+
+@pytest.fixture
+def setup_results_regions():
+
+    rng = np.random.default_rng(0)
+
+    count = 600
+
+    regions = pd.DataFrame({
+        'GID_0': rng.choice(['CIV', 'MLI', 'SEN'], count),
+        'scenario': rng.choice(['low_10_2_1', 'high_50_20_5'], count),
+        'strategy': '4G_epc_wireless_baseline_baseline_baseline_baseline_baseline',
+        'confidence': rng.choice([5, 50], count),
+        'population_km2': np.round(rng.random(count) * 500),
+        'id': np.arange(count),
+    })
+
+    #densities are rounded, so there are ties, and some are missing
+    regions.loc[[3, 100, 250], 'population_km2'] = np.nan
+
+    return regions
+
+
+def test_find_decile_codes(setup_results_regions):
+
+    regions = setup_results_regions
+
+    expected = qcut_deciles(regions.copy())
+
+    groups = regions.groupby(DECILE_GROUP_KEYS, sort=False).ngroup().to_numpy()
+
+    assert len(np.unique(groups)) == 12
+
+    order, codes = find_decile_codes(
+        regions['population_km2'].to_numpy(dtype=float), groups)
+
+    #regions are ordered as sort_values orders them
+    assert order.tolist() == expected['id'].tolist()
+
+    deciles = np.where(codes >= 0,
+        np.array(DECILE_LABELS)[codes], np.nan)[order]
+
+    assert np.array_equal(deciles, expected['decile'].to_numpy(), equal_nan=True)
+    assert np.isnan(deciles[-3:]).all()
+
+    #groups too small to fill the labels are left to qcut's linear bins
+    small = regions.iloc[:3].assign(GID_0='KEN', scenario='low_10_2_1',
+        confidence=50, population_km2=[7., 1., 4.])
+
+    answer = define_deciles(small.copy())
+
+    assert answer['decile'].tolist() == qcut_deciles(small.copy())['decile'].tolist()
+    assert answer['decile'].tolist() == [100, 50, 0]
+
+
+def test_find_decile_codes_duplicate_edges(setup_results_regions):
+
+    regions = setup_results_regions
+
+    #a single region, or many equal densities, leave duplicate edges which
+    #are dropped, so there are too few bins for the labels
+    for population_km2 in [[10.], [1., 1., 1., 1., 1., 1., 2.]]:
+
+        group = regions.iloc[:len(population_km2)].assign(GID_0='KEN',
+            scenario='low_10_2_1', confidence=50,
+            population_km2=population_km2)
+
+        with pytest.raises(ValueError):
+            qcut_deciles(group.copy())
+
+        with pytest.raises(ValueError):
+            define_deciles(pd.concat([regions, group]))
+
+        with pytest.raises(ValueError):
+            allocate_deciles(group.to_dict('records'))
+
+
+def test_allocate_deciles(setup_results_regions):
+
+    regions = setup_results_regions
+
+    expected = define_deciles(regions.copy())
+
+    assert isinstance(expected['decile'].dtype, pd.CategoricalDtype)
+
+    answer = allocate_deciles(regions.to_dict('records'))
+
+    assert [region['id'] for region in answer] == expected['id'].tolist()
+    assert np.array_equal(
+        np.array([region['decile'] for region in answer], dtype=float),
+        np.asarray(expected['decile']).astype(float), equal_nan=True)
+
+
+def get_cell(iso3, integration, seed):
+    """
+    Fake regional results of one cell, with deciles allocated as run_cell
+    allocates them.
+
+    """
+    rng = np.random.default_rng(seed)
+
+    columns = set(NATIONAL_COLUMNS + NATIONAL_COST_COLUMNS + DECILE_COLUMNS +
+        DECILE_COST_COLUMNS + REGIONAL_COLUMNS) - {'decile'}
+
+    regions = []
+
+    for i in range(40):
+        region = {column: float(rng.random() * 1000) for column in columns}
+        region.update({
+            'GID_0': iso3,
+            'GID_id': '{}.{}'.format(iso3, i),
+            'scenario': 'low_10_2_1',
+            'strategy': '4G_epc_wireless_baseline_baseline_baseline_baseline_baseline',
+            'integration': integration,
+            'confidence': 50,
+            'geotype': 'urban',
+            'new_sites': int(rng.integers(10)),
+        })
+        regions.append(region)
+
+    return allocate_deciles(regions)
+
+
+def test_results_sink(tmp_path):
+
+    #CIV is in both the CIV and the SEN-MLI-CIV runs
+    cells = [
+        get_cell('CIV', 'baseline', 0),
+        get_cell('MLI', 'baseline', 1),
+        get_cell('CIV', 'integration', 2),
+    ]
+
+    names = ['national_results_m.csv', 'national_cost_results_m.csv',
+        'decile_results_m.csv', 'decile_cost_results_m.csv',
+        'regional_results_m.csv']
+
+    streamed = tmp_path / 'streamed'
+    streamed.mkdir()
+    sink = ResultsSink(str(streamed), 'm')
+    for cell in cells:
+        sink.add([dict(region) for region in cell])
+    sink.close()
+
+    one_shot = tmp_path / 'one_shot'
+    one_shot.mkdir()
+    sink = ResultsSink(str(one_shot), 'm')
+    sink.add([dict(region) for cell in cells for region in cell])
+    sink.close()
+
+    for name in names:
+        assert (streamed / name).read_text() == (one_shot / name).read_text()
+
+    deciles = pd.read_csv(streamed / 'decile_results_m.csv')
+
+    #deciles are written from 100 to 0 within each group
+    for _, group in deciles.groupby(['GID_0', 'integration'], sort=False):
+        assert group['decile'].tolist() == sorted(group['decile'], reverse=True)
+
+    #deciles recomputed over the whole decision option rank the CIV regions
+    #of both runs together, while each cell ranks its own
+    pooled = tmp_path / 'pooled'
+    pooled.mkdir()
+    sink = ResultsSink(str(pooled), 'm')
+    sink.add([{key: value for key, value in region.items() if key != 'decile'}
+        for cell in cells for region in cell])
+    sink.close()
+
+    for name in names[:2]:
+        assert (streamed / name).read_text() == (pooled / name).read_text()
+
+    pooled = pd.read_csv(pooled / 'decile_results_m.csv')
+
+    mli = deciles['GID_0'] == 'MLI'
+    assert deciles[mli].reset_index(drop=True).equals(
+        pooled[pooled['GID_0'] == 'MLI'].reset_index(drop=True))
+    assert not deciles[~mli].reset_index(drop=True).equals(
+        pooled[pooled['GID_0'] != 'MLI'].reset_index(drop=True))
+
+
+def test_aggregate_results():
+
+    data = pd.DataFrame(get_cell('CIV', 'baseline', 3) +
+        get_cell('MLI', 'baseline', 4))
+
+    data = define_deciles(data.drop(columns='decile'))
+
+    answer = aggregate_results(data)
+
+    #each output matches its own groupby over the regions, as the results
+    #were summed before they were streamed
+    for output, columns, keys in [
+        ('national', NATIONAL_COLUMNS, NATIONAL_KEYS),
+        ('national', NATIONAL_COST_COLUMNS, NATIONAL_KEYS),
+        ('decile', DECILE_COLUMNS, DECILE_KEYS),
+        ('decile', DECILE_COST_COLUMNS, DECILE_KEYS),
+        ]:
+        expected = data[columns].groupby(keys, as_index=True,
+            observed=True).sum()
+        assert answer[output][list(expected.columns)].equals(expected)
+
+    assert answer['regional']['cost_per_network_user'].tolist() == (
+        data['total_cost'] / data['phones_on_network']).tolist()
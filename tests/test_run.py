@@ -0,0 +1,445 @@
+import os
+import sys
+import copy
+import random
+import pytest
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import run
+from podis.supply import estimate_supply, find_site_densities
+from podis.assess import assess
+
+
+@pytest.fixture
+def setup_supply_inputs(
+    setup_region,
+    setup_lookup,
+    setup_option,
+    setup_global_parameters,
+    setup_country_parameters,
+    setup_costs,
+    setup_core_lut,
+    setup_ci,
+    ):
+
+    setup_region[0]['sites_estimated_total'] = 10
+    setup_region[0]['sites_4G'] = 0
+    setup_region[0]['backhaul_fiber'] = 0
+    setup_region[0]['backhaul_copper'] = 0
+    setup_region[0]['backhaul_microwave'] = 0
+    setup_region[0]['backhaul_satellite'] = 0
+
+    return {
+        'regions': setup_region,
+        'lookup': setup_lookup,
+        'option': setup_option,
+        'global_parameters': setup_global_parameters,
+        'country_parameters': setup_country_parameters,
+        'costs': setup_costs,
+        'core_lut': setup_core_lut,
+        'ci': setup_ci,
+        'lookup_fingerprint': ['capacity_lut_by_frequency.csv', 100, 1.0],
+    }
+
+
+def run_supply(inputs, path):
+    """
+    Run estimate_supply_incremental with keys found from the inputs.
+
+    """
+    sizing_key, cost_key = run.get_supply_keys(
+        'MWI',
+        inputs['option'],
+        inputs['ci'],
+        [2020],
+        inputs['global_parameters'],
+        inputs['country_parameters'],
+        inputs['costs'],
+        {2020: 50},
+        {'MWI': {'urban': {'smartphone': 0.5}}},
+        ['regional_data.csv', 100, 1.0],
+        inputs['lookup_fingerprint'],
+        ['core_lut.csv', 100, 1.0],
+    )
+
+    return run.estimate_supply_incremental(
+        [dict(region) for region in inputs['regions']],
+        inputs['lookup'],
+        inputs['option'],
+        inputs['global_parameters'],
+        inputs['country_parameters'],
+        inputs['costs'],
+        inputs['core_lut'],
+        inputs['ci'],
+        None,
+        None,
+        sizing_key,
+        cost_key,
+        path,
+    )
+
+
+def test_estimate_supply_incremental(setup_supply_inputs, tmp_path,
+    monkeypatch):
+
+    calls = {'size': 0, 'price': 0}
+
+    size_network = run.size_network
+    price_network = run.price_network
+
+    def count_size_network(*args, **kwargs):
+        calls['size'] += 1
+        return size_network(*args, **kwargs)
+
+    def count_price_network(*args, **kwargs):
+        calls['price'] += 1
+        return price_network(*args, **kwargs)
+
+    monkeypatch.setattr(run, 'size_network', count_size_network)
+    monkeypatch.setattr(run, 'price_network', count_price_network)
+
+    path = str(tmp_path / 'supply_state' / 'supply.pkl')
+
+    first = run_supply(setup_supply_inputs, path)
+
+    assert calls == {'size': 1, 'price': 1}
+    assert os.path.exists(path)
+
+    #identical inputs reuse the persisted sizing and costs
+    answer = run_supply(setup_supply_inputs, path)
+
+    assert calls == {'size': 1, 'price': 1}
+    for key in run.SIZING_COLUMNS + run.COST_COLUMNS:
+        assert answer[0][key] == first[0][key]
+
+    #a change to any input of price_network re-prices the sized network
+    changes = [
+        ('costs', 'single_sector_antenna', 3000),
+        ('global_parameters', 'sectorization', 2),
+    ]
+
+    for name, key, value in changes:
+
+        inputs = copy.deepcopy(setup_supply_inputs)
+        inputs[name][key] = value
+
+        before = dict(calls)
+        answer = run_supply(inputs, path)
+
+        assert calls == {'size': before['size'], 'price': before['price'] + 1}
+        assert answer[0]['network_cost'] != first[0]['network_cost']
+
+    inputs = copy.deepcopy(setup_supply_inputs)
+    inputs['country_parameters']['financials']['wacc'] = 5
+
+    before = dict(calls)
+    run_supply(inputs, path)
+
+    assert calls == {'size': before['size'], 'price': before['price'] + 1}
+
+    #a change to an input of size_network sizes and prices the network again
+    inputs = copy.deepcopy(setup_supply_inputs)
+    inputs['lookup_fingerprint'] = ['capacity_lut_by_frequency.csv', 200, 2.0]
+
+    before = dict(calls)
+    run_supply(inputs, path)
+
+    assert calls == {'size': before['size'] + 1, 'price': before['price'] + 1}
+
+    inputs = copy.deepcopy(setup_supply_inputs)
+    inputs['country_parameters']['networks']['baseline_urban'] = 3
+
+    before = dict(calls)
+    run_supply(inputs, path)
+
+    assert calls == {'size': before['size'] + 1, 'price': before['price'] + 1}
+
+
+def get_regions(inputs):
+    """
+    Twenty regions with random sites, demand and revenue, each with its
+    own entries in the core lookup.
+
+    """
+    random.seed(1)
+
+    gid_id = inputs['regions'][0]['GID_id']
+
+    regions = []
+    for i in range(20):
+        region = dict(inputs['regions'][0])
+        region.update({
+            'GID_id': '{}.{}'.format(gid_id, i),
+            'sites_estimated_total': random.randint(0, 50),
+            'demand_mbps_km2': random.uniform(0, 3000),
+            'total_revenue': random.randint(0, 10**6),
+            'phones_on_network': 100,
+            'smartphones_on_network': 50,
+        })
+        regions.append(region)
+
+        #persisted state is keyed by GID_id, so each region needs its own
+        for asset in inputs['core_lut'].values():
+            for source in ['new', 'existing']:
+                asset['{}_{}'.format(region['GID_id'], source)] = asset[
+                    '{}_{}'.format(gid_id, source)]
+
+    return regions
+
+
+def test_map_reduce_regions(setup_supply_inputs, tmp_path, monkeypatch,
+    capsys):
+
+    inputs = setup_supply_inputs
+
+    regions = get_regions(inputs)
+
+    global_parameters = dict(inputs['global_parameters'], region_workers=2)
+
+    expected = assess('MWI', estimate_supply('MWI', copy.deepcopy(regions),
+        inputs['lookup'], inputs['option'], global_parameters,
+        inputs['country_parameters'], inputs['costs'], inputs['core_lut'],
+        inputs['ci']), inputs['option'], global_parameters,
+        inputs['country_parameters'])
+
+    site_densities = find_site_densities(regions, inputs['option'],
+        inputs['country_parameters'], inputs['lookup'], inputs['ci'])
+
+    path = str(tmp_path / 'supply_state' / 'supply.pkl')
+
+    def map_reduce(executor, region_workers):
+        return run.map_reduce_regions(executor, copy.deepcopy(regions),
+            site_densities, inputs['lookup'], inputs['option'],
+            dict(global_parameters, region_workers=region_workers),
+            inputs['country_parameters'], inputs['costs'],
+            inputs['core_lut'], inputs['ci'], 'sizing', 'cost', path, 'MWI')
+
+    with ProcessPoolExecutor(2) as executor:
+        answer = map_reduce(executor, 2)
+
+    assert answer == expected
+
+    #the chunks share the cell's supply state, which is reported once
+    assert os.listdir(str(tmp_path / 'supply_state')) == ['supply.pkl']
+    assert capsys.readouterr().out == 'Sizing network\nPricing network\n'
+
+    calls = []
+    monkeypatch.setattr(run, 'size_network', lambda *args: calls.append(args))
+    monkeypatch.setattr(run, 'price_network', lambda *args: calls.append(args))
+    monkeypatch.setattr(run, 'WORKER_CACHES', {})
+
+    #the state is reused when the regions are split differently
+    with ThreadPoolExecutor(3) as executor:
+        answer = map_reduce(executor, 3)
+
+    assert calls == []
+    assert answer == expected
+    assert capsys.readouterr().out == (
+        'Reusing sized network\nReusing network costs\n')
+
+    #the chunks of a worker share one cache for a cache key
+    assert list(run.WORKER_CACHES.keys()) == ['MWI']
+
+    #and by a cell run in one process
+    answer = run.estimate_supply_incremental(copy.deepcopy(regions),
+        inputs['lookup'], inputs['option'], global_parameters,
+        inputs['country_parameters'], inputs['costs'], inputs['core_lut'],
+        inputs['ci'], None, None, 'sizing', 'cost', path, site_densities)
+
+    assert calls == []
+    assert assess('MWI', answer, inputs['option'], global_parameters,
+        inputs['country_parameters']) == expected
+
+
+def test_run_cells(setup_supply_inputs, tmp_path, monkeypatch):
+
+    inputs = setup_supply_inputs
+
+    regions = get_regions(inputs)
+
+    #deciles need distinct densities
+    for i, region in enumerate(regions):
+        region['population_km2'] = 100 * (i + 1)
+
+    global_parameters = dict(inputs['global_parameters'], rollout=False,
+        region_workers=2)
+
+    site_densities = find_site_densities(regions, inputs['option'],
+        inputs['country_parameters'], inputs['lookup'], inputs['ci'])
+
+    strategy = inputs['option']['strategy']
+
+    options = [
+        {'scenario': 'S1_50_50_50', 'strategy': strategy},
+        {'scenario': 'S1_50_50_50', 'strategy': strategy.replace('microwave', 'fiber')},
+        {'scenario': 'S1_25_50_50', 'strategy': strategy},
+    ]
+
+    def get_cells(folder, region_executor=None):
+        for i, option in enumerate(options):
+            yield ({'iso3': 'MWI'}, copy.deepcopy(regions), site_densities,
+                None, inputs['lookup'], option, global_parameters,
+                inputs['country_parameters'], inputs['costs'],
+                inputs['core_lut'], inputs['ci'], [2020], 'sizing', 'cost',
+                str(tmp_path / folder / 'supply_{}.pkl'.format(i)), None, None,
+                region_executor, 'MWI')
+
+    names = ['national_results_m.csv', 'national_cost_results_m.csv',
+        'decile_results_m.csv', 'decile_cost_results_m.csv',
+        'regional_results_m.csv']
+
+    def run_cells(folder, executor, cells):
+        (tmp_path / folder).mkdir()
+        sink = run.ResultsSink(str(tmp_path / folder), 'm')
+        run.run_cells(executor, cells, sink)
+        sink.close()
+
+    run_cells('serial', None, get_cells('serial'))
+
+    with ProcessPoolExecutor(2) as executor:
+        run_cells('parallel', executor, get_cells('parallel'))
+
+    #cells can also share their regions between workers
+    monkeypatch.setattr(run, 'WORKER_CACHES', {})
+
+    with ThreadPoolExecutor(2) as executor:
+        run_cells('regions', None, get_cells('regions', executor))
+
+    #results of cells run by workers are added in the order they were given
+    for folder in ['serial', 'parallel', 'regions']:
+        regional = pd.read_csv(tmp_path / folder / 'regional_results_m.csv')
+        cells = regional[['scenario', 'strategy']].drop_duplicates()
+        assert cells.to_dict('records') == options
+
+    for name in names:
+        expected = (tmp_path / 'serial' / name).read_text()
+        assert (tmp_path / 'parallel' / name).read_text() == expected
+        assert (tmp_path / 'regions' / name).read_text() == expected
+
+
+@pytest.fixture
+def setup_country_inputs(tmp_path, monkeypatch):
+
+    base_path = tmp_path / 'data'
+
+    monkeypatch.setattr(run, 'BASE_PATH', str(base_path))
+    monkeypatch.setattr(run, 'DATA_RAW', str(base_path / 'raw'))
+    monkeypatch.setattr(run, 'DATA_INTERMEDIATE', str(base_path / 'intermediate'))
+
+    files = {
+        tmp_path / 'vis' / 'clustering' / 'results' / 'data_clustering_results.csv': [
+            'ISO_3digit,cluster',
+            'MWI,C1',
+        ],
+        base_path / 'raw' / 'wb_smartphone_survey' / 'wb_smartphone_survey.csv': [
+            'iso3,cluster,Settlement,Basic,Feature,Smartphone',
+            'MWI,C1,Urban,20,30,50',
+            'MWI,C1,Rural,40,40,20',
+        ],
+        base_path / 'intermediate' / 'MWI' / 'core_lut.csv': [
+            'GID_id,asset,source,value',
+            'MWI.1_1,core_edge,new,1000',
+            'MWI.1_1,core_node,new,2',
+        ],
+        base_path / 'intermediate' / 'MWI' / 'regional_data.csv': [
+            'GID_0,GID_id,population,area_km2,population_km2,mean_luminosity_km2',
+            'MWI,MWI.1_1,60000,10,6000,10',
+            'MWI,MWI.2_1,1000,10,100,0',
+        ],
+        base_path / 'intermediate' / 'MWI' / 'subscriptions' / 'subs_forecast.csv': [
+            'scenario,year,penetration',
+            'S1,2020,50',
+            'S1,2021,60',
+        ],
+    }
+
+    for path, lines in files.items():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('\n'.join(lines) + '\n')
+
+    return run.CountryInputs({'iso3': 'MWI'})
+
+
+def test_country_inputs(setup_country_inputs):
+
+    inputs = setup_country_inputs
+
+    regions = inputs.get_regions()
+
+    assert [region['geotype'] for region in regions] == ['urban', 'rural 3']
+
+    #changes to the copies handed out are not seen by later handouts
+    regions[0]['population'] = 0
+    regions.append({'GID_id': 'MWI.3_1'})
+
+    assert [region['population'] for region in inputs.get_regions()] == [60000, 1000]
+
+    penetration_lut = inputs.get_penetration('S1_50_50_50')
+    assert penetration_lut == {2020: 50, 2021: 60}
+
+    penetration_lut[2020] = 0
+    assert inputs.get_penetration('S1_10_5_1') == {2020: 50, 2021: 60}
+
+    core_lut = inputs.get_core_lut()
+    core_lut['core_edge']['MWI.1_1_new'] = 0
+    del core_lut['core_node']
+
+    assert inputs.get_core_lut() == {
+        'core_edge': {'MWI.1_1_new': 1000},
+        'core_node': {'MWI.1_1_new': 2},
+    }
+
+    smartphone_lut = inputs.get_smartphone_lut()
+    assert smartphone_lut['MWI']['urban']['smartphone'] == 0.5
+
+    smartphone_lut['MWI']['urban'] = {'smartphone': 0}
+    del smartphone_lut['MWI']['rural']
+
+    assert inputs.get_smartphone_lut()['MWI'] == {
+        'urban': {'basic': 0.2, 'feature': 0.3, 'smartphone': 0.5},
+        'rural': {'basic': 0.4, 'feature': 0.4, 'smartphone': 0.2},
+    }
+
+
+def test_demand_cache(setup_country_inputs, setup_global_parameters,
+    setup_country_parameters):
+
+    inputs = setup_country_inputs
+
+    cache = run.DemandCache()
+
+    def get(option):
+        return cache.get(inputs, option, setup_global_parameters,
+            setup_country_parameters, [2020, 2021],
+            inputs.get_penetration(option['scenario']))
+
+    option = {
+        'scenario': 'S1_50_5_1',
+        'strategy': '4G_epc_microwave_baseline_baseline_baseline_baseline_baseline',
+    }
+
+    first = get(option)
+    expected = copy.deepcopy(first)
+
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    #changes to one handout are not seen by the next
+    first[0]['demand_mbps_km2'] = 0
+    first.pop()
+
+    answer = get(dict(option,
+        strategy='4G_epc_fiber_baseline_baseline_baseline_baseline_baseline'))
+
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert answer == expected
+
+    #scenarios with the same penetration forecast but a different per user
+    #capacity are estimated separately
+    answer = get(dict(option, scenario='S1_25_5_1'))
+
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert answer[0]['demand_mbps_km2'] < expected[0]['demand_mbps_km2']
+    assert answer[1]['demand_mbps_km2'] == expected[1]['demand_mbps_km2']
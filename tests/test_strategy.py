@@ -0,0 +1,52 @@
+import pytest
+from podis.strategy import (Strategy, Scenario, parse_strategy,
+    parse_scenario)
+
+
+def test_parse_strategy():
+
+    answer = parse_strategy(
+        '4G_epc_microwave_pss_srn_high_low_integration')
+
+    assert answer.generation == '4G'
+    assert answer.core == 'epc'
+    assert answer.backhaul == 'microwave'
+    assert answer.sharing == 'pss'
+    assert answer.networks == 'srn'
+    assert answer.spectrum == 'high'
+    assert answer.tax == 'low'
+    assert answer.integration == 'integration'
+
+    #strategies are interned and can be passed in place of the string
+    assert parse_strategy(
+        '4G_epc_microwave_pss_srn_high_low_integration') is answer
+    assert parse_strategy(answer) is answer
+    assert answer == '4G_epc_microwave_pss_srn_high_low_integration'
+    assert str(answer) == '4G_epc_microwave_pss_srn_high_low_integration'
+
+    #components missing from shorter strings are None
+    answer = parse_strategy('3G_epc_fiber_baseline_baseline_baseline')
+
+    assert answer.spectrum == 'baseline'
+    assert answer.tax is None
+    assert answer.integration is None
+
+    with pytest.raises(AttributeError):
+        answer.unknown = 1
+
+
+def test_parse_scenario():
+
+    answer = parse_scenario('low_25_5_1')
+
+    assert answer.label == 'low'
+    assert answer.urban == 25
+    assert answer.suburban == 5
+    assert answer.rural == 1
+
+    assert parse_scenario('low_25_5_1') is answer
+    assert parse_scenario(answer) is answer
+    assert answer == 'low_25_5_1'
+    assert {answer: 1}['low_25_5_1'] == 1
+    assert isinstance(answer, Scenario)
+    assert not isinstance(answer, Strategy)
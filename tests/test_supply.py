@@ -1,7 +1,11 @@
 import pytest
+import numpy as np
+import podis.supply
 from podis.demand import estimate_demand
-from podis.supply import (estimate_supply, find_site_density,
-    estimate_site_upgrades, estimate_backhaul_upgrades)
+from podis.supply import (estimate_supply, size_network, price_network,
+    find_site_density, find_site_densities, resolve_site_density,
+    solve_site_densities, estimate_supply_rollout,
+    CapacityCurves, estimate_site_upgrades, estimate_backhaul_upgrades)
 
 
 def test_find_site_density(
@@ -62,6 +66,101 @@ def test_find_site_density(
     assert answer == 0.02
 
 
+def test_find_site_densities(
+    setup_option,
+    setup_country_parameters,
+    setup_lookup,
+    setup_ci
+    ):
+
+    curves = CapacityCurves(setup_lookup)
+
+    regions = [
+        {'demand_mbps_km2': 100000, 'geotype': 'urban'},
+        {'demand_mbps_km2': 0.005, 'geotype': 'urban'},
+        {'demand_mbps_km2': 250, 'geotype': 'urban 1'},
+        {'demand_mbps_km2': 120, 'geotype': 'urban'},
+    ]
+
+    answer = find_site_densities(regions, setup_option,
+        setup_country_parameters, setup_lookup, setup_ci, curves)
+
+    assert answer == [2, 0.01, 0.05, 0.02]
+
+    #one curve per geotype, summed across 800 and 1800 MHz
+    assert len(curves.curves) == 1
+
+    densities, capacities = curves.get('urban', '4G', setup_ci,
+        setup_country_parameters['frequencies']['4G'])
+
+    assert list(densities) == [0.01, 0.02, 0.05, 0.15, 2]
+    assert list(capacities) == [60, 120, 250, 550, 11000]
+
+    #demand equal to the capacity of the densest network
+    assert find_site_densities([{'demand_mbps_km2': 11000, 'geotype': 'urban'}],
+        setup_option, setup_country_parameters, setup_lookup, setup_ci,
+        curves) == [2]
+
+    with pytest.raises(ValueError):
+        find_site_densities(regions, setup_option, setup_country_parameters,
+            dict(setup_lookup), setup_ci, curves)
+
+
+def test_solve_site_densities(
+    setup_option,
+    setup_country_parameters,
+    setup_lookup,
+    ):
+
+    lookup = dict(setup_lookup)
+    for key, value in setup_lookup.items():
+        #a 95% ci with double the capacity
+        lookup[key[:4] + ('95',)] = [(d, c * 2) for d, c in value]
+    for key, value in list(lookup.items()):
+        lookup[('rural',) + key[1:]] = value
+
+    frequencies = setup_country_parameters['frequencies']['4G']
+
+    #two scenarios by three regions, the last of which is rural
+    demand = [
+        [250, 120, 250],
+        [100000, 0.005, 500],
+    ]
+    geotype = [0, 0, 2]
+
+    answer = solve_site_densities(demand, geotype, '4G', frequencies,
+        lookup, [50, 95])
+
+    assert answer.shape == (2, 2, 3)
+
+    for i, ci in enumerate([50, 95]):
+        for j in range(2):
+            regions = [{'demand_mbps_km2': demand[j][k],
+                'geotype': ['urban', 'suburban', 'rural'][geotype[k]]}
+                for k in range(3)]
+            assert answer[i, j].tolist() == find_site_densities(regions,
+                setup_option, setup_country_parameters, lookup, ci)
+
+    assert answer[0, 0].tolist() == [0.05, 0.02, 0.05]
+    assert answer[1, 0, 1] == 0.01
+
+
+def test_resolve_site_density():
+
+    densities = np.array([1, 2, 3], dtype=float)
+
+    answer = resolve_site_density(densities,
+        np.array([10, 20, 40], dtype=float), [5, 10, 15, 30, 40, 50])
+
+    assert list(answer) == [1, 1, 1.5, 2.5, 3, 3]
+
+    #capacity falling with density takes the first segment meeting demand
+    answer = resolve_site_density(densities,
+        np.array([10, 30, 20], dtype=float), [18, 15, 25])
+
+    assert list(answer) == [1.4, 1.25, 3]
+
+
 def test_estimate_site_upgrades(
     setup_region,
     setup_option,
@@ -198,6 +297,196 @@ def test_estimate_supply(
     assert round(answer[0]['site_density'], 1) == 0.9
 
 
+def test_size_and_price_network(
+    setup_region,
+    setup_lookup,
+    setup_option,
+    setup_global_parameters,
+    setup_country_parameters,
+    setup_costs,
+    setup_core_lut,
+    setup_ci
+    ):
+
+    setup_region[0]['sites_estimated_total'] = 100
+    setup_region[0]['sites_4G'] = 0
+    setup_region[0]['backhaul_fiber'] = 0
+    setup_region[0]['backhaul_copper'] = 0
+    setup_region[0]['backhaul_microwave'] = 0
+    setup_region[0]['backhaul_satellite'] = 0
+
+    expected = estimate_supply('MWI',
+        [dict(setup_region[0])],
+        setup_lookup,
+        setup_option,
+        setup_global_parameters,
+        setup_country_parameters,
+        setup_costs,
+        setup_core_lut,
+        setup_ci
+    )
+
+    sized = size_network(
+        [dict(setup_region[0])],
+        setup_lookup,
+        setup_option,
+        setup_country_parameters,
+        setup_ci
+    )
+
+    assert 'network_cost' not in sized[0]
+    assert sized[0]['site_density'] == expected[0]['site_density']
+    assert sized[0]['new_sites'] == expected[0]['new_sites']
+
+    #sizing can be re-priced under different unit costs
+    answer = price_network(
+        [dict(sized[0])],
+        setup_option,
+        setup_global_parameters,
+        setup_country_parameters,
+        setup_costs,
+        setup_core_lut,
+    )
+
+    assert answer[0] == expected[0]
+
+    costs = dict(setup_costs)
+    costs['single_sector_antenna'] = setup_costs['single_sector_antenna'] * 2
+
+    answer = price_network(
+        [dict(sized[0])],
+        setup_option,
+        setup_global_parameters,
+        setup_country_parameters,
+        costs,
+        setup_core_lut,
+    )
+
+    assert answer[0]['network_cost'] > expected[0]['network_cost']
+
+
+def test_estimate_supply_rollout(
+    setup_region,
+    setup_lookup,
+    setup_option,
+    setup_global_parameters,
+    setup_country_parameters,
+    setup_costs,
+    setup_core_lut,
+    setup_ci,
+    monkeypatch
+    ):
+
+    setup_region[0]['sites_estimated_total'] = 10
+    setup_region[0]['sites_4G'] = 0
+    setup_region[0]['backhaul_fiber'] = 0
+    setup_region[0]['backhaul_copper'] = 0
+    setup_region[0]['backhaul_microwave'] = 0
+    setup_region[0]['backhaul_satellite'] = 0
+
+    #a single timestep matches the single-shot model
+    expected = estimate_supply('MWI',
+        [dict(setup_region[0])],
+        setup_lookup,
+        setup_option,
+        setup_global_parameters,
+        setup_country_parameters,
+        setup_costs,
+        setup_core_lut,
+        setup_ci
+    )
+
+    answer = estimate_supply_rollout(
+        [dict(setup_region[0])],
+        [[setup_region[0]['demand_mbps_km2']]],
+        setup_lookup,
+        setup_option,
+        setup_global_parameters,
+        setup_country_parameters,
+        setup_costs,
+        setup_core_lut,
+        setup_ci,
+        [2020],
+    )
+
+    for key in ['site_density', 'new_sites', 'upgraded_sites',
+        'backhaul_new', 'network_cost']:
+        assert answer[0][key] == expected[0][key]
+
+    #demand falling in the final year does not remove sites
+    answer = estimate_supply_rollout(
+        [dict(setup_region[0])],
+        [[100, 5000, 250]],
+        setup_lookup,
+        setup_option,
+        setup_global_parameters,
+        setup_country_parameters,
+        setup_costs,
+        setup_core_lut,
+        setup_ci,
+        [2020, 2021, 2022],
+    )
+
+    assert answer[0]['new_sites'] == expected[0]['new_sites']
+
+    #the site density is the final timestep's, not the largest
+    assert answer[0]['site_density'] == 0.05
+
+    #later sites are discounted
+    assert answer[0]['network_cost'] < expected[0]['network_cost']
+
+    #undiscounted, the increments add up to the cost of the final network
+    global_parameters = dict(setup_global_parameters, discount_rate=0)
+
+    expected = estimate_supply('MWI',
+        [dict(setup_region[0])],
+        setup_lookup,
+        setup_option,
+        global_parameters,
+        setup_country_parameters,
+        setup_costs,
+        setup_core_lut,
+        setup_ci
+    )
+
+    answer = estimate_supply_rollout(
+        [dict(setup_region[0])],
+        [[100, 5000, 250]],
+        setup_lookup,
+        setup_option,
+        global_parameters,
+        setup_country_parameters,
+        setup_costs,
+        setup_core_lut,
+        setup_ci,
+        [2020, 2021, 2022],
+    )
+
+    assert answer[0]['network_cost'] == pytest.approx(expected[0]['network_cost'])
+
+    #a cost which falls between timesteps is netted off, not clamped at zero
+    def find_network_costs(columns, *args):
+        return {'network_cost': np.array([100., 60., 90.])}
+
+    monkeypatch.setattr(podis.supply, 'find_network_costs', find_network_costs)
+
+    answer = estimate_supply_rollout(
+        [dict(setup_region[0])],
+        [[100, 5000, 250]],
+        setup_lookup,
+        setup_option,
+        setup_global_parameters,
+        setup_country_parameters,
+        setup_costs,
+        setup_core_lut,
+        setup_ci,
+        [2020, 2021, 2022],
+    )
+
+    assert answer[0]['network_cost'] == pytest.approx(
+        100 - 40 / 1.05 + 30 / 1.05 ** 2)
+
+
 def test_estimate_backhaul_upgrades(
     setup_region,
     ):